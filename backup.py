@@ -1,21 +1,74 @@
+import argparse
 import os
-import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.progress import track
+from utils.archive import EXTENSIONS, INDEX_SUFFIX, create_archive, default_codec, extract_member
+from utils.chunkstore import ChunkRepository
+from utils.copy_engine import COPY_WORKERS, copy_tree, walk_tree
+from utils.exclude import PathMatcher, ScanCache
+from utils.manifest import (
+    VERIFY_WORKERS,
+    default_algorithm,
+    manifest_path,
+    read_manifest,
+    verify_snapshot,
+    write_manifest,
+)
+from utils.retention import leftover_deletions, remove_snapshot_tree, select_expired
+from utils.journal import CopyJournal
+from utils.snapshots import (
+    JOURNAL_SUFFIX,
+    PARTIAL_SUFFIX,
+    TIMESTAMP_FORMAT,
+    latest_snapshot,
+    list_snapshots,
+    parse_snapshot_time,
+    partial_snapshots,
+    snapshot_name,
+)
+from utils.version_index import VersionIndex, parse_as_of
 
 # Define multiple source folders and their corresponding backup destinations
+# "mode" is one of:
+#   "full"        - plain copy of the tree (the default)
+#   "incremental" - unchanged files are hard-linked from the previous snapshot, so a run only costs the changed bytes
+#   "repository"  - files are split into content-defined chunks and deduplicated in a chunk repository
+#                   at config["repository"] (default: <destination>/chunk-repository)
+#   "archive"     - the tree is streamed into one tar archive compressed in parallel blocks with
+#                   config["codec"] ("gzip", "lzma" or "zstd"; default zstd if installed, else gzip)
+# "full" and "incremental" copy files on a pool of config["workers"] threads (default: 8);
+# "archive" compresses, and "repository" chunks, on config["workers"] processes (default: one per CPU)
+# "full" and "incremental" snapshots are written as "<name>.partial" with a per-file journal and renamed when
+# complete; an interrupted run is resumed by the next one, which skips the files already copied
+# "full" and "incremental" snapshots get a hash manifest for `backup.py verify` unless config["manifest"] is
+# False; hashing happens during the copy, but disables the kernel copy fast paths
+# config["exclude"] adds gitignore-style rules for that source only (see exclude_patterns below)
+# config["scan_cache"] (True, or a file path) keeps a cache of directory listings between runs, so directories
+# that did not change are not listed and matched again (default path: <destination>/.scan-cache/<source>.json.gz)
+# config["retention"] keeps the newest snapshot of each of the last N "hourly", "daily", "weekly" and "monthly"
+# periods and deletes the rest in the background after the source is backed up (see `backup.py prune`);
+# chunk repositories reclaim the space of deleted snapshots once, after the last backup of the run.
+# Retention deletes history without asking, so it is off unless a config opts in: add
+# "retention": default_retention to a config, then run `backup.py prune --dry-run` to see what would go.
+
+default_retention = {"hourly": 24, "daily": 7, "weekly": 4, "monthly": 12}
+
 backup_configs = [
     {
         "source": "/Users/janduplessis/code/janduplessis883",
-        "destination": "/Volumes/JanBackupHD/AUTO-BACKUPS"
+        "destination": "/Volumes/JanBackupHD/AUTO-BACKUPS",
+        "mode": "incremental",
     },
     # Add more backup configurations here
     {
         "source": "/Users/janduplessis/Documents",
-        "destination": "/Volumes/JanBackupHD/AUTO-BACKUPS"
+        "destination": "/Volumes/JanBackupHD/AUTO-BACKUPS",
+        "mode": "incremental",
     },
     # {
     #     "source": "/Users/janduplessis/Desktop",
@@ -42,98 +95,680 @@ skip_items = {
     ".python-version",
     }
 
-def should_skip(path, names):
-    """Function to determine which files/folders to skip"""
-    return [name for name in names if name in skip_items]
+# gitignore-style rules applied to every source, after skip_items:
+#   "*.log" (a name anywhere), "data/raw/**" (a path from the source root), "build/" (directories only),
+#   "!keep.log" (re-include something an earlier rule excluded)
+exclude_patterns = [
+]
+
+# Local index of every file version in the "full" and "incremental" snapshots, used by `versions` and
+# `restore-file`; it is updated after each backup and can be rebuilt from the snapshots with `index`
+version_index_path = os.path.expanduser("~/.backup_versions.sqlite")
+
+
+def build_matcher(config):
+    """Compiles skip_items, exclude_patterns and the config's own "exclude" rules into one PathMatcher."""
+    return PathMatcher(sorted(skip_items) + exclude_patterns + config.get("exclude", []))
+
+
+def scan_cache_path(config):
+    """Returns the scan cache file for a config, or None if the config does not use one."""
+    setting = config.get("scan_cache")
+    if not setting:
+        return None
+    if isinstance(setting, str):
+        return setting
+    source_name = os.path.basename(config["source"].rstrip('/'))
+    return os.path.join(config["destination"], ".scan-cache", f"{source_name}.json.gz")
 
 # Initialize Rich console
 console = Console()
 
-# Create a single timestamp for all backups
-timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-# Display startup information with Rich
-console.print(Panel.fit(
-    f"[bold cyan]🔄 Email Automation Toolkit - Backup System[/bold cyan]\n"
-    f"[yellow]Started at: {timestamp}[/yellow]",
-    title="Backup Process",
-    border_style="blue"
-))
-
-# Display skip items in a table
-skip_table = Table(title="Files/Folders to Skip", show_header=False)
-skip_table.add_column("Item", style="red")
-for item in sorted(skip_items):
-    skip_table.add_row(f"🚫 {item}")
-console.print(skip_table)
-console.print()
-
-# Create backup summary table
-summary_table = Table(title="Backup Summary")
-summary_table.add_column("#", style="cyan", width=3)
-summary_table.add_column("Source", style="magenta")
-summary_table.add_column("Status", justify="center")
-summary_table.add_column("Details", style="dim")
-
-# Validate backup configurations before starting
-console.print("[bold yellow]🔍 Validating backup configurations...[/bold yellow]")
-for i, config in enumerate(backup_configs, 1):
-    source = config["source"]
-    if not os.path.exists(source):
-        console.print(f"[bold red]❌ Warning:[/bold red] Source folder {source} does not exist")
-    elif not os.access(source, os.R_OK):
-        console.print(f"[bold red]❌ Warning:[/bold red] No read permission for {source}")
-    else:
-        console.print(f"[green]✅[/green] Source {i}: {source}")
-
-console.print()
-
-# Process each backup configuration
-for i, config in enumerate(track(backup_configs, description="Processing backups..."), 1):
+
+def repository_path(config):
+    """Returns the chunk repository path used by a "repository" mode config."""
+    return config.get("repository", os.path.join(config["destination"], "chunk-repository"))
+
+
+def backup_source(config, timestamp):
+    """Backs up one configured source and returns the details shown in the summary table."""
     source_folder = config["source"]
     backup_folder = config["destination"]
 
     # Create timestamped backup path with source folder name for uniqueness
     source_name = os.path.basename(source_folder.rstrip('/'))
-    backup_path = os.path.join(backup_folder, f"{source_name}_backup_{timestamp}")
+    backup_path = os.path.join(backup_folder, snapshot_name(source_name, timestamp))
+
+    # Ensure the parent backup folder exists
+    os.makedirs(backup_folder, exist_ok=True)
+
+    matcher = build_matcher(config)
+    cache_path = scan_cache_path(config)
+    scan_cache = ScanCache(cache_path, key=matcher.key) if cache_path else None
+    details = _backup_source(config, source_folder, source_name, backup_path, timestamp, matcher, scan_cache)
+    if scan_cache is not None:
+        scan_cache.save()
+        details += f" (scan cache: {scan_cache.hits} dirs reused, {scan_cache.misses} listed)"
+    return details
+
+
+def _backup_source(config, source_folder, source_name, backup_path, timestamp, matcher, scan_cache):
+    """Runs the backup for one source in its configured mode."""
+    backup_folder = config["destination"]
+    mode = config.get("mode", "full")
+
+    if mode == "repository":
+        repository = ChunkRepository(repository_path(config))
+        console.print(f"[dim]→ Repository: {repository.path}[/dim]")
+        try:
+            with console.status(f"[bold green]Chunking files from {os.path.basename(source_folder)}..."):
+                stats = repository.backup(
+                    source_folder,
+                    snapshot_name(source_name, timestamp),
+                    exclude=matcher,
+                    scan_cache=scan_cache,
+                    workers=config.get("workers"),
+                )
+        finally:
+            repository.close()
+        dedup = "∞" if stats["dedup_ratio"] == float("inf") else f"{stats['dedup_ratio']}x"
+        return (
+            f"{snapshot_name(source_name, timestamp)} ({stats['files']} files, "
+            f"{stats['new_bytes'] / (1024 * 1024):.1f} MB new, dedup {dedup}, {stats['mb_per_sec']} MB/s)"
+        )
+
+    if mode == "archive":
+        codec = config.get("codec") or default_codec()
+        archive_path = backup_path + EXTENSIONS[codec]
+        console.print(f"[dim]→ Archive: {archive_path}[/dim]")
+        with console.status(f"[bold green]Compressing files from {os.path.basename(source_folder)}..."):
+            stats = create_archive(
+                source_folder,
+                archive_path,
+                codec=codec,
+                workers=config.get("workers"),
+                exclude=matcher,
+                scan_cache=scan_cache,
+            )
+        return (
+            f"{archive_path} ({stats['files']} files, {stats['bytes_out'] / (1024 * 1024):.1f} MB, "
+            f"{stats['ratio']}x smaller, {stats['mb_per_sec']} MB/s)"
+        )
+
+    console.print(f"[dim]→ Destination: {backup_path}[/dim]")
+    if os.path.exists(backup_path):
+        raise FileExistsError(backup_path)
+
+    # Write into "<name>.partial", picking up where an interrupted run stopped
+    partials = partial_snapshots(backup_folder, source_name)
+    for stale in partials[:-1]:
+        remove_snapshot_tree(stale)
+        CopyJournal(stale + JOURNAL_SUFFIX).remove()
+    work_path = partials[-1] if partials else backup_path + PARTIAL_SUFFIX
+    journal = CopyJournal(work_path + JOURNAL_SUFFIX, work_path)
+    if journal.resumed:
+        console.print(f"[dim]→ Resuming interrupted backup: {len(journal.entries)} files already copied[/dim]")
+
+    previous_snapshot = None
+    if mode == "incremental":
+        # Hard-link unchanged files from the previous snapshot, copy the rest
+        previous_snapshot = latest_snapshot(backup_folder, source_name, exclude=backup_path)
+        if previous_snapshot:
+            console.print(f"[dim]→ Linking unchanged files from: {previous_snapshot}[/dim]")
+
+    # Hash files while copying. The previous manifest decides which files are unchanged, and hard-linked
+    # files reuse its hashes when they were made with the same algorithm
+    hash_algorithm = default_algorithm() if config.get("manifest", True) else None
+    previous_hashes = None
+    if previous_snapshot:
+        header, entries = read_manifest(previous_snapshot)
+        if header and header["algorithm"] == hash_algorithm:
+            previous_hashes = entries
+        elif header:
+            previous_hashes = {path: (size, mtime, None) for path, (size, mtime, _) in entries.items()}
+
+    # Copy the tree with a pool of workers, skipping specified items
+    with console.status(f"[bold green]Copying files from {os.path.basename(source_folder)}..."):
+        try:
+            stats = copy_tree(
+                source_folder,
+                work_path,
+                link_dest=previous_snapshot,
+                workers=config.get("workers", COPY_WORKERS),
+                hash_algorithm=hash_algorithm,
+                previous_hashes=previous_hashes,
+                exclude=matcher,
+                scan_cache=scan_cache,
+                journal=journal,
+            )
+        finally:
+            try:
+                journal.checkpoint()
+            except OSError:
+                pass  # the destination may have gone away; the next run redoes the unjournalled files
+    if hash_algorithm:
+        write_manifest(backup_path, stats["manifest"], hash_algorithm, source_folder)
+    # Promote the finished snapshot to its final name
+    os.rename(work_path, backup_path)
+    journal.remove()
+    index_snapshot(source_folder, backup_path, stats["manifest"])
+    linked = f", {stats['linked']} linked" if mode == "incremental" else ""
+    resumed = f", {stats['resumed']} resumed" if stats["resumed"] else ""
+    return (
+        f"{backup_path} ({stats['copied']} copied{linked}{resumed}, {stats['bytes_copied'] / (1024 * 1024):.1f} MB "
+        f"at {stats['mb_per_sec']} MB/s, {stats['files_per_sec']} files/s)"
+    )
+
+
+def index_snapshot(source_folder, snapshot_path, entries):
+    """Adds a directory snapshot to the version index; a failure here does not fail the backup."""
+    name = os.path.basename(snapshot_path)
+    taken = parse_snapshot_time(name).strftime(TIMESTAMP_FORMAT)
+    index = None
+    try:
+        index = VersionIndex(version_index_path)
+        index.add_snapshot(source_folder, name, snapshot_path, taken, entries)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        console.print(f"[bold yellow]⚠️ Not added to the version index:[/bold yellow] {e}")
+    finally:
+        if index is not None:
+            index.close()
+
+
+def _archive_snapshots(backup_folder, source_name):
+    """Returns {archive path: time taken} for the archive backups of a source."""
+    prefix = snapshot_name(source_name, "")
+    archives = {}
+    for name in os.listdir(backup_folder) if os.path.isdir(backup_folder) else []:
+        for extension in EXTENSIONS.values():
+            if name.startswith(prefix) and name.endswith(extension):
+                taken = parse_snapshot_time(name[: -len(extension)])
+                if taken:
+                    archives[os.path.join(backup_folder, name)] = taken
+    return archives
+
+
+def prune_source(config, dry_run=False, collect_garbage=True):
+    """Deletes the snapshots of one source that its retention policy expires.
+
+    In "repository" mode deleted snapshots only free space once their chunks are garbage collected; with
+    `collect_garbage` False that is left to the caller (see collect_repository_garbage).
+
+    Returns:
+        dict: "kept" (count), "expired" (snapshot names) and "bytes_freed".
+    """
+    backup_folder = config["destination"]
+    mode = config.get("mode", "full")
+    source_name = os.path.basename(config["source"].rstrip('/'))
+    result = {"kept": 0, "expired": [], "bytes_freed": 0}
+
+    if mode == "repository":
+        repository = ChunkRepository(repository_path(config))
+        try:
+            times = {
+                snapshot["name"]: parse_snapshot_time(snapshot["name"])
+                for snapshot in repository.list_snapshots()
+                if snapshot["source"] == config["source"] and parse_snapshot_time(snapshot["name"])
+            }
+            kept, expired = select_expired(times, config["retention"])
+            result.update(kept=len(kept), expired=expired)
+            if expired and not dry_run:
+                for name in expired:
+                    repository.delete_snapshot(name)
+                if collect_garbage:
+                    # Chunks still referenced by a kept snapshot, of this or any other source, are never removed
+                    result["bytes_freed"] = repository.collect_garbage()["bytes_freed"]
+        finally:
+            repository.close()
+        return result
+
+    if mode == "archive":
+        times = _archive_snapshots(backup_folder, source_name)
+        kept, expired = select_expired(times, config["retention"])
+        result.update(kept=len(kept), expired=[os.path.basename(path) for path in expired])
+        if not dry_run:
+            for path in expired:
+                for file_path in (path, path + INDEX_SUFFIX):
+                    if os.path.exists(file_path):
+                        result["bytes_freed"] += os.path.getsize(file_path)
+                        os.remove(file_path)
+        return result
+
+    times = {path: parse_snapshot_time(os.path.basename(path)) for path in list_snapshots(backup_folder, source_name)}
+    kept, expired = select_expired(times, config["retention"])
+    result.update(kept=len(kept), expired=[os.path.basename(path) for path in expired])
+    if dry_run:
+        return result
+
+    index = VersionIndex(version_index_path)
+    try:
+        for path in expired:
+            index.remove_snapshot(os.path.basename(path))
+            if os.path.exists(manifest_path(path)):
+                result["bytes_freed"] += os.path.getsize(manifest_path(path))
+                os.remove(manifest_path(path))
+            # Files hard-linked into kept snapshots survive; only their last link frees space
+            result["bytes_freed"] += remove_snapshot_tree(path)["bytes_freed"]
+        for path in leftover_deletions(backup_folder, snapshot_name(source_name, "")):
+            result["bytes_freed"] += remove_snapshot_tree(path)["bytes_freed"]
+    finally:
+        index.close()
+    return result
+
+
+def collect_repository_garbage(path):
+    """Garbage collects a chunk repository and returns the bytes freed."""
+    repository = ChunkRepository(path)
+    try:
+        return repository.collect_garbage()["bytes_freed"]
+    finally:
+        repository.close()
+
+
+def print_prune_results(results):
+    """Prints a table of prune_source results, given as (source name, result or exception) pairs."""
+    table = Table(title="Retention")
+    table.add_column("Source", style="magenta")
+    table.add_column("Kept", justify="right")
+    table.add_column("Deleted", justify="right")
+    table.add_column("Reclaimed", justify="right")
+    table.add_column("Details", style="dim")
+    total = 0
+    for source_name, result in results:
+        if isinstance(result, Exception):
+            table.add_row(source_name, "", "", "", f"[red]❌ {result}[/red]")
+            continue
+        total += result["bytes_freed"]
+        table.add_row(
+            source_name,
+            str(result["kept"]),
+            str(len(result["expired"])),
+            f"{result['bytes_freed'] / (1024 * 1024):.1f} MB",
+            ", ".join(result["expired"]),
+        )
+    console.print(table)
+    console.print(f"[dim]{total / (1024 * 1024):.1f} MB reclaimed[/dim]")
+
+
+def prune_all(configs, dry_run=False):
+    """Applies the retention policy of every config that has one."""
+    results = []
+    for config in configs:
+        if not config.get("retention"):
+            continue
+        source_name = os.path.basename(config["source"].rstrip('/'))
+        with console.status(f"[bold green]Pruning {source_name}..."):
+            try:
+                results.append((source_name, prune_source(config, dry_run=dry_run)))
+            except Exception as e:
+                results.append((source_name, e))
+    if dry_run:
+        console.print("[bold yellow]Dry run: nothing was deleted[/bold yellow]")
+    print_prune_results(results)
+
+
+def run_backups(configs):
+    """Backs up every configured source and prints a summary table."""
+    # Create a single timestamp for all backups
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+
+    # Display startup information with Rich
+    console.print(Panel.fit(
+        f"[bold cyan]🔄 Email Automation Toolkit - Backup System[/bold cyan]\n"
+        f"[yellow]Started at: {timestamp}[/yellow]",
+        title="Backup Process",
+        border_style="blue"
+    ))
+
+    # Display skip items and exclude rules in a table
+    skip_table = Table(title="Files/Folders to Skip", show_header=False)
+    skip_table.add_column("Item", style="red")
+    for item in sorted(skip_items) + exclude_patterns:
+        skip_table.add_row(f"🚫 {item}")
+    console.print(skip_table)
+    console.print()
 
+    # Create backup summary table
+    summary_table = Table(title="Backup Summary")
+    summary_table.add_column("#", style="cyan", width=3)
+    summary_table.add_column("Source", style="magenta")
+    summary_table.add_column("Status", justify="center")
+    summary_table.add_column("Details", style="dim")
+
+    # Validate backup configurations before starting
+    console.print("[bold yellow]🔍 Validating backup configurations...[/bold yellow]")
+    for i, config in enumerate(configs, 1):
+        source = config["source"]
+        if not os.path.exists(source):
+            console.print(f"[bold red]❌ Warning:[/bold red] Source folder {source} does not exist")
+        elif not os.access(source, os.R_OK):
+            console.print(f"[bold red]❌ Warning:[/bold red] No read permission for {source}")
+        else:
+            console.print(f"[green]✅[/green] Source {i}: {source}")
+
+    console.print()
+
+    # Expired snapshots are pruned on a background thread while the next source is backed up. Chunk
+    # repositories are garbage collected once after the last backup instead: collection holds the
+    # repository lock while it rewrites packs, which would stall the next source's backup into it.
+    pruner = ThreadPoolExecutor(max_workers=1)
+    prune_jobs = []
+
+    # Process each backup configuration
+    for i, config in enumerate(track(configs, description="Processing backups..."), 1):
+        source_folder = config["source"]
+        source_name = os.path.basename(source_folder.rstrip('/'))
+
+        try:
+            console.print(f"\n[bold blue]Backup {i}/{len(configs)}:[/bold blue] [cyan]{source_folder}[/cyan]")
+            details = backup_source(config, timestamp)
+
+            console.print(f"[bold green]✅ Backup completed successfully![/bold green]")
+            summary_table.add_row(str(i), source_name, "[green]✅ Success[/green]", details)
+            if config.get("retention"):
+                prune_jobs.append((source_name, config, pruner.submit(prune_source, config, collect_garbage=False)))
+
+        except FileExistsError:
+            error_msg = "Backup destination already exists"
+            console.print(f"[bold red]❌ Error:[/bold red] {error_msg}")
+            summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
+        except PermissionError:
+            error_msg = "Permission denied - check folder access"
+            console.print(f"[bold red]❌ Error:[/bold red] {error_msg}")
+            summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
+        except FileNotFoundError:
+            error_msg = "Source folder not found"
+            console.print(f"[bold red]❌ Error:[/bold red] {error_msg}")
+            summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
+        except Exception as e:
+            error_msg = str(e)
+            console.print(f"[bold red]❌ Backup failed:[/bold red] {error_msg}")
+            summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
+
+    # Display final summary
+    console.print("\n")
+    console.print(summary_table)
+    if prune_jobs:
+        with console.status("[bold green]Finishing snapshot pruning..."):
+            results = []
+            collect = {}  # repository path -> result of the first source that deleted snapshots from it
+            for source_name, config, job in prune_jobs:
+                try:
+                    result = job.result()
+                except Exception as e:
+                    results.append((source_name, e))
+                    continue
+                results.append((source_name, result))
+                if config.get("mode") == "repository" and result["expired"]:
+                    collect.setdefault(repository_path(config), result)
+        for path, result in collect.items():
+            with console.status(f"[bold green]Collecting garbage in {path}..."):
+                try:
+                    result["bytes_freed"] += collect_repository_garbage(path)
+                except Exception as e:
+                    results.append((path, e))
+        print_prune_results(results)
+    pruner.shutdown()
+    console.print(Panel.fit(
+        "[bold green]🎉 All backup operations completed![/bold green]",
+        title="Process Complete",
+        border_style="green"
+    ))
+
+
+def configured_repositories(configs):
+    """Returns the distinct repository paths used by "repository" mode configs."""
+    paths = []
+    for config in configs:
+        if config.get("mode") == "repository" and repository_path(config) not in paths:
+            paths.append(repository_path(config))
+    return paths
+
+
+def list_repository_snapshots(repositories):
+    """Prints the snapshots stored in each repository, with its overall dedup ratio."""
+    for path in repositories:
+        repository = ChunkRepository(path)
+        try:
+            snapshots = repository.list_snapshots()
+            stored = repository.stored_bytes()
+        finally:
+            repository.close()
+
+        table = Table(title=f"Snapshots in {path}")
+        table.add_column("Snapshot", style="cyan")
+        table.add_column("Created", style="magenta")
+        table.add_column("Files", justify="right")
+        table.add_column("Size", justify="right")
+        for snapshot in snapshots:
+            table.add_row(
+                snapshot["name"],
+                snapshot["created"],
+                str(snapshot["files"]),
+                f"{snapshot['bytes'] / (1024 * 1024):.1f} MB",
+            )
+        console.print(table)
+
+        logical = sum(snapshot["bytes"] for snapshot in snapshots)
+        ratio = f"{logical / stored:.1f}x" if stored else "n/a"
+        console.print(f"[dim]{stored / (1024 * 1024):.1f} MB stored for {logical / (1024 * 1024):.1f} MB of snapshots (dedup {ratio})[/dim]")
+
+
+def restore_repository_snapshot(repository, name, target, paths=None):
+    """Restores a repository snapshot (or selected paths of it) into `target`."""
+    repository = ChunkRepository(repository)
+    try:
+        with console.status(f"[bold green]Restoring {name}..."):
+            stats = repository.restore(name, target, paths=paths)
+    finally:
+        repository.close()
+    console.print(
+        f"[bold green]✅ Restored {stats['files']} files "
+        f"({stats['bytes'] / (1024 * 1024):.1f} MB at {stats['mb_per_sec']} MB/s) to {target}[/bold green]"
+    )
+
+
+def verify_snapshots(snapshots, workers=VERIFY_WORKERS, sample=None, seed=None):
+    """Re-hashes snapshots against their manifests and prints any missing or mismatched files.
+
+    Returns:
+        bool: True if every checked file matched.
+    """
+    all_ok = True
+    for snapshot in snapshots:
+        label = "Spot-checking" if sample else "Verifying"
+        with console.status(f"[bold green]{label} {snapshot}..."):
+            report = verify_snapshot(snapshot, workers=workers, sample=sample, seed=seed)
+
+        problems = report["missing"] + report["mismatched"]
+        if problems:
+            all_ok = False
+            table = Table(title=f"Problems in {snapshot}")
+            table.add_column("File", style="magenta")
+            table.add_column("Problem", style="red")
+            for relative_path, reason in problems:
+                table.add_row(relative_path, reason)
+            console.print(table)
+            console.print(
+                f"[bold red]❌ {len(report['missing'])} missing, {len(report['mismatched'])} mismatched "
+                f"of {report['checked']} files checked[/bold red]"
+            )
+        else:
+            console.print(
+                f"[bold green]✅ {snapshot}: {report['checked']} files OK "
+                f"({report['bytes'] / (1024 * 1024):.1f} MB at {report['mb_per_sec']} MB/s)[/bold green]"
+            )
+    return all_ok
+
+
+def configured_snapshots(configs):
+    """Returns the latest directory snapshot of every "full" or "incremental" config."""
+    snapshots = []
+    for config in configs:
+        if config.get("mode", "full") in ("full", "incremental"):
+            source_name = os.path.basename(config["source"].rstrip('/'))
+            snapshot = latest_snapshot(config["destination"], source_name)
+            if snapshot:
+                snapshots.append(snapshot)
+    return snapshots
+
+
+def update_version_index(configs):
+    """Adds every directory snapshot newer than the last indexed one of its source to the version index."""
+    index = VersionIndex(version_index_path)
     try:
-        console.print(f"\n[bold blue]Backup {i}/{len(backup_configs)}:[/bold blue] [cyan]{source_folder}[/cyan]")
-        console.print(f"[dim]→ Destination: {backup_path}[/dim]")
-        
-        # Ensure the parent backup folder exists
-        os.makedirs(backup_folder, exist_ok=True)
-
-        # Copy entire directory tree recursively, skipping specified items
-        # symlinks=False prevents copying broken symlinks that cause errors
-        with console.status(f"[bold green]Copying files from {os.path.basename(source_folder)}..."):
-            shutil.copytree(source_folder, backup_path, ignore=should_skip, symlinks=False)
-
-        console.print(f"[bold green]✅ Backup completed successfully![/bold green]")
-        summary_table.add_row(str(i), source_name, "[green]✅ Success[/green]", backup_path)
-
-    except FileExistsError:
-        error_msg = "Backup destination already exists"
-        console.print(f"[bold red]❌ Error:[/bold red] {error_msg}")
-        summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
-    except PermissionError:
-        error_msg = "Permission denied - check folder access"
-        console.print(f"[bold red]❌ Error:[/bold red] {error_msg}")
-        summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
-    except FileNotFoundError:
-        error_msg = "Source folder not found"
-        console.print(f"[bold red]❌ Error:[/bold red] {error_msg}")
-        summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
-    except Exception as e:
-        error_msg = str(e)
-        console.print(f"[bold red]❌ Backup failed:[/bold red] {error_msg}")
-        summary_table.add_row(str(i), source_name, "[red]❌ Failed[/red]", error_msg)
-
-# Display final summary
-console.print("\n")
-console.print(summary_table)
-console.print(Panel.fit(
-    "[bold green]🎉 All backup operations completed![/bold green]",
-    title="Process Complete",
-    border_style="green"
-))
+        for config in configs:
+            if config.get("mode", "full") not in ("full", "incremental"):
+                continue
+            source_folder = config["source"].rstrip('/')
+            source_name = os.path.basename(source_folder)
+            latest = index.snapshot_as_of(source_folder)
+            added = 0
+            for snapshot in list_snapshots(config["destination"], source_name):
+                name = os.path.basename(snapshot)
+                taken = parse_snapshot_time(name).strftime(TIMESTAMP_FORMAT)
+                if latest and taken <= latest[3]:
+                    continue
+                with console.status(f"[bold green]Indexing {name}..."):
+                    header, manifest = read_manifest(snapshot)
+                    if header is not None:
+                        entries = [[path, *entry] for path, entry in manifest.items()]
+                    else:
+                        entries = []
+                        for relative_path, entry, is_dir in walk_tree(snapshot):
+                            if not is_dir:
+                                entry_stat = entry.stat()
+                                entries.append([relative_path, entry_stat.st_size, entry_stat.st_mtime, None])
+                    index.add_snapshot(source_folder, name, snapshot, taken, entries)
+                added += 1
+            console.print(f"[green]✅[/green] {source_folder}: {added} snapshots added to the index")
+    finally:
+        index.close()
+
+
+def list_versions(path):
+    """Prints every indexed version of a file."""
+    index = VersionIndex(version_index_path)
+    try:
+        versions = index.versions(path)
+    except KeyError as e:
+        console.print(f"[bold red]❌ {e.args[0]}[/bold red]")
+        return
+    finally:
+        index.close()
+    if not versions:
+        console.print(f"[bold red]❌ No versions of {path} in the index[/bold red]")
+        return
+
+    table = Table(title=f"Versions of {path}")
+    table.add_column("First seen", style="cyan")
+    table.add_column("Last seen", style="cyan")
+    table.add_column("Snapshots", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Modified", style="magenta")
+    table.add_column("Copy", style="dim")
+    for version in versions:
+        table.add_row(
+            version["first"],
+            version["last"],
+            str(version["snapshots"]),
+            f"{version['size'] / 1024:.1f} KB",
+            datetime.fromtimestamp(version["mtime"]).strftime("%Y-%m-%d %H:%M:%S"),
+            version["path"],
+        )
+    console.print(table)
+
+
+def restore_version(path, target, as_of=None, workers=COPY_WORKERS):
+    """Restores a file or directory as of a point in time, using the version index."""
+    index = VersionIndex(version_index_path)
+    try:
+        with console.status(f"[bold green]Restoring {path}..."):
+            stats = index.restore(path, target, as_of=parse_as_of(as_of) if as_of else None, workers=workers)
+    except (KeyError, FileNotFoundError, FileExistsError) as e:
+        console.print(f"[bold red]❌ {e.args[0] if isinstance(e, KeyError) else e}[/bold red]")
+        raise SystemExit(1)
+    finally:
+        index.close()
+    console.print(
+        f"[bold green]✅ Restored {stats['files']} files from {stats['snapshot']} "
+        f"({stats['bytes'] / (1024 * 1024):.1f} MB at {stats['mb_per_sec']} MB/s) to {target}[/bold green]"
+    )
+
+
+def extract_archive_member(archive, member, target):
+    """Restores a single member of an archive backup, decompressing only the blocks that hold it."""
+    with console.status(f"[bold green]Extracting {member}..."):
+        path = extract_member(archive, member, target)
+    console.print(f"[bold green]✅ Restored {path}[/bold green]")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up the configured folders.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("backup", help="Back up every configured source (the default)")
+
+    list_parser = subparsers.add_parser("list", help="List snapshots in the chunk repositories")
+    list_parser.add_argument("--repository", help="Repository path (default: every configured repository)")
+
+    restore_parser = subparsers.add_parser("restore", help="Restore a snapshot from a chunk repository")
+    restore_parser.add_argument("snapshot", help="Snapshot name, as shown by 'list'")
+    restore_parser.add_argument("target", help="Directory to restore into")
+    restore_parser.add_argument("--repository", help="Repository path (default: the only configured repository)")
+    restore_parser.add_argument("--path", action="append", dest="paths", help="Restore only this relative path (repeatable)")
+
+    extract_parser = subparsers.add_parser("extract", help="Restore one file from an archive backup")
+    extract_parser.add_argument("archive", help="Archive created by an \"archive\" mode backup")
+    extract_parser.add_argument("member", help="Path of the file inside the archive")
+    extract_parser.add_argument("target", help="Directory to restore into")
+
+    verify_parser = subparsers.add_parser("verify", help="Re-hash snapshots against their manifests")
+    verify_parser.add_argument("snapshot", nargs="*", help="Snapshot directories (default: latest of each source)")
+    verify_parser.add_argument("--sample", type=float, help="Check only this fraction of files, e.g. 0.01")
+    verify_parser.add_argument("--seed", type=int, help="Random seed for --sample")
+    verify_parser.add_argument("--workers", type=int, default=VERIFY_WORKERS, help="Files hashed in parallel")
+
+    subparsers.add_parser("index", help="Add existing snapshots to the version index")
+
+    prune_parser = subparsers.add_parser("prune", help="Delete snapshots expired by the retention policies")
+    prune_parser.add_argument("--dry-run", action="store_true", help="Only show what would be deleted")
+
+    versions_parser = subparsers.add_parser("versions", help="List every backed-up version of a file")
+    versions_parser.add_argument("path", help="Original path of the file")
+
+    restore_file_parser = subparsers.add_parser("restore-file", help="Restore a file or folder as of a date")
+    restore_file_parser.add_argument("path", help="Original path of the file or folder")
+    restore_file_parser.add_argument("target", help="Directory to restore into")
+    restore_file_parser.add_argument("--as-of", help="Date or time, e.g. 2024-05-01 or \"2024-05-01 18:00\" (default: latest)")
+    restore_file_parser.add_argument("--workers", type=int, default=COPY_WORKERS, help="Files copied in parallel")
+
+    args = parser.parse_args(argv)
+
+    if args.command in (None, "backup"):
+        run_backups(backup_configs)
+    elif args.command == "list":
+        list_repository_snapshots([args.repository] if args.repository else configured_repositories(backup_configs))
+    elif args.command == "restore":
+        repositories = [args.repository] if args.repository else configured_repositories(backup_configs)
+        if len(repositories) != 1:
+            parser.error("pass --repository; there is not exactly one configured repository")
+        restore_repository_snapshot(repositories[0], args.snapshot, args.target, paths=args.paths)
+    elif args.command == "extract":
+        extract_archive_member(args.archive, args.member, args.target)
+    elif args.command == "verify":
+        snapshots = args.snapshot or configured_snapshots(backup_configs)
+        if not verify_snapshots(snapshots, workers=args.workers, sample=args.sample, seed=args.seed):
+            raise SystemExit(1)
+    elif args.command == "prune":
+        prune_all(backup_configs, dry_run=args.dry_run)
+    elif args.command == "index":
+        update_version_index(backup_configs)
+    elif args.command == "versions":
+        list_versions(args.path)
+    elif args.command == "restore-file":
+        restore_version(args.path, args.target, as_of=args.as_of, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+import hashlib
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the services the triage scripts talk to, for benchmarks/triage.py. Every fake runs
+# on 127.0.0.1 in a background thread of the calling process:
+#   FakeImapServer  plain-text IMAP4rev1 with just the commands imaplib and gmail_triage use, serving a
+#                   synthetic corpus; X-GM-RAW searches honour is:unread only, X-GM-LABELS stores are kept
+#   FakeOllama      /api/generate answering with a configurable label mix after a configurable delay
+#   FakeNotion      the Notion endpoints NotionHelper uses, with Notion's rate limit (an average of 3
+#                   requests per second, with short bursts allowed) answered by 429 rate_limited errors
+# The corpus and the labels are derived from a seed, so every run sees the same mail and decisions.
+
+ACTION_LABEL = "🅾️ Action Required"
+DEFAULT_LABELS = {ACTION_LABEL: 0.1, "Spam": 0.3, "Low Priority": 0.6}
+
+WORDS = (
+    "invoice meeting project deadline review update report schedule please attached quarterly budget "
+    "team customer account payment reminder order shipping delivery password security newsletter offer "
+    "sale discount agenda notes follow action required confirm approve request feedback draft release"
+).split()
+
+
+def _text(rng, words):
+    lines = []
+    for start in range(0, words, 12):
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(min(12, words - start))))
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_message(index, rng, attachment_ratio=0.05, html_ratio=0.2):
+    """Returns one synthetic RFC 822 message as bytes; body sizes are log-normal around 2KB."""
+    msg = EmailMessage()
+    msg["Subject"] = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))).capitalize()
+    msg["From"] = f"Sender {index % 500} <sender{index % 500}@example.com>"
+    msg["To"] = "me@example.com"
+    sent = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=index * 7)
+    msg["Date"] = format_datetime(sent)
+    msg["Message-ID"] = f"<bench-{index}@example.com>"
+    body = _text(rng, max(5, int(rng.lognormvariate(5.8, 0.9))))
+    msg.set_content(body)
+    if rng.random() < html_ratio:
+        msg.add_alternative("<html><body><p>" + body.replace("\n", "</p><p>") + "</p></body></html>", subtype="html")
+    if rng.random() < attachment_ratio:
+        size = rng.randint(20_000, 200_000)
+        data = rng.randbytes(size)
+        msg.add_attachment(data, maintype="application", subtype="pdf", filename=f"document-{index % 50}.pdf")
+    return msg.as_bytes()
+
+
+def synthetic_corpus(count, seed=0, attachment_ratio=0.05):
+    """Returns `count` synthetic messages, the same ones for the same seed."""
+    rng = random.Random(seed)
+    return [synthetic_message(i, rng, attachment_ratio) for i in range(count)]
+
+
+class _ServerThread:
+    """Runs a socketserver on 127.0.0.1 in a daemon thread; usable as a context manager."""
+
+    def _serve(self, server):
+        self.server = server
+        self.port = server.server_address[1]
+        self.thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# IMAP arguments: quoted strings, parenthesised lists and atoms
+_IMAP_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|\([^)]*\)|\S+')
+
+
+def _message_set(spec, highest):
+    """Expands an IMAP sequence set such as "1:3,7,9:*" into numbers."""
+    numbers = []
+    for part in spec.split(","):
+        first, _, last = part.partition(":")
+        first = highest if first == "*" else int(first)
+        last = first if not last else (highest if last == "*" else int(last))
+        numbers.extend(range(min(first, last), max(first, last) + 1))
+    return numbers
+
+
+class FakeImapServer(_ServerThread):
+    """
+    In-process IMAP server holding one INBOX.
+
+    Methods
+    -------
+    unseen():
+        Returns how many messages are still unread.
+
+    labelled(label):
+        Returns the sequence numbers of the messages carrying a Gmail label.
+    """
+
+    def __init__(self, messages, user="bench@example.com", password="bench"):
+        self.messages = list(messages)
+        self.seen = [False] * len(self.messages)
+        self.labels = [set() for _ in self.messages]
+        self.store_commands = 0
+        self.user = user
+        self.password = password
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            # Responses are buffered and flushed once per command, without Nagle's delay
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                self.wfile.write(b"* OK [CAPABILITY IMAP4rev1] Fake IMAP ready\r\n")
+                while True:
+                    self.wfile.flush()
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    tokens = _IMAP_TOKENS.findall(line.rstrip(b"\r\n"))
+                    if len(tokens) < 2:
+                        self.wfile.write(b"* BAD empty command\r\n")
+                        continue
+                    tag, command, args = tokens[0], tokens[1].upper(), tokens[2:]
+                    if command == b"UID" and args:
+                        command, args, by_uid = args[0].upper(), args[1:], True
+                    else:
+                        by_uid = False
+                    if not fake._dispatch(self.wfile, tag, command, args, by_uid):
+                        return
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._serve(Server(("127.0.0.1", 0), Handler))
+
+    def unseen(self):
+        return self.seen.count(False)
+
+    def labelled(self, label):
+        return [i + 1 for i, labels in enumerate(self.labels) if label in labels]
+
+    def _dispatch(self, out, tag, command, args, by_uid):
+        if command == b"CAPABILITY":
+            out.write(b"* CAPABILITY IMAP4rev1 UIDPLUS X-GM-EXT-1\r\n")
+        elif command == b"LOGIN":
+            user, password = (arg.strip(b'"').decode() for arg in args[:2])
+            if (user, password) != (self.user, self.password):
+                out.write(tag + b" NO [AUTHENTICATIONFAILED] Invalid credentials\r\n")
+                return True
+        elif command in (b"SELECT", b"EXAMINE"):
+            out.write(b"* FLAGS (\\Seen \\Flagged)\r\n")
+            out.write(b"* %d EXISTS\r\n* 0 RECENT\r\n" % len(self.messages))
+            out.write(b"* OK [UIDVALIDITY 1] UIDs valid\r\n")
+            out.write(tag + b" OK [READ-WRITE] SELECT completed\r\n")
+            return True
+        elif command == b"SEARCH":
+            words = [arg.upper() for arg in args]
+            if b"X-GM-RAW" in words:
+                unseen_only = b"IS:UNREAD" in words[words.index(b"X-GM-RAW") + 1].strip(b'"').split()
+            else:
+                unseen_only = b"UNSEEN" in words
+            with self.lock:
+                numbers = [i + 1 for i, seen in enumerate(self.seen) if not (unseen_only and seen)]
+            out.write(b"* SEARCH" + b"".join(b" %d" % n for n in numbers) + b"\r\n")
+        elif command == b"FETCH":
+            items = args[1].upper() if len(args) > 1 else b""
+            for number in _message_set(args[0].decode(), len(self.messages)):
+                if not 1 <= number <= len(self.messages):
+                    continue
+                raw = self.messages[number - 1]
+                # UIDs are simply the sequence numbers: nothing is ever expunged
+                fields = [b"UID %d" % number] if by_uid or b"UID" in items else []
+                if b"RFC822" in items or b"BODY[]" in items:
+                    with self.lock:
+                        if b"PEEK" not in items:
+                            self.seen[number - 1] = True
+                    fields.append(b"RFC822 {%d}\r\n" % len(raw) + raw)
+                else:
+                    fields.append(b"FLAGS (%s)" % (b"\\Seen" if self.seen[number - 1] else b""))
+                out.write(b"* %d FETCH (" % number + b" ".join(fields) + b")\r\n")
+        elif command == b"STORE" and len(args) >= 3 and args[1].upper().lstrip(b"+-").startswith(b"X-GM-LABELS"):
+            labels = {label.strip(b'"').decode() for label in _IMAP_TOKENS.findall(args[2].strip(b"()"))}
+            with self.lock:
+                self.store_commands += 1
+                for number in _message_set(args[0].decode(), len(self.messages)):
+                    if 1 <= number <= len(self.messages):
+                        if args[1].startswith(b"-"):
+                            self.labels[number - 1] -= labels
+                        else:
+                            self.labels[number - 1] |= labels
+                        current = b" ".join(b'"%s"' % label.encode() for label in sorted(self.labels[number - 1]))
+                        out.write(b"* %d FETCH (UID %d X-GM-LABELS (%s))\r\n" % (number, number, current))
+        elif command == b"LOGOUT":
+            out.write(b"* BYE Fake IMAP logging out\r\n" + tag + b" OK LOGOUT completed\r\n")
+            return False
+        elif command != b"NOOP":
+            out.write(tag + b" BAD unsupported command\r\n")
+            return True
+        out.write(tag + b" OK " + command + b" completed\r\n")
+        return True
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    """Base request handler for the HTTP fakes: JSON in, JSON out, no access log."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json(self):
+        body = self._body()
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _HttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class FakeOllama(_ServerThread):
+    """
+    Stand-in for Ollama's /api/generate.
+
+    Each prompt is answered after `latency_ms` (+/- `jitter` as a fraction) with a label drawn from
+    `labels` ({response: weight}). The choice depends only on the prompt and the seed, so a message gets
+    the same label in every run.
+    """
+
+    def __init__(self, latency_ms=50.0, jitter=0.2, labels=None, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        labels = labels or DEFAULT_LABELS
+        self.responses = list(labels)
+        total = sum(labels.values())
+        self.cumulative = []
+        running = 0.0
+        for response in self.responses:
+            running += labels[response] / total
+            self.cumulative.append(running)
+        self.seed = seed
+        self.requests = 0
+        fake = self
+
+        class Handler(_JsonHandler):
+            def do_POST(self):
+                request = self._json()
+                if self.path.rstrip("/") != "/api/generate":
+                    self._send(404, {"error": "not found"})
+                    return
+                fake.requests += 1
+                prompt = request.get("prompt", "")
+                draw = int.from_bytes(hashlib.sha256(f"{fake.seed}:{prompt}".encode()).digest()[:8], "big") / 2**64
+                response = next(
+                    (r for r, bound in zip(fake.responses, fake.cumulative) if draw < bound), fake.responses[-1]
+                )
+                time.sleep(fake.latency * (1 + fake.jitter * (2 * draw - 1)))
+                self._send(200, {
+                    "model": request.get("model"),
+                    "response": response,
+                    "done": True,
+                    "prompt_eval_count": len(prompt) // 4,
+                    "eval_count": len(response) // 4 + 1,
+                })
+
+        self._serve(_HttpServer(("127.0.0.1", 0), Handler))
+
+    @property
+    def url(self):
+        """Value for OLLAMA_API_URL."""
+        return f"http://127.0.0.1:{self.port}"
+
+
+DATABASE_PROPERTIES = {
+    "Subject": {"id": "title", "name": "Subject", "type": "title", "title": {}},
+    "Body": {"id": "b0dy", "name": "Body", "type": "rich_text", "rich_text": {}},
+    "From": {"id": "fr0m", "name": "From", "type": "email", "email": {}},
+    "Date": {"id": "d4te", "name": "Date", "type": "date", "date": {}},
+}
+
+
+def synthetic_page(database_id, index, rng):
+    """Returns a page object for the fake database, shaped like the pages the triage scripts create."""
+    subject = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+    return {
+        "object": "page",
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "created_time": "2024-01-01T00:00:00.000Z",
+        "last_edited_time": "2024-01-01T00:00:00.000Z",
+        "parent": {"type": "database_id", "database_id": database_id},
+        "archived": False,
+        "properties": {
+            "Subject": {"id": "title", "type": "title", "title": [
+                {"type": "text", "text": {"content": subject}, "plain_text": subject}
+            ]},
+            "Body": {"id": "b0dy", "type": "rich_text", "rich_text": [
+                {"type": "text", "text": {"content": subject * 4}, "plain_text": subject * 4}
+            ]},
+            "From": {"id": "fr0m", "type": "email", "email": f"sender{index % 500}@example.com"},
+            "Date": {"id": "d4te", "type": "date", "date": {"start": "2024-01-01T00:00:00+00:00"}},
+        },
+    }
+
+
+class FakeNotion(_ServerThread):
+    """
+    Stand-in for the Notion API, with one database and Notion's request rate limit.
+
+    Requests beyond `rate` per second (after a burst of `burst`) get a 429 rate_limited error with a
+    Retry-After header, like the real API. `rate=0` disables the limit.
+
+    Methods
+    -------
+    seed_pages(count, seed=0):
+        Fills the database with `count` synthetic pages.
+    """
+
+    def __init__(self, database_id="bench-database", rate=3.0, burst=10, latency_ms=0.0):
+        self.database_id = database_id
+        self.rate = rate
+        self.burst = burst
+        self.latency = latency_ms / 1000
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.pages = []
+        self.uploads = {}
+        self.stats = {"requests": 0, "rate_limited": 0, "pages_created": 0, "blocks_appended": 0, "uploads": 0}
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(_JsonHandler):
+            def _route(self, method):
+                body = self._body()
+                with fake.lock:
+                    fake.stats["requests"] += 1
+                    allowed = fake._take_token()
+                    if not allowed:
+                        fake.stats["rate_limited"] += 1
+                if not allowed:
+                    self._send(
+                        429,
+                        {"object": "error", "status": 429, "code": "rate_limited",
+                         "message": "You have been rate limited. Please try again in a few minutes."},
+                        {"Retry-After": "1"},
+                    )
+                    return
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, payload = fake._handle(method, self.path.split("?")[0], body, self.headers)
+                self._send(status, payload)
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+            def do_PATCH(self):
+                self._route("PATCH")
+
+        self._serve(_HttpServer(("127.0.0.1", 0), Handler))
+
+    @property
+    def url(self):
+        """Value for NOTION_BASE_URL."""
+        return f"http://127.0.0.1:{self.port}"
+
+    def seed_pages(self, count, seed=0):
+        rng = random.Random(seed)
+        with self.lock:
+            self.pages.extend(synthetic_page(self.database_id, i, rng) for i in range(count))
+
+    def _take_token(self):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _handle(self, method, path, body, headers):
+        parts = path.strip("/").split("/")[1:]  # drop "v1"
+        if parts[:1] == ["databases"] and len(parts) >= 2:
+            if parts[1] != self.database_id:
+                return 404, {"object": "error", "status": 404, "code": "object_not_found", "message": "Not found"}
+            if len(parts) == 2 and method == "GET":
+                return 200, {
+                    "object": "database",
+                    "id": self.database_id,
+                    "last_edited_time": "2024-01-01T00:00:00.000Z",
+                    "properties": DATABASE_PROPERTIES,
+                }
+            if parts[2:] == ["query"] and method == "POST":
+                query = json.loads(body or b"{}")
+                start = int(query.get("start_cursor") or 0)
+                size = min(int(query.get("page_size") or 100), 100)
+                with self.lock:
+                    results = self.pages[start:start + size]
+                    more = start + size < len(self.pages)
+                return 200, {
+                    "object": "list",
+                    "results": results,
+                    "has_more": more,
+                    "next_cursor": str(start + size) if more else None,
+                }
+        if parts == ["pages"] and method == "POST":
+            request = json.loads(body or b"{}")
+            page = {
+                "object": "page",
+                "id": str(uuid.uuid4()),
+                "parent": request.get("parent"),
+                "properties": request.get("properties", {}),
+                "created_time": datetime.now(timezone.utc).isoformat(),
+                "last_edited_time": datetime.now(timezone.utc).isoformat(),
+            }
+            with self.lock:
+                self.pages.append(page)
+                self.stats["pages_created"] += 1
+                self.stats["blocks_appended"] += len(request.get("children", []))
+            return 200, page
+        if parts[:1] == ["pages"] and method == "PATCH":
+            return 200, {"object": "page", "id": parts[1]}
+        if parts[:1] == ["blocks"] and parts[2:] == ["children"] and method == "PATCH":
+            children = json.loads(body or b"{}").get("children", [])
+            with self.lock:
+                self.stats["blocks_appended"] += len(children)
+            return 200, {"object": "list", "results": children, "has_more": False, "next_cursor": None}
+        if parts == ["file_uploads"] and method == "POST":
+            upload_id = str(uuid.uuid4())
+            with self.lock:
+                self.uploads[upload_id] = 0
+            return 200, {
+                "object": "file_upload",
+                "id": upload_id,
+                "status": "pending",
+                "upload_url": f"{self.url}/v1/file_uploads/{upload_id}/send",
+            }
+        if parts[:1] == ["file_uploads"] and len(parts) == 3 and method == "POST":
+            upload_id = parts[1]
+            if upload_id not in self.uploads:
+                return 404, {"object": "error", "status": 404, "code": "object_not_found", "message": "Not found"}
+            with self.lock:
+                self.uploads[upload_id] += len(body)
+                if parts[2] == "send":
+                    self.stats["uploads"] += 1
+            status = "uploaded" if parts[2] in ("send", "complete") else "pending"
+            return 200, {"object": "file_upload", "id": upload_id, "status": status}
+        return 400, {"object": "error", "status": 400, "code": "invalid_request_url", "message": f"{method} {path}"}
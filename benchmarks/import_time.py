@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures the startup cost of each entry point: wall-clock time of a fresh interpreter that only imports
+# the module, and the cumulative import time reported by `python -X importtime`, with the slowest imports
+# it pulls in. Run from anywhere:
+#   python benchmarks/import_time.py [--runs 10] [--json]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["cli", "gmail_triage", "icloud_triage", "backup", "password", "utils.notionhelper"]
+
+
+def _run(code, importtime=False):
+    """Runs `code` in a fresh interpreter in the repository root; returns (seconds, stderr)."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return seconds, result.stderr
+
+
+def _parse_importtime(stderr):
+    """Returns [(cumulative microseconds, module, nesting depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.rstrip()[1:]  # one separator space, then two spaces per nesting level
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), name.strip(), depth))
+    return rows
+
+
+def measure(module, runs):
+    """Returns the startup report for one module."""
+    baseline = statistics.median(_run("pass")[0] for _ in range(runs))
+    wall = statistics.median(_run(f"import {module}")[0] for _ in range(runs))
+    rows = _parse_importtime(_run(f"import {module}", importtime=True)[1])
+    # importtime lists a module after everything it imported; earlier top-level rows are interpreter startup
+    end = max(i for i, row in enumerate(rows) if row[1] == module and row[2] == 0)
+    start = max((i for i, row in enumerate(rows[:end]) if row[2] == 0), default=-1) + 1
+    total = rows[end][0]
+    # The module's direct imports are the ones worth making lazy
+    heaviest = sorted(((us, name) for us, name, depth in rows[start:end] if depth == 1), reverse=True)
+    return {
+        "module": module,
+        "wall_ms": round(wall * 1000, 1),
+        "over_bare_interpreter_ms": round((wall - baseline) * 1000, 1),
+        "import_ms": round(total / 1000, 1),
+        "heaviest": [[name, round(us / 1000, 1)] for us, name in heaviest[:5]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of each entry point.")
+    parser.add_argument("modules", nargs="*", default=MODULES, help="Modules to measure (default: all entry points)")
+    parser.add_argument("--runs", type=int, default=10, help="Interpreter starts per module; the median is reported")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for module in args.modules:
+        try:
+            results.append(measure(module, args.runs))
+        except RuntimeError as e:
+            results.append({"module": module, "error": str(e)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'module':<22}{'wall ms':>10}{'+ over bare':>13}{'import ms':>11}  slowest imports")
+    for result in results:
+        if "error" in result:
+            print(f"{result['module']:<22}  failed: {result['error']}")
+            continue
+        heaviest = ", ".join(f"{name} {ms}" for name, ms in result["heaviest"][:3])
+        print(
+            f"{result['module']:<22}{result['wall_ms']:>10}{result['over_bare_interpreter_ms']:>13}"
+            f"{result['import_ms']:>11}  {heaviest}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fakes import FakeImapServer, FakeNotion, FakeOllama, synthetic_corpus  # noqa: E402
+
+# Throughput benchmarks for the triage pipeline and NotionHelper against the local fakes in fakes.py, so
+# runs are reproducible and need no accounts or network. Run from anywhere:
+#   python benchmarks/triage.py [scenario ...] [--ollama-latency 10] [--notion-rate 3] [--json]
+#
+# The fakes run in this process; every scenario runs in a fresh child process, so the peak RSS reported
+# is that of the code under test alone. Stage latencies come from the child's utils.tracing report.
+#
+# Triage scenarios enforce Notion's rate limit of 3 requests per second. NotionHelper retries
+# rate-limited requests after their Retry-After delay, so these measure throughput under the limit. Action
+# items that still fail (notion_errors) or lose attachments are reported, and fail the run: msgs/s means
+# nothing if items were dropped. The large-database scenarios measure how fast pages are read back and run
+# without the limit unless --notion-rate is given; `notion_requests` / 3 is the least time they would take
+# against the real API.
+
+SCENARIOS = {
+    "triage-100": {"kind": "triage", "messages": 100},
+    "triage-1k": {"kind": "triage", "messages": 1_000},
+    "triage-10k": {"kind": "triage", "messages": 10_000},
+    "backfill-10k": {"kind": "backfill", "messages": 10_000},
+    "notion-db-10k": {"kind": "notion_db", "pages": 10_000},
+    "notion-db-100k": {"kind": "notion_db", "pages": 100_000},
+}
+DEFAULT_SCENARIOS = ["triage-100", "triage-1k", "backfill-10k", "notion-db-10k"]
+DATABASE_ID = "bench-database"
+USER, PASSWORD = "bench@example.com", "bench"
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024, 1)  # KB on Linux, bytes on macOS
+
+
+def _stage_latencies(report):
+    return {
+        stage: {"p50_ms": values["p50_ms"], "p99_ms": values["p99_ms"], "calls": values["count"]}
+        for stage, values in report["stages"].items()
+    }
+
+
+def _run_triage_child(spec):
+    """Child: runs one triage or backfill pass and returns its measurements."""
+    import gmail_triage
+    from utils import tracing
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # the action_log/ directory and attachment spill files stay out of the repository
+        with tracing.traced_run("bench") as run:
+            if spec["kind"] == "triage":
+                gmail_triage.triage_emails(
+                    USER, PASSWORD, notion_token="bench", database_id=DATABASE_ID,
+                    server=f"127.0.0.1:{spec['imap_port']}", use_ssl=False,
+                )
+            else:
+                gmail_triage.backfill_emails([spec["mbox"]], notion_token="bench", database_id=DATABASE_ID)
+        report = run.report()
+    messages = report["counters"].get("messages", 0)
+    return {
+        "messages": messages,
+        "seconds": report["duration_s"],
+        "messages_per_s": round(messages / report["duration_s"], 1) if report["duration_s"] else None,
+        "latency": _stage_latencies(report),
+        "counters": report["counters"],
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_notion_db_child(spec):
+    """Child: reads every page of a large database back and loads it into a DataFrame."""
+    from utils.notionhelper import NotionHelper
+
+    helper = NotionHelper("bench")
+    started = time.perf_counter()
+    request_latencies = []
+    pages = []
+    last = time.perf_counter()
+    for page in helper.iter_pages(DATABASE_ID):
+        pages.append(page)
+        if len(pages) % 100 == 0:  # one query response holds 100 pages
+            now = time.perf_counter()
+            request_latencies.append(now - last)
+            last = now
+    read_seconds = time.perf_counter() - started
+    try:
+        frame = helper.pages_to_dataframe([page["properties"] for page in pages])
+        frame_seconds = round(time.perf_counter() - started - read_seconds, 3)
+        rows = len(frame)
+    except ImportError:
+        frame_seconds, rows = None, None  # pandas is not installed
+    request_latencies.sort()
+
+    def percentile(p):
+        index = min(len(request_latencies) - 1, max(0, math.ceil(p / 100 * len(request_latencies)) - 1))
+        return round(request_latencies[index] * 1000, 3)
+
+    return {
+        "pages": len(pages),
+        "seconds": round(read_seconds, 3),
+        "pages_per_s": round(len(pages) / read_seconds, 1) if read_seconds else None,
+        "latency": {"query": {"p50_ms": percentile(50), "p99_ms": percentile(99), "calls": len(request_latencies)}}
+        if request_latencies else {},
+        "dataframe_seconds": frame_seconds,
+        "dataframe_rows": rows,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_child(spec_json, output_path):
+    spec = json.loads(spec_json)
+    result = _run_notion_db_child(spec) if spec["kind"] == "notion_db" else _run_triage_child(spec)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_scenario(name, ollama_latency, notion_rate, seed):
+    """Starts the fakes for one scenario, runs it in a child process and returns the combined result."""
+    scenario = SCENARIOS[name]
+    spec = {"kind": scenario["kind"]}
+    rate = notion_rate if notion_rate is not None else (0 if scenario["kind"] == "notion_db" else 3.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "result.json")
+        with FakeNotion(DATABASE_ID, rate=rate) as notion, FakeOllama(latency_ms=ollama_latency, seed=seed) as ollama:
+            imap = None
+            if scenario["kind"] == "notion_db":
+                notion.seed_pages(scenario["pages"], seed=seed)
+            else:
+                corpus = synthetic_corpus(scenario["messages"], seed=seed)
+                if scenario["kind"] == "triage":
+                    imap = FakeImapServer(corpus, USER, PASSWORD)
+                    spec["imap_port"] = imap.port
+                else:
+                    spec["mbox"] = os.path.join(tmp, "corpus.mbox")
+                    with open(spec["mbox"], "wb") as f:
+                        for raw in corpus:
+                            f.write(b"From bench@example.com Mon Jan  1 00:00:00 2024\n")
+                            f.write(raw.replace(b"\nFrom ", b"\n>From ").replace(b"\r\n", b"\n") + b"\n")
+                del corpus
+            env = dict(os.environ, OLLAMA_API_URL=ollama.url, NOTION_BASE_URL=notion.url)
+            try:
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec), output_path],
+                    cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                )
+            finally:
+                if imap is not None:
+                    imap.stop()
+            if completed.returncode != 0:
+                lines = completed.stderr.strip().splitlines()
+                return {"scenario": name, "error": lines[-1] if lines else f"exit status {completed.returncode}"}
+            with open(output_path, encoding="utf-8") as f:
+                result = json.load(f)
+            result["notion_requests"] = notion.stats["requests"]
+            result["notion_rate_limited"] = notion.stats["rate_limited"]
+            result["ollama_requests"] = ollama.requests
+            if imap is not None:
+                result["imap_label_stores"] = imap.store_commands
+    return {"scenario": name, **result}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the triage pipeline against local fake services.")
+    parser.add_argument(
+        "scenarios", nargs="*", default=DEFAULT_SCENARIOS,
+        help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: {' '.join(DEFAULT_SCENARIOS)})",
+    )
+    parser.add_argument("--ollama-latency", type=float, default=10.0, help="Fake Ollama delay per prompt in ms")
+    parser.add_argument(
+        "--notion-rate", type=float,
+        help="Fake Notion requests per second, 0 for no limit (default: 3 for triage, none for notion-db)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and the labels")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(*args.child)
+        return 0
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    results = []
+    for name in args.scenarios:
+        results.append(run_scenario(name, args.ollama_latency, args.notion_rate, args.seed))
+        if not args.json:
+            _print_result(results[-1])
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 1 if any("error" in result or _dropped(result) for result in results) else 0
+
+
+def _dropped(result):
+    """Action items a triage run failed to write to Notion, and attachments it failed to forward."""
+    counters = result.get("counters", {})
+    return counters.get("notion_errors", 0) + counters.get("attachment_errors", 0)
+
+
+def _print_result(result):
+    if "error" in result:
+        print(f"{result['scenario']:<16} failed: {result['error']}")
+        return
+    if "pages" in result:
+        throughput = f"{result['pages_per_s']:>9} pages/s"
+    else:
+        throughput = f"{result['messages_per_s']:>9} msgs/s"
+    latencies = "  ".join(
+        f"{stage} {values['p50_ms']:.1f}/{values['p99_ms']:.1f}ms" for stage, values in result["latency"].items()
+        if stage in ("fetch", "parse_wait", "classify", "notion", "query")
+    )
+    failed = ""
+    if "counters" in result:
+        counters = result["counters"]
+        failed = (
+            f"  failed action items {counters.get('notion_errors', 0)}/{counters.get('action_items', 0)}"
+            f"  attachment errors {counters.get('attachment_errors', 0)}"
+        )
+    print(
+        f"{result['scenario']:<16}{throughput}  {result['seconds']:>8.2f}s  peak RSS {result['peak_rss_mb']:>7} MB  "
+        f"p50/p99 {latencies}  notion 429s {result['notion_rate_limited']}/{result['notion_requests']}{failed}"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
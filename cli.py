@@ -0,0 +1,58 @@
+import argparse
+import sys
+
+# Single entry point for the toolkit:
+#   python cli.py triage gmail|icloud [options]
+#   python cli.py backup [backup.py arguments]
+#   python cli.py password [password.py arguments]
+#   python cli.py query [--since DATE] [--until DATE] [--sender ADDRESS]
+# Each subcommand's module is imported only when it runs, and everything after the subcommand is passed
+# through to that module's own argument parser (so `python cli.py backup verify --help` works as expected).
+
+COMMANDS = {
+    "triage": "Classify unread mail and file action items in Notion",
+    "backup": "Back up, list, restore, verify and prune backups",
+    "password": "Generate passwords",
+    "query": "Find action items in the action log",
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Email Automation Toolkit",
+        epilog="\n".join(f"  {name:<10}{help_text}" for name, help_text in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command", help=", ".join(COMMANDS))
+    if not argv or argv[0] in ("-h", "--help"):
+        parser.print_help()
+        return 0 if argv else 2
+    args = parser.parse_args(argv[:1])
+    rest = argv[1:]
+
+    if args.command == "triage":
+        if not rest or rest[0] not in ("gmail", "icloud"):
+            parser.error("usage: cli.py triage {gmail,icloud} [options]")
+        if rest[0] == "gmail":
+            import gmail_triage as module
+        else:
+            import icloud_triage as module
+        return module.main(rest[1:])
+    if args.command == "backup":
+        import backup
+
+        return backup.main(rest)
+    if args.command == "password":
+        import password
+
+        return password.main(rest)
+    if args.command == "query":
+        from utils import action_log
+
+        return action_log.main(rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,49 @@
+import argparse
 import imaplib
 import email
 from email.header import decode_header
 import os
+import sys
+from contextlib import nullcontext
 from utils.notionhelper import NotionHelper
 from datetime import datetime
-from dateutil import parser
 from utils.ollama import ask_ollama
+from utils.attachments import AttachmentForwarder
+from utils import gmail_imap, tracing
+from utils.mailsource import parse_messages, read_message
+from utils.action_log import ActionLog
 
-# Initialize NotionHelper
-notion_helper = NotionHelper(os.getenv('NOTION_API_KEY'))
-notion_database_id = "20efdfd68a97804e8c50ff1168adcf27"
+# Importing this module has no side effects; run it with `python gmail_triage.py` or `python cli.py triage gmail`.
+# Credentials come from GMAIL_USER / GMAIL_APP_PASSWORD and NOTION_API_KEY (or the command line).
+notion_database_id = os.getenv("NOTION_DATABASE_ID", "20efdfd68a97804e8c50ff1168adcf27")
+imap_server = os.getenv("GMAIL_IMAP_SERVER", "imap.gmail.com")  # "host" or "host:port"
+# Gmail search (X-GM-RAW) selecting the mail to triage, e.g. "is:unread -category:promotions newer_than:2d";
+# plain UNSEEN when unset
+gmail_query = os.getenv("GMAIL_QUERY")
+# Gmail labels applied after classification; other classifications are not written back
+gmail_labels = {
+    "🅾️ Action Required": "Triage/Action Required",
+    "Spam": "Triage/Spam",
+    "Low Priority": "Triage/Low Priority",
+}
 # Step 1: Connect to Gmail
-def connect_gmail(user, password):
-    mail = imaplib.IMAP4_SSL("imap.gmail.com")
+def connect_gmail(user, password, server=None, use_ssl=True):
+    host, _, port = (server or imap_server).partition(":")
+    if use_ssl:
+        mail = imaplib.IMAP4_SSL(host, int(port or imaplib.IMAP4_SSL_PORT))
+    else:
+        mail = imaplib.IMAP4(host, int(port or imaplib.IMAP4_PORT))
     mail.login(user, password)
     mail.select("inbox")
     return mail
 # Step 2: Fetch unread emails
-def fetch_unread_emails(mail):
-    status, messages = mail.search(None, 'UNSEEN')
-    email_ids = messages[0].split()
-    return email_ids
+def fetch_unread_emails(mail, query=None):
+    # UIDs rather than sequence numbers, so the labels can be stored after the whole batch is classified
+    return gmail_imap.search(mail, query)
 # Step 3: Parse email
 def parse_email(raw_email):
+    from dateutil import parser
+
     msg = email.message_from_bytes(raw_email)
 
     # Get subject
@@ -98,81 +119,201 @@ def classify_email(subject, body):
     except Exception as e:
         print(f"Error calling Ollama API: {e}")
         return "Unknown" # Default classification on API error
-# Step 5: Main driver
-def triage_emails(user, password):
-    mail = connect_gmail(user, password)
-    email_ids = fetch_unread_emails(mail)
-    for eid in email_ids:
-        # Check status of fetch operation
-        status, msg_data = mail.fetch(eid, "(RFC822)")
-        if status == 'OK' and msg_data and isinstance(msg_data, list) and len(msg_data) > 0 and isinstance(msg_data[0], tuple) and len(msg_data[0]) > 1:
-            raw_email = msg_data[0][1]
-            subject, sender, date_received, body = parse_email(raw_email)
-            label = classify_email(subject, body)
+# Step 5: File an action item in the local log and in Notion
+def file_action_item(
+    notion_helper, attachment_forwarder, action_log, database_id, subject, sender, date_received, body, label, raw_email,
+    source="gmail",
+):
+    tracing.count("action_items")
+    # Write to the local action log (buffered, written to disk in batches)
+    try:
+        with tracing.span("action_log"):
+            action_log.append(sender, subject, body, received=date_received, label=label, source=source)
+    except Exception as file_e:
+        print(f"Failed to write email '{subject}' to the action log: {str(file_e)}")
+
+    # Write to Notion database
+    try:
+        page_properties = {
+            # must match the database “title” field name
+            "Subject": {
+                "title": [
+                    {
+                        "type": "text",
+                        "text": {"content": subject}
+                    }
+                ]
+            },
+
+            # any rich-text field name you created
+            "Body": {
+                "rich_text": [
+                    {
+                        "type": "text",
+                        "text": {"content": body[:2000]} # Preview only, the full body is stored on the page
+                    }
+                ]
+            },
+
+            # email field ("Name <addr>" is reduced to the address during validation)
+            "From": {
+                "email": sender
+            },
+
+            # date field
+            "Date": {
+                "date": {
+                    "start": date_received.isoformat() if isinstance(date_received, datetime) else None   # ISO 8601
+                }
+            }
+        }
+        with tracing.span("notion"):
+            page = notion_helper.new_page_with_body(database_id, page_properties, body, validate=True)
+        print(f"Successfully wrote email '{subject}' to Notion.")
+
+        # Forward attachments to the new page (uploads run in the background)
+        with tracing.span("attachments"):
+            attachments = attachment_forwarder.extract_from_message(email.message_from_bytes(raw_email))
+            attachment_forwarder.forward(page["id"], attachments)
+    except Exception as notion_e:
+        tracing.count("notion_errors")
+        print(f"Failed to write email '{subject}' to Notion: {str(notion_e)}")
+
+# Step 6: Main driver
+def triage_emails(
+    user, password, notion_token=None, database_id=notion_database_id, server=None, use_ssl=True, query=gmail_query,
+    apply_labels=True,
+):
+    with tracing.span("connect"):
+        mail = connect_gmail(user, password, server, use_ssl)
+    with tracing.span("search"):
+        email_ids = fetch_unread_emails(mail, query)
+    if not email_ids:
+        print("No unread emails found.")
+        mail.logout()
+        return
+
+    # The Notion client is only set up when there is mail to triage
+    notion_helper = NotionHelper(notion_token or os.getenv("NOTION_API_KEY"))
+    attachment_forwarder = AttachmentForwarder(notion_helper)
+    uids_by_label = {}
+    with ActionLog() as action_log:
+        for eid in email_ids:
+            # Check status of fetch operation
+            with tracing.span("fetch"):
+                status, msg_data = mail.uid("FETCH", eid, "(RFC822)")
+            if status == 'OK' and msg_data and isinstance(msg_data, list) and len(msg_data) > 0 and isinstance(msg_data[0], tuple) and len(msg_data[0]) > 1:
+                raw_email = msg_data[0][1]
+                tracing.count("messages")
+                tracing.count("bytes_fetched", len(raw_email))
+                with tracing.span("parse"):
+                    subject, sender, date_received, body = parse_email(raw_email)
+                with tracing.span("classify"):
+                    label = classify_email(subject, body)
+                tracing.count("labels", label=label)
+                if label in gmail_labels:
+                    uids_by_label.setdefault(gmail_labels[label], []).append(eid)
+
+                print(f"\nFrom: {sender}")
+                print(f"Date: {date_received}")
+                print(f"Subject: {subject}")
+                print(f"Classification: {label}")
+
+                # If classified as 'Action Required', write to the action log and Notion
+                if label == "🅾️ Action Required":
+                    file_action_item(
+                        notion_helper, attachment_forwarder, action_log, database_id, subject, sender, date_received,
+                        body, label, raw_email,
+                    )
+
+            else:
+                tracing.count("fetch_errors")
+                print(f"Error fetching or processing email ID {eid}: Status {status}, Data: {msg_data}")
+
+    # One UID STORE per label over compact message sets, instead of one call per message
+    if apply_labels and uids_by_label:
+        applied = gmail_imap.store_labels(mail, uids_by_label)
+        if applied:
+            print("\nApplied Gmail labels: " + ", ".join(f"{label} ({count})" for label, count in applied.items()))
+
+    with tracing.span("attachments_wait"):
+        attachment_forwarder.close()
+    mail.logout()
+
+# Offline driver: triage mail exported to mbox files or Maildir directories, parsed on all cores
+def backfill_emails(paths, notion_token=None, database_id=notion_database_id, workers=None, dry_run=False):
+    notion_helper = None
+    attachment_forwarder = None
+    processed = 0
+    with nullcontext() if dry_run else ActionLog() as action_log:
+        for location, size, (subject, sender, date_received, body) in parse_messages(paths, parse_email, workers):
+            processed += 1
+            tracing.count("messages")
+            tracing.count("bytes_fetched", size)
+            with tracing.span("classify"):
+                label = classify_email(subject, body)
+            tracing.count("labels", label=label)
 
             print(f"\nFrom: {sender}")
             print(f"Date: {date_received}")
             print(f"Subject: {subject}")
             print(f"Classification: {label}")
 
-            # If classified as 'Action Required', write to file and Notion
-            if label == "🅾️ Action Required":
-                # Write to local file
-                try:
-                    with open("action_emails.txt", "a", encoding="utf-8") as f:
-                        f.write(f"--- Action Required Email ---\n")
-                        f.write(f"Received Date: {date_received}\n")
-                        f.write(f"Subject: {subject}\n")
-                        f.write(f"Classification: {label}\n")
-                        f.write(f"Body:\n{body}\n")
-                        f.write(f"-----------------------------\n\n")
-                    print(f"Successfully wrote email '{subject}' to action_emails.txt.")
-                except Exception as file_e:
-                    print(f"Failed to write email '{subject}' to action_emails.txt: {str(file_e)}")
-
-
-                # Write to Notion database
-                try:
-                    page_properties = {
-                        # must match the database “title” field name
-                        "Subject": {
-                            "title": [
-                                {
-                                    "type": "text",
-                                    "text": {"content": subject}
-                                }
-                            ]
-                        },
-
-                        # any rich-text field name you created
-                        "Body": {
-                            "rich_text": [
-                                {
-                                    "type": "text",
-                                    "text": {"content": body[:2000]} # Truncate body for Notion
-                                }
-                            ]
-                        },
-
-                        # email field
-                        "From": {
-                            "email": sender
-                        },
-
-                        # date field
-                        "Date": {
-                            "date": {
-                                "start": date_received.isoformat() if isinstance(date_received, datetime) else None   # ISO 8601
-                            }
-                        }
-                    }
-                    notion_helper.new_page_to_db(notion_database_id, page_properties)
-                    print(f"Successfully wrote email '{subject}' to Notion.")
-                except Exception as notion_e:
-                    print(f"Failed to write email '{subject}' to Notion: {str(notion_e)}")
+            # A dry run only classifies, e.g. to try out a new prompt
+            if label == "🅾️ Action Required" and not dry_run:
+                if notion_helper is None:
+                    notion_helper = NotionHelper(notion_token or os.getenv("NOTION_API_KEY"))
+                    attachment_forwarder = AttachmentForwarder(notion_helper)
+                # Only action items need the raw message again, for their attachments
+                file_action_item(
+                    notion_helper, attachment_forwarder, action_log, database_id, subject, sender, date_received,
+                    body, label, read_message(location), source="backfill",
+                )
 
+    if attachment_forwarder is not None:
+        with tracing.span("attachments_wait"):
+            attachment_forwarder.close()
+    print(f"\nTriaged {processed} archived emails.")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Classify unread Gmail messages and file action items in Notion.")
+    arg_parser.add_argument("--user", default=os.getenv("GMAIL_USER"), help="Gmail address (default: $GMAIL_USER)")
+    arg_parser.add_argument(
+        "--password", default=os.getenv("GMAIL_APP_PASSWORD"), help="App password (default: $GMAIL_APP_PASSWORD)"
+    )
+    arg_parser.add_argument("--database-id", default=notion_database_id, help="Notion database for action items")
+    arg_parser.add_argument(
+        "--query", default=gmail_query,
+        help="Gmail search selecting the mail to triage, e.g. 'is:unread -category:promotions' (default: $GMAIL_QUERY or unread)",
+    )
+    arg_parser.add_argument(
+        "--no-labels", action="store_true", help="Do not write the classifications back to Gmail as labels"
+    )
+    arg_parser.add_argument(
+        "--source", action="append", metavar="PATH",
+        help="Triage an mbox file or Maildir directory offline instead of the inbox (repeatable)",
+    )
+    arg_parser.add_argument("--workers", type=int, help="Parser processes for --source (default: one per CPU)")
+    arg_parser.add_argument("--dry-run", action="store_true", help="With --source, only classify; write nothing")
+    tracing.add_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    if args.source:
+        with tracing.traced_run("triage", args.report, args.prometheus, args.profile, provider="backfill"):
+            try:
+                backfill_emails(args.source, database_id=args.database_id, workers=args.workers, dry_run=args.dry_run)
+            except (OSError, ValueError) as e:
+                print(f"Backfill failed: {e}")
+                return 1
+        return 0
+    if not args.user or not args.password:
+        arg_parser.error("set GMAIL_USER and GMAIL_APP_PASSWORD, or pass --user and --password")
+    with tracing.traced_run("triage", args.report, args.prometheus, args.profile, provider="gmail"):
+        triage_emails(
+            args.user, args.password, database_id=args.database_id, query=args.query, apply_labels=not args.no_labels
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
 
-        else:
-            print(f"Error fetching or processing email ID {eid}: Status {status}, Data: {msg_data}")
-# Example usage
-triage_emails("drjanduplessis.pm@gmail.com", "mbcd snhw kaqu pmwx")
@@ -1,17 +1,22 @@
-import chilkat
+import argparse
 import os
-import sys
+import re
 from utils.notionhelper import NotionHelper
 from datetime import datetime
-from dateutil import parser
 from utils.ollama import ask_ollama
+from utils.attachments import AttachmentForwarder
+from utils import tracing
+from utils.action_log import ActionLog
 
-# Initialize NotionHelper
-notion_helper = NotionHelper(os.getenv("NOTION_API_KEY"))
-notion_database_id = "20efdfd68a97804e8c50ff1168adcf27"
+# Importing this module has no side effects; run it with `python icloud_triage.py` or `python cli.py triage icloud`.
+# Credentials come from ICLOUD_USER / ICLOUD_APP_PASSWORD and NOTION_API_KEY (or the command line).
+# Chilkat is only imported when connecting.
+notion_database_id = os.getenv("NOTION_DATABASE_ID", "20efdfd68a97804e8c50ff1168adcf27")
 
 # Step 1: Connect to iCloud Mail using Chilkat
 def connect_icloud(username, password):
+    import chilkat
+
     imap = chilkat.CkImap()
 
     # Connect to the iCloud IMAP Mail Server
@@ -52,6 +57,8 @@ def fetch_unread_emails(imap):
 
 # Step 3: Parse email using Chilkat email object
 def parse_email(email_obj):
+    from dateutil import parser
+
     # Get subject
     subject = email_obj.subject() if email_obj.subject() else "No Subject"
 
@@ -76,7 +83,6 @@ def parse_email(email_obj):
         html_body = email_obj.getHtmlBody()
         if html_body:
             # Simple HTML tag removal (you could use BeautifulSoup for better parsing)
-            import re
             body = re.sub('<[^<]+?>', '', html_body)
         else:
             body = "No body content"
@@ -84,7 +90,6 @@ def parse_email(email_obj):
     # Clean up body whitespace
     if body:
         # Replace multiple whitespace characters (including newlines) with a single space
-        import re
         body = re.sub(r'\s+', ' ', body).strip()
 
     return subject, sender, date_received, body
@@ -110,13 +115,15 @@ def classify_email(subject, body):
         return "Unknown" # Default classification
 
 # Step 5: Main driver
-def triage_emails(username, password):
-    imap = connect_icloud(username, password)
+def triage_emails(username, password, notion_token=None, database_id=notion_database_id):
+    with tracing.span("connect"):
+        imap = connect_icloud(username, password)
     if not imap:
         print("Failed to connect to iCloud mail.")
         return
 
-    email_uids = fetch_unread_emails(imap)
+    with tracing.span("search"):
+        email_uids = fetch_unread_emails(imap)
 
     if not email_uids:
         print("No unread emails found.")
@@ -124,81 +131,114 @@ def triage_emails(username, password):
         return
 
     print(f"Found {len(email_uids)} unread emails. Processing...")
-
-    for uid in email_uids:
-        try:
-            # Fetch email by UID
-            email_obj = imap.FetchSingle(uid, True)  # True means fetch by UID
-            if not email_obj:
-                print(f"Failed to fetch email with UID: {uid}")
-                continue
-
-            subject, sender, date_received, body = parse_email(email_obj)
-            label = classify_email(subject, body)
-
-            print(f"\nFrom: {sender}")
-            print(f"Date: {date_received}")
-            print(f"Subject: {subject}")
-            print(f"Classification: {label}")
-
-            # If classified as 'Action Required', write to file and Notion
-            if label == "🅾️ Action Required":
-                # Write to local file
-                with open("action_emails.txt", "a", encoding="utf-8") as f:
-                    f.write(f"--- Action Required Email ---\n")
-                    f.write(f"Received Date: {date_received}\n")
-                    f.write(f"Subject: {subject}\n")
-                    f.write(f"Classification: {label}\n")
-                    f.write(f"Body:\n{body}\n")
-                    f.write(f"-----------------------------\n\n")
-
-                # Write to Notion database
-                try:
-                    page_properties = {
-                        # must match the database “title” field name
-                        "Subject": {
-                            "title": [
-                                {
-                                    "type": "text",
-                                    "text": {"content": subject}
-                                }
-                            ]
-                        },
-
-                        # any rich-text field name you created
-                        "Body": {
-                            "rich_text": [
-                                {
-                                    "type": "text",
-                                    "text": {"content": body[:2000]}
+    # The Notion client is only set up when there is mail to triage
+    notion_helper = NotionHelper(notion_token or os.getenv("NOTION_API_KEY"))
+    attachment_forwarder = AttachmentForwarder(notion_helper)
+    with ActionLog() as action_log:
+        for uid in email_uids:
+            try:
+                # Fetch email by UID
+                with tracing.span("fetch"):
+                    email_obj = imap.FetchSingle(uid, True)  # True means fetch by UID
+                if not email_obj:
+                    tracing.count("fetch_errors")
+                    print(f"Failed to fetch email with UID: {uid}")
+                    continue
+                tracing.count("messages")
+                tracing.count("bytes_fetched", email_obj.get_Size())
+
+                with tracing.span("parse"):
+                    subject, sender, date_received, body = parse_email(email_obj)
+                with tracing.span("classify"):
+                    label = classify_email(subject, body)
+                tracing.count("labels", label=label)
+
+                print(f"\nFrom: {sender}")
+                print(f"Date: {date_received}")
+                print(f"Subject: {subject}")
+                print(f"Classification: {label}")
+
+                # If classified as 'Action Required', write to the action log and Notion
+                if label == "🅾️ Action Required":
+                    tracing.count("action_items")
+                    # Write to the local action log (buffered, written to disk in batches)
+                    with tracing.span("action_log"):
+                        action_log.append(sender, subject, body, received=date_received, label=label, source="icloud")
+
+                    # Write to Notion database
+                    try:
+                        page_properties = {
+                            # must match the database “title” field name
+                            "Subject": {
+                                "title": [
+                                    {
+                                        "type": "text",
+                                        "text": {"content": subject}
+                                    }
+                                ]
+                            },
+
+                            # any rich-text field name you created
+                            "Body": {
+                                "rich_text": [
+                                    {
+                                        "type": "text",
+                                        "text": {"content": body[:2000]} # Preview only, the full body is stored on the page
+                                    }
+                                ]
+                            },
+
+                            # email field ("Name <addr>" is reduced to the address during validation)
+                            "From": {
+                                "email": sender        # plain string
+                            },
+
+                            # date field
+                            "Date": {
+                                "date": {
+                                    "start": date_received.isoformat() if isinstance(date_received, datetime) else None   # ISO 8601
                                 }
-                            ]
-                        },
-
-                        # email field
-                        "From": {
-                            "email": sender        # plain string
-                        },
-
-                        # date field
-                        "Date": {
-                            "date": {
-                                "start": date_received.isoformat() if isinstance(date_received, datetime) else None   # ISO 8601
                             }
                         }
-                    }
-                    notion_helper.new_page_to_db(notion_database_id, page_properties)
-                    print(f"Successfully wrote email '{subject}' to Notion.")
-                except Exception as notion_e:
-                    print(f"Failed to write email '{subject}' to Notion: {str(notion_e)}")
+                        with tracing.span("notion"):
+                            page = notion_helper.new_page_with_body(database_id, page_properties, body, validate=True)
+                        print(f"Successfully wrote email '{subject}' to Notion.")
 
+                        # Forward attachments to the new page (uploads run in the background)
+                        with tracing.span("attachments"):
+                            attachments = attachment_forwarder.extract_from_chilkat(email_obj)
+                            attachment_forwarder.forward(page["id"], attachments)
+                    except Exception as notion_e:
+                        tracing.count("notion_errors")
+                        print(f"Failed to write email '{subject}' to Notion: {str(notion_e)}")
 
-        except Exception as e:
-            print(f"Error processing email {uid}: {str(e)}")
+
+            except Exception as e:
+                print(f"Error processing email {uid}: {str(e)}")
+
+    with tracing.span("attachments_wait"):
+        attachment_forwarder.close()
 
     # Disconnect from the IMAP server
     imap.Disconnect()
 
-# Example usage
-# Note: For iCloud, use just the username part (before @icloud.com)
-triage_emails("drjanduplessis", "mayx-eiwe-ypll-gslb")
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Classify unread iCloud messages and file action items in Notion.")
+    # Note: For iCloud, use just the username part (before @icloud.com)
+    arg_parser.add_argument("--user", default=os.getenv("ICLOUD_USER"), help="iCloud username (default: $ICLOUD_USER)")
+    arg_parser.add_argument(
+        "--password", default=os.getenv("ICLOUD_APP_PASSWORD"), help="App password (default: $ICLOUD_APP_PASSWORD)"
+    )
+    arg_parser.add_argument("--database-id", default=notion_database_id, help="Notion database for action items")
+    tracing.add_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    if not args.user or not args.password:
+        arg_parser.error("set ICLOUD_USER and ICLOUD_APP_PASSWORD, or pass --user and --password")
+    with tracing.traced_run("triage", args.report, args.prometheus, args.profile, provider="icloud"):
+        triage_emails(args.user, args.password, database_id=args.database_id)
+
+
+if __name__ == "__main__":
+    main()
+
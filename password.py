@@ -1,22 +1,186 @@
-import secrets
+import argparse
+import csv
+import json
+import os
 import string
 import sys
 
+# Passwords are drawn from large os.urandom buffers. A random byte b maps to alphabet[b % n] only when
+# b < 256 - 256 % n, every other byte is discarded, so each character is exactly uniform (no modulo bias).
+# Candidates missing a required character class are discarded whole, which keeps every valid password
+# equally likely. The per-byte work is vectorised with NumPy when it is installed, otherwise with
+# bytes.translate, which does the same filtering in C. NumPy is only imported for batches large enough
+# to repay its import time.
 
-if len(sys.argv) < 2:
-    print("Usage: python passwords.py <website_name>")
-    print("Example: python passwords.py 'example.com'")
-    exit()
+CHARACTER_CLASSES = {
+    "lower": string.ascii_lowercase,
+    "upper": string.ascii_uppercase,
+    "digits": string.digits,
+    "symbols": string.punctuation,
+}
 
-website = sys.argv[1]
-if not website:
-    print("Website name cannot be empty.")
-    exit()
+NUMPY_MIN_CHARACTERS = 100_000
+
+DEFAULT_POLICY = {
+    "length": 24,
+    "require": ["lower", "upper", "digits", "symbols"],
+    "exclude": "",
+}
+
+
+def policy_alphabet(policy):
+    """Returns (alphabet, required class alphabets) for a policy, after removing excluded characters."""
+    if policy["length"] < 1:
+        raise ValueError("The length must be at least 1")
+    excluded = set(policy.get("exclude", ""))
+    classes = policy.get("classes", list(CHARACTER_CLASSES))
+    for name in classes + policy.get("require", []):
+        if name not in CHARACTER_CLASSES:
+            raise ValueError(f"Unknown character class: {name} (use {', '.join(CHARACTER_CLASSES)})")
+    alphabet = "".join(c for name in classes for c in CHARACTER_CLASSES[name] if c not in excluded)
+    required = [
+        set(CHARACTER_CLASSES[name]) - excluded for name in policy.get("require", []) if name in classes
+    ]
+    if not alphabet:
+        raise ValueError("The policy leaves no characters to choose from")
+    if any(not chars for chars in required):
+        raise ValueError("The policy excludes every character of a required class")
+    if len(required) > policy["length"]:
+        raise ValueError("The password is too short to hold every required class")
+    return alphabet, required
+
+
+def _numpy():
+    """Returns the numpy module, or None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _uniform_characters(alphabet, count):
+    """Returns `count` characters drawn uniformly from `alphabet` with rejection sampling."""
+    n = len(alphabet)
+    limit = 256 - 256 % n
+    np = _numpy() if count >= NUMPY_MIN_CHARACTERS else None
+    # Read enough for the expected rejections in one go, then top up if unlucky
+    chunks = []
+    have = 0
+    while have < count:
+        buffer = os.urandom(int((count - have) * 256 / limit * 1.05) + 64)
+        if np is not None:
+            data = np.frombuffer(buffer, dtype=np.uint8)
+            accepted = data[data < limit] % n
+            chunk = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)[accepted].tobytes()
+        else:
+            table = bytes.maketrans(bytes(range(limit)), (alphabet.encode("ascii") * (limit // n + 1))[:limit])
+            chunk = buffer.translate(table, bytes(range(limit, 256)))
+        chunks.append(chunk)
+        have += len(chunk)
+    return b"".join(chunks)[:count].decode("ascii")
+
+
+def generate_passwords(count, policy=None):
+    """Generates `count` passwords satisfying `policy` (see DEFAULT_POLICY) in one batch."""
+    policy = {**DEFAULT_POLICY, **(policy or {})}
+    length = policy["length"]
+    alphabet, required = policy_alphabet(policy)
+
+    passwords = []
+    while len(passwords) < count:
+        missing = count - len(passwords)
+        characters = _uniform_characters(alphabet, missing * length)
+        for i in range(0, len(characters), length):
+            candidate = characters[i:i + length]
+            chars = set(candidate)
+            if all(chars & required_chars for required_chars in required):
+                passwords.append(candidate)
+    return passwords[:count]
 
 
 def generate_password(length=24):
-    characters = string.ascii_letters + string.digits + string.punctuation
-    return "".join(secrets.choice(characters) for _ in range(length))
+    """Generates one password with the default policy."""
+    return generate_passwords(1, {"length": length})[0]
+
+
+def load_policies(path):
+    """Reads {site: policy} from a JSON file; the "default" entry applies to sites without their own."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_output(rows, output_format, out=sys.stdout):
+    """Writes (site, password) rows as "site - password" lines, CSV or JSON."""
+    if output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["site", "password"])
+        writer.writerows(rows)
+    elif output_format == "json":
+        json.dump([{"site": site, "password": password} for site, password in rows], out, indent=2)
+        out.write("\n")
+    else:
+        for site, password in rows:
+            out.write(f"{site} - {password}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate secure passwords for one or many sites.")
+    parser.add_argument("sites", nargs="*", help="Website or account names")
+    parser.add_argument("--sites-file", help="File with one site per line")
+    parser.add_argument("--count", type=int, default=1, help="Passwords per site (default: 1)")
+    parser.add_argument("--length", type=int, help=f"Password length (default: {DEFAULT_POLICY['length']})")
+    parser.add_argument(
+        "--require",
+        help="Comma-separated classes every password must contain (default: lower,upper,digits,symbols)",
+    )
+    parser.add_argument("--exclude", help="Characters never to use, e.g. '\"\\'`'")
+    parser.add_argument("--policies", help="JSON file of per-site policies: {\"site\": {\"length\": 32, ...}}")
+    parser.add_argument("--format", choices=["text", "csv", "json"], default="text", help="Output format")
+    args = parser.parse_args(argv)
+
+    sites = list(args.sites)
+    if args.sites_file:
+        with open(args.sites_file, encoding="utf-8") as f:
+            sites.extend(line.strip() for line in f if line.strip())
+    sites = list(dict.fromkeys(sites))
+    if not sites:
+        print("Usage: python password.py <website_name> [more sites...] [--count N] [--format csv|json]")
+        print("Example: python password.py 'example.com'")
+        return 1
+    if args.count < 1:
+        print("--count must be at least 1.")
+        return 1
+
+    overrides = {}
+    if args.length is not None:
+        overrides["length"] = args.length
+    if args.require is not None:
+        overrides["require"] = [name.strip() for name in args.require.split(",") if name.strip()]
+    if args.exclude:
+        overrides["exclude"] = args.exclude
+    policies = load_policies(args.policies) if args.policies else {}
+
+    # Sites sharing a policy are generated in one batch
+    batches = {}
+    for site in sites:
+        policy = {**DEFAULT_POLICY, **policies.get("default", {}), **policies.get(site, {}), **overrides}
+        batches.setdefault(json.dumps(policy, sort_keys=True), []).append(site)
+
+    generated = {}
+    try:
+        for key, batch_sites in batches.items():
+            passwords = iter(generate_passwords(len(batch_sites) * args.count, json.loads(key)))
+            for site in batch_sites:
+                generated[site] = [next(passwords) for _ in range(args.count)]
+    except ValueError as e:
+        print(f"Invalid password policy: {e}")
+        return 1
+
+    rows = [(site, password) for site in sites for password in generated[site]]
+    write_output(rows, args.format)
+    return 0
+
 
-password = generate_password()
-print(f"{website} - {password}")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.action_log import ActionLog  # noqa: E402
+
+# Run with `python -m unittest discover tests` from the repository root.
+
+
+def _write(directory, writer, count):
+    with ActionLog(directory, batch_records=1) as log:
+        for i in range(count):
+            log.append(f"writer{writer}@example.com", f"item {writer}-{i}", "body " * (i + 1))
+
+
+class ConcurrentWritersTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_all_records(self, expected):
+        with ActionLog(self.directory) as log:
+            subjects = sorted(record["subject"] for record in log.query())
+        self.assertEqual(subjects, sorted(expected))
+
+    def test_interleaved_writers_in_one_process(self):
+        first = ActionLog(self.directory, batch_records=1)
+        second = ActionLog(self.directory, batch_records=1)
+        expected = []
+        for i in range(20):
+            for writer, log in enumerate((first, second)):
+                log.append(f"writer{writer}@example.com", f"item {writer}-{i}", "body " * (i + 1))
+                expected.append(f"item {writer}-{i}")
+        first.close()
+        second.close()
+        self.assert_all_records(expected)
+
+    def test_writer_processes(self):
+        writers = [multiprocessing.Process(target=_write, args=(self.directory, writer, 200)) for writer in range(2)]
+        for process in writers:
+            process.start()
+        for process in writers:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        self.assert_all_records([f"item {writer}-{i}" for writer in range(2) for i in range(200)])
+
+    def test_sender_query_across_writers(self):
+        _write(self.directory, 0, 5)
+        _write(self.directory, 1, 5)
+        with ActionLog(self.directory) as log:
+            self.assertEqual(len(list(log.query(sender="writer1@example.com"))), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parseaddr
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Append-only JSON Lines log of action-required emails, written by both triage scripts. Records are
+# buffered and written in batches: one write and one fsync per batch, to a segment file that stays open
+# for the whole run. A new segment starts every day and whenever the current one would grow past
+# MAX_SEGMENT_BYTES, so old history can be archived or deleted a file at a time.
+#
+# A SQLite sidecar (index.sqlite) maps every record's time and sender address to its segment and byte
+# range, so a query for a time range or a sender reads only the matching lines. The index is updated
+# after the batch is on disk and never points past the data. Records that reached a segment but not the
+# index (a crash between the two) are indexed again when the log is next opened, and a torn last line is
+# cut off.
+#
+# Both triage scripts default to the same directory and may run at the same time, so writing a batch and
+# indexing it, and the recovery on open, happen under an flock on <directory>/lock. Offsets come from the
+# segment's size on disk while the lock is held, never from a per-process counter.
+
+ACTION_LOG_DIR = os.getenv("ACTION_LOG_DIR", "action_log")
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+BATCH_RECORDS = 50
+BATCH_SECONDS = 5.0
+SEGMENT_PREFIX = "actions-"
+SEGMENT_SUFFIX = ".jsonl"
+INDEX_NAME = "index.sqlite"
+LOCK_NAME = "lock"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    at TEXT NOT NULL, sender TEXT NOT NULL, segment TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL,
+    PRIMARY KEY (segment, offset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_time ON entries (at);
+CREATE INDEX IF NOT EXISTS entries_by_sender ON entries (sender, at);
+"""
+
+
+def _utc(when):
+    """Returns an aware datetime in UTC; naive datetimes are taken as local time."""
+    return when.astimezone(timezone.utc)
+
+
+def _index_time(record):
+    """The time a record is indexed under: when the email was received, else when it was logged."""
+    return _utc(datetime.fromisoformat(record.get("received") or record["logged"])).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _sender_address(sender):
+    return (parseaddr(sender or "")[1] or sender or "").lower()
+
+
+def parse_time(value, end_of_day=False):
+    """Parses a --since/--until value ("2024-05-01" or "2024-05-01 18:00", local time) into an index time.
+
+    With `end_of_day`, a date without a time means the end of that day.
+    """
+    when = datetime.fromisoformat(value)
+    if end_of_day and len(value) <= 10:
+        when = when.replace(hour=23, minute=59, second=59)
+    return _utc(when).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class ActionLog:
+    """
+    Buffered, rotating JSON Lines log of action items with a time and sender index.
+
+    Methods
+    -------
+    append(sender, subject, body, received=None, label=None, source=None):
+        Buffers one action item; a full batch is written and fsync'd.
+
+    flush():
+        Writes and fsyncs the buffered records, then indexes them.
+
+    query(since=None, until=None, sender=None):
+        Yields the logged records in a time range, optionally from one sender, oldest first.
+
+    close():
+        Flushes and closes the log.
+    """
+
+    def __init__(self, directory=ACTION_LOG_DIR, max_segment_bytes=MAX_SEGMENT_BYTES, batch_records=BATCH_RECORDS,
+                 batch_seconds=BATCH_SECONDS):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.batch_records = batch_records
+        self.batch_seconds = batch_seconds
+        self.pending = []  # (record, encoded line)
+        self.last_flush = time.monotonic()
+        self.segment = None
+        self.segment_file = None
+        self.segment_size = 0
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+        self.db.executescript(_SCHEMA)
+        with self._locked():
+            self._recover()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def _locked(self):
+        """Holds the log's lock, so processes sharing the directory never interleave writes and index updates."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _segments(self):
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _recover(self):
+        """Indexes records written after the last index update and cuts off a torn last line.
+
+        Must be called with the lock held: unindexed bytes are then never a batch another process is writing.
+        """
+        indexed = dict(self.db.execute("SELECT segment, MAX(offset + length) FROM entries GROUP BY segment"))
+        for name in self._segments():
+            path = os.path.join(self.directory, name)
+            end = indexed.get(name, 0)
+            if os.path.getsize(path) <= end:
+                continue
+            rows = []
+            with open(path, "rb+") as f:
+                f.seek(end)
+                offset = end
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    rows.append((_index_time(record), _sender_address(record.get("sender")), name, offset, len(line)))
+                    offset += len(line)
+                f.truncate(offset)
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+
+    def append(self, sender, subject, body, received=None, label=None, source=None):
+        """Buffers one action item; `received` is the email's datetime, if known."""
+        record = {
+            "logged": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "received": received.isoformat() if isinstance(received, datetime) else None,
+            "sender": sender,
+            "subject": subject,
+            "label": label,
+            "source": source,
+            "body": body,
+        }
+        self.pending.append((record, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")))
+        if len(self.pending) >= self.batch_records or time.monotonic() - self.last_flush >= self.batch_seconds:
+            self.flush()
+
+    def _open_segment(self, batch_bytes):
+        """Makes sure the current segment is today's and has room for `batch_bytes` more.
+
+        Called with the lock held; other processes may have appended to the segment since the last batch.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        if self.segment_file is not None:
+            self.segment_size = os.fstat(self.segment_file.fileno()).st_size
+        if (
+            self.segment_file is not None
+            and self.segment.startswith(SEGMENT_PREFIX + today)
+            and (self.segment_size == 0 or self.segment_size + batch_bytes <= self.max_segment_bytes)
+        ):
+            return
+        if self.segment_file is not None:
+            self.segment_file.close()
+        existing = [name for name in self._segments() if name.startswith(SEGMENT_PREFIX + today)]
+        # actions-2024-05-01.0000.jsonl, actions-2024-05-01.0001.jsonl, ...
+        name = existing[-1] if existing else f"{SEGMENT_PREFIX}{today}.0000{SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size and size + batch_bytes > self.max_segment_bytes:
+            name = f"{SEGMENT_PREFIX}{today}.{len(existing):04d}{SEGMENT_SUFFIX}"
+            path = os.path.join(self.directory, name)
+            size = 0
+        self.segment = name
+        self.segment_file = open(path, "ab")
+        self.segment_size = size
+
+    def flush(self):
+        """Writes and fsyncs the buffered records, then indexes them."""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        data = b"".join(line for _, line in self.pending)
+        with self._locked():
+            self._open_segment(len(data))
+            offset = self.segment_size
+            rows = []
+            for record, line in self.pending:
+                rows.append((_index_time(record), _sender_address(record["sender"]), self.segment, offset, len(line)))
+                offset += len(line)
+            self.segment_file.write(data)
+            self.segment_file.flush()
+            os.fsync(self.segment_file.fileno())
+            self.segment_size = offset
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+        self.pending = []
+
+    def query(self, since=None, until=None, sender=None):
+        """
+        Yields the logged records in a time range, oldest first.
+
+        Parameters:
+            since (str): Earliest index time, as returned by parse_time (default: the beginning).
+            until (str): Latest index time (default: now).
+            sender (str): An address ("a@example.com") or a domain ("@example.com") to restrict to.
+        """
+        self.flush()
+        sql = "SELECT segment, offset, length FROM entries WHERE at >= ? AND at <= ?"
+        params = [since or "", until or "9999"]
+        if sender and sender.startswith("@"):
+            sql += " AND sender LIKE ?"
+            params.append("%" + sender.lower())
+        elif sender:
+            sql += " AND sender = ?"
+            params.append(_sender_address(sender))
+        files = {}
+        try:
+            for segment, offset, length in self.db.execute(sql + " ORDER BY at, segment, offset", params):
+                f = files.get(segment)
+                if f is None:
+                    f = files[segment] = open(os.path.join(self.directory, segment), "rb")
+                f.seek(offset)
+                yield json.loads(f.read(length))
+        finally:
+            for f in files.values():
+                f.close()
+
+    def close(self):
+        """Flushes and closes the log."""
+        self.flush()
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+        self.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find action items in the action log.")
+    parser.add_argument("--since", help="Earliest date or time, e.g. 2024-05-01 or '2024-05-01 09:00' (local time)")
+    parser.add_argument("--until", help="Latest date or time; a date alone means the end of that day")
+    parser.add_argument("--sender", help="Only items from this address, or from a domain given as @example.com")
+    parser.add_argument("--log-dir", default=ACTION_LOG_DIR, help=f"Action log directory (default: {ACTION_LOG_DIR})")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text", help="Output format")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.log_dir):
+        print(f"No action log in {args.log_dir}")
+        return 1
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until, end_of_day=True) if args.until else None
+    except ValueError as e:
+        print(f"Invalid date: {e}")
+        return 1
+
+    found = 0
+    with ActionLog(args.log_dir) as log:
+        for record in log.query(since, until, args.sender):
+            found += 1
+            if args.format == "jsonl":
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                when = record.get("received") or record["logged"]
+                print(f"{when[:16].replace('T', ' ')}  {record['sender']}  {record['subject']}")
+    if args.format == "text":
+        print(f"{found} action item(s)")
+    return 0
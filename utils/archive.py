@@ -0,0 +1,256 @@
+import bisect
+import gzip
+import io
+import json
+import lzma
+import os
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.copy_engine import walk_tree
+from utils.snapshots import PARTIAL_SUFFIX
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Archive output for backup.py. The walked tree is streamed into a tar archive whose bytes are cut into
+# fixed-size blocks and compressed independently on a process pool. Independent gzip members, xz streams
+# and zstd frames may be concatenated, so the result is still a normal .tar.gz/.tar.xz/.tar.zst that any
+# tar can extract. A sidecar index maps every member to its offsets in the uncompressed stream and every
+# block to its place in the compressed file, so one member can be restored by decompressing only the
+# blocks that hold it.
+#
+# The archive and its index are written under "<name>.partial" names, fsync'd and only then renamed into
+# place (index first), so an interrupted run never leaves a truncated archive that looks complete.
+
+BLOCK_SIZE = 4 * 1024 * 1024
+INDEX_SUFFIX = ".index.json.gz"
+EXTENSIONS = {"gzip": ".tar.gz", "lzma": ".tar.xz", "zstd": ".tar.zst"}
+
+
+def default_codec():
+    """Returns "zstd" when the zstandard package is installed, otherwise "gzip"."""
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def compress_block(codec, data):
+    """Compresses one block as a self-contained gzip member, xz stream or zstd frame."""
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if codec == "lzma":
+        return lzma.compress(data, preset=6)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decompress_block(codec, data):
+    """Reverses compress_block."""
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "lzma":
+        return lzma.decompress(data)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class _BlockWriter(io.RawIOBase):
+    """File-like sink that compresses everything written to it in parallel, in fixed-size blocks."""
+
+    def __init__(self, out, codec, executor, max_in_flight):
+        self.out = out
+        self.codec = codec
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.buffer = bytearray()
+        self.in_flight = []  # (uncompressed offset, future), oldest first
+        self.uncompressed_offset = 0
+        self.compressed_offset = 0
+        self.blocks = []  # [uncompressed offset, compressed offset, compressed length]
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self._submit(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block):
+        self.in_flight.append((self.uncompressed_offset, self.executor.submit(compress_block, self.codec, block)))
+        self.uncompressed_offset += len(block)
+        # Bound memory: wait for the oldest block before queueing more
+        while len(self.in_flight) > self.max_in_flight:
+            self._write_oldest()
+
+    def _write_oldest(self):
+        offset, future = self.in_flight.pop(0)
+        compressed = future.result()
+        self.out.write(compressed)
+        self.blocks.append([offset, self.compressed_offset, len(compressed)])
+        self.compressed_offset += len(compressed)
+
+    def finish(self):
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.in_flight:
+            self._write_oldest()
+
+
+def create_archive(source, archive_path, ignore=None, codec=None, workers=None, exclude=None, scan_cache=None):
+    """Streams `source` into a block-compressed tar archive and writes its member index next to it.
+
+    Parameters:
+        source (str): Directory to archive.
+        archive_path (str): Output file; it must not exist yet. The archive only appears under this name once
+                            it and its index are complete.
+        ignore (callable, optional): Called as ignore(directory, names); returns the names to skip.
+        codec (str, optional): "gzip", "lzma" or "zstd". Defaults to default_codec().
+        workers (int, optional): Compression processes. Defaults to the number of CPUs.
+        exclude (PathMatcher, optional): Exclusion rules applied during the walk.
+        scan_cache (ScanCache, optional): Persistent directory listing cache for the walk.
+
+    Returns:
+        dict: "files", "bytes_in" (tar stream size), "bytes_out", "ratio", "seconds" and "mb_per_sec".
+    """
+    codec = codec or default_codec()
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("The zstd codec needs the zstandard package")
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    members = {}
+    files = 0
+
+    if os.path.exists(archive_path):
+        raise FileExistsError(f"Archive {archive_path} already exists")
+    # A .partial left by an interrupted run is overwritten
+    partial_path = archive_path + PARTIAL_SUFFIX
+    index_partial_path = archive_path + INDEX_SUFFIX + PARTIAL_SUFFIX
+    try:
+        with open(partial_path, "wb") as out, ProcessPoolExecutor(max_workers=workers) as executor:
+            writer = _BlockWriter(out, codec, executor, max_in_flight=workers * 2)
+            with tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT, dereference=True) as tar:
+                for relative_path, entry, is_dir in walk_tree(
+                    source, ignore=ignore, exclude=exclude, scan_cache=scan_cache
+                ):
+                    tarinfo = tar.gettarinfo(entry.path, arcname=relative_path)
+                    start = tar.offset
+                    if is_dir:
+                        tar.addfile(tarinfo)
+                    else:
+                        with open(entry.path, "rb") as f:
+                            tar.addfile(tarinfo, f)
+                        files += 1
+                    members[relative_path] = [start, tar.offset, tarinfo.size, tarinfo.mtime]
+            writer.finish()
+            out.flush()
+            os.fsync(out.fileno())
+
+        index = {
+            "version": 1,
+            "codec": codec,
+            "block_size": BLOCK_SIZE,
+            "blocks": writer.blocks,
+            "members": members,
+        }
+        with open(index_partial_path, "wb") as raw:
+            with gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(index, f, separators=(",", ":"))
+            raw.flush()
+            os.fsync(raw.fileno())
+    except BaseException:
+        for path in (partial_path, index_partial_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    os.replace(index_partial_path, archive_path + INDEX_SUFFIX)
+    os.replace(partial_path, archive_path)
+
+    seconds = time.perf_counter() - started
+    bytes_in = writer.uncompressed_offset
+    bytes_out = writer.compressed_offset
+    return {
+        "files": files,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "ratio": round(bytes_in / bytes_out, 2) if bytes_out else 0.0,
+        "seconds": round(seconds, 3),
+        "mb_per_sec": round(bytes_in / (1024 * 1024) / seconds, 1) if seconds else 0.0,
+    }
+
+
+def load_index(archive_path):
+    """Returns the member/block index written next to an archive by create_archive."""
+    with gzip.open(archive_path + INDEX_SUFFIX, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _BlockReader(io.RawIOBase):
+    """Reads the uncompressed byte range [start, end) of an archive, decompressing only the blocks it spans."""
+
+    def __init__(self, f, index, start, end):
+        self.f = f
+        self.codec = index["codec"]
+        self.blocks = index["blocks"]
+        self.block_offsets = [block[0] for block in self.blocks]
+        self.position = start
+        self.end = end
+        self.current = b""
+        self.current_offset = None
+
+    def readable(self):
+        return True
+
+    def _load(self, position):
+        i = bisect.bisect_right(self.block_offsets, position) - 1
+        uncompressed_offset, compressed_offset, length = self.blocks[i]
+        self.f.seek(compressed_offset)
+        self.current = decompress_block(self.codec, self.f.read(length))
+        self.current_offset = uncompressed_offset
+
+    def readinto(self, buffer):
+        if self.position >= self.end:
+            return 0
+        if self.current_offset is None or not (
+            self.current_offset <= self.position < self.current_offset + len(self.current)
+        ):
+            self._load(self.position)
+        start = self.position - self.current_offset
+        size = min(len(buffer), len(self.current) - start, self.end - self.position)
+        buffer[:size] = self.current[start:start + size]
+        self.position += size
+        return size
+
+
+def extract_member(archive_path, name, target):
+    """Restores one member (a file, or a directory entry) of an archive into `target`.
+
+    Only the compressed blocks that overlap the member are read and decompressed.
+
+    Returns:
+        str: The path of the restored member.
+    """
+    index = load_index(archive_path)
+    name = name.strip("/")
+    if name not in index["members"]:
+        raise KeyError(f"{name} is not in {archive_path}")
+    start, end = index["members"][name][:2]
+
+    with open(archive_path, "rb") as f:
+        reader = io.BufferedReader(_BlockReader(f, index, start, end), buffer_size=BLOCK_SIZE)
+        with tarfile.open(fileobj=reader, mode="r|") as tar:
+            for member in tar:
+                if hasattr(tarfile, "data_filter"):
+                    tar.extract(member, target, filter="data")
+                else:
+                    tar.extract(member, target)
+                break
+    return os.path.join(target, name)
@@ -0,0 +1,288 @@
+import binascii
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.header import decode_header, make_header
+
+from utils import tracing
+
+# Attachments are decoded straight to temporary files and forwarded to Notion pages in parallel.
+# Identical files (same SHA-256) are written and uploaded once per run, then attached wherever they occur.
+
+DECODE_CHUNK_CHARS = 64 * 1024  # base64 characters decoded per step, a multiple of 4
+HASH_CHUNK_BYTES = 1024 * 1024
+MAX_MESSAGE_ATTACHMENT_BYTES = 25 * 1024 * 1024  # per email; larger attachments are skipped
+UPLOAD_WORKERS = 4
+
+_WHITESPACE = {ord(c): None for c in " \t\r\n"}
+
+
+def _safe_filename(filename, fallback="attachment"):
+    """Returns a filename that cannot escape the directory it is written to."""
+    filename = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return filename if filename not in ("", ".", "..") else fallback
+
+
+def _decode_base64_to_file(encoded, f, hasher):
+    """Decodes a base64 string into `f` in bounded chunks and returns the number of bytes written."""
+    written = 0
+    carry = ""
+    for start in range(0, len(encoded), DECODE_CHUNK_CHARS):
+        chunk = carry + encoded[start:start + DECODE_CHUNK_CHARS].translate(_WHITESPACE)
+        usable = len(chunk) - len(chunk) % 4
+        carry = chunk[usable:]
+        if usable:
+            data = binascii.a2b_base64(chunk[:usable])
+            f.write(data)
+            hasher.update(data)
+            written += len(data)
+    if carry.strip("="):
+        # Tolerate a truncated final quantum the same way email.message does
+        data = binascii.a2b_base64(carry + "=" * (-len(carry) % 4))
+        f.write(data)
+        hasher.update(data)
+        written += len(data)
+    return written
+
+
+class AttachmentForwarder:
+    """
+    Extracts attachments from emails and attaches them to Notion pages.
+
+    Methods
+    -------
+    extract_from_message(msg):
+        Decodes the attachments of an `email.message.Message` into temporary files.
+
+    extract_from_chilkat(email_obj):
+        Saves the attachments of a Chilkat email object into temporary files.
+
+    forward(page_id, attachments):
+        Queues the attachments for upload to the given Notion page.
+
+    close():
+        Waits for all uploads, prints the throughput summary and removes the temporary files.
+    """
+
+    def __init__(self, notion_helper, max_message_bytes=MAX_MESSAGE_ATTACHMENT_BYTES, max_workers=UPLOAD_WORKERS):
+        self.notion_helper = notion_helper
+        self.max_message_bytes = max_message_bytes
+        self.temp_dir = tempfile.mkdtemp(prefix="triage_attachments_")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self._lock = threading.Lock()
+        self._files = {}  # sha256 -> attachment dict of the first copy written
+        self._uploads = {}  # sha256 -> {"upload_id": str | None, "pending": [page_id, ...]}
+        self._queued = set()  # (page_id, sha256) pairs already queued, so a page gets each file once
+        self._futures = []
+
+        self.started = None
+        self.bytes_uploaded = 0
+        self.files_uploaded = 0
+        self.files_attached = 0
+        self.files_skipped = 0
+        self.errors = 0
+
+    def _store(self, tmp_path, filename, sha256, size):
+        """Moves a freshly written temp file into place, or drops it if the same content is already stored."""
+        existing = self._files.get(sha256)
+        if existing:
+            os.remove(tmp_path)
+            return dict(existing, filename=filename)
+
+        folder = os.path.join(self.temp_dir, sha256[:16])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, filename)
+        os.replace(tmp_path, path)
+        attachment = {"filename": filename, "path": path, "sha256": sha256, "size": size}
+        self._files[sha256] = attachment
+        return attachment
+
+    def extract_from_message(self, msg):
+        """Decodes the attachments of a parsed email into temporary files.
+
+        Base64 parts are decoded incrementally, so the decoded payload is never held in memory as a whole.
+        Attachments that would take the message over `max_message_bytes` are skipped.
+
+        Returns:
+            list: One dict per attachment with "filename", "path", "sha256" and "size".
+        """
+        attachments = []
+        total = 0
+        for part in msg.walk():
+            if part.is_multipart():
+                continue
+            disposition = part.get_content_disposition()
+            raw_filename = part.get_filename()
+            if disposition != "attachment" and not (raw_filename and disposition is None):
+                continue
+
+            filename = _safe_filename(str(make_header(decode_header(raw_filename))) if raw_filename else None)
+            encoding = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+            payload = part.get_payload()
+            if not isinstance(payload, str):
+                continue
+
+            estimated = len(payload) * 3 // 4 if encoding == "base64" else len(payload)
+            if total + estimated > self.max_message_bytes:
+                print(f"Skipping attachment '{filename}': over the {self.max_message_bytes // (1024 * 1024)}MB per-message cap")
+                self.files_skipped += 1
+                continue
+
+            hasher = hashlib.sha256()
+            fd, tmp_path = tempfile.mkstemp(dir=self.temp_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    if encoding == "base64":
+                        size = _decode_base64_to_file(payload, f, hasher)
+                    else:
+                        data = part.get_payload(decode=True) or b""
+                        f.write(data)
+                        hasher.update(data)
+                        size = len(data)
+            except (binascii.Error, ValueError) as e:
+                os.remove(tmp_path)
+                print(f"Error decoding attachment '{filename}': {e}")
+                self.errors += 1
+                continue
+
+            total += size
+            attachments.append(self._store(tmp_path, filename, hasher.hexdigest(), size))
+        return attachments
+
+    def extract_from_chilkat(self, email_obj):
+        """Saves the attachments of a Chilkat email object into temporary files.
+
+        Chilkat writes each attachment to disk itself; the file is then hashed in chunks for deduplication.
+
+        Returns:
+            list: One dict per attachment with "filename", "path", "sha256" and "size".
+        """
+        attachments = []
+        total = 0
+        for i in range(email_obj.get_NumAttachments()):
+            filename = _safe_filename(email_obj.getAttachmentFilename(i))
+            size = email_obj.GetAttachmentSize(i)
+            if total + size > self.max_message_bytes:
+                print(f"Skipping attachment '{filename}': over the {self.max_message_bytes // (1024 * 1024)}MB per-message cap")
+                self.files_skipped += 1
+                continue
+
+            save_dir = tempfile.mkdtemp(dir=self.temp_dir)
+            email_obj.put_OverwriteExisting(True)
+            if not email_obj.SaveAttachedFile(i, save_dir):
+                print(f"Error saving attachment '{filename}': {email_obj.lastErrorText()}")
+                shutil.rmtree(save_dir, ignore_errors=True)
+                self.errors += 1
+                continue
+
+            saved_path = os.path.join(save_dir, email_obj.getAttachmentFilename(i))
+            hasher = hashlib.sha256()
+            with open(saved_path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                    hasher.update(chunk)
+
+            total += size
+            attachments.append(self._store(saved_path, filename, hasher.hexdigest(), size))
+            shutil.rmtree(save_dir, ignore_errors=True)
+        return attachments
+
+    def forward(self, page_id, attachments):
+        """Queues attachments for upload to a Notion page.
+
+        Each distinct file is uploaded once with NotionHelper.upload_file; later occurrences reuse the
+        file upload id and only attach it.
+        """
+        if self.started is None:
+            self.started = time.perf_counter()
+
+        for attachment in attachments:
+            sha256 = attachment["sha256"]
+            if (page_id, sha256) in self._queued:
+                continue
+            self._queued.add((page_id, sha256))
+            with self._lock:
+                entry = self._uploads.get(sha256)
+                if entry is None:
+                    entry = {"upload_id": None, "pending": [page_id]}
+                    self._uploads[sha256] = entry
+                    self._futures.append(self.executor.submit(self._upload_and_attach, attachment, entry))
+                elif entry["upload_id"] is None:
+                    entry["pending"].append(page_id)
+                else:
+                    self._futures.append(
+                        self.executor.submit(self._attach, page_id, entry["upload_id"], attachment)
+                    )
+
+    def _attach(self, page_id, upload_id, attachment):
+        try:
+            self.notion_helper.attach_file_to_page(page_id, upload_id)
+        except Exception as e:
+            print(f"Failed to attach '{attachment['filename']}' to Notion page {page_id}: {e}")
+            with self._lock:
+                self.errors += 1
+            return
+        with self._lock:
+            self.files_attached += 1
+
+    def _upload_and_attach(self, attachment, entry):
+        try:
+            upload_id = self.notion_helper.upload_file(attachment["path"])["id"]
+        except Exception as e:
+            with self._lock:
+                # Forget the failed upload so a later email carrying the same file tries again
+                self._uploads.pop(attachment["sha256"], None)
+                self.errors += 1
+                pages = entry["pending"]
+            print(f"Failed to upload '{attachment['filename']}' for {len(pages)} Notion page(s): {e}")
+            return
+
+        with self._lock:
+            self.bytes_uploaded += attachment["size"]
+            self.files_uploaded += 1
+
+        # Attach to every page that asked for this file, including ones queued while we were uploading
+        while True:
+            with self._lock:
+                pages = entry["pending"]
+                entry["pending"] = []
+                if not pages:
+                    entry["upload_id"] = upload_id
+                    return
+            for page_id in pages:
+                self._attach(page_id, upload_id, attachment)
+
+    def close(self):
+        """Waits for all queued uploads, prints a throughput summary and removes the temporary files.
+
+        Returns:
+            dict: Counters for the run, including "mb_per_sec" upload throughput.
+        """
+        for future in self._futures:
+            future.result()
+        self.executor.shutdown()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        stats = {
+            "files_uploaded": self.files_uploaded,
+            "files_attached": self.files_attached,
+            "files_skipped": self.files_skipped,
+            "errors": self.errors,
+            "bytes_uploaded": self.bytes_uploaded,
+            "seconds": round(elapsed, 3),
+            "mb_per_sec": round(self.bytes_uploaded / (1024 * 1024) / elapsed, 3) if elapsed else 0.0,
+        }
+        if self.errors:
+            tracing.count("attachment_errors", self.errors)
+        if self.files_attached or self.errors:
+            print(
+                f"Attachments: {stats['files_attached']} attached ({stats['files_uploaded']} unique uploads, "
+                f"{self.bytes_uploaded / (1024 * 1024):.1f}MB at {stats['mb_per_sec']}MB/s), "
+                f"{stats['files_skipped']} skipped, {stats['errors']} errors"
+            )
+        return stats
@@ -0,0 +1,438 @@
+import errno
+import os
+import shutil
+import stat
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.manifest import hash_file, new_hasher
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Copy engine used by backup.py. It walks the source with os.scandir on the calling thread (creating
+# directories as it goes) and hands file copies to a bounded thread pool. File data is copied inside the
+# kernel where possible: a reflink clone (FICLONE) on copy-on-write filesystems, then copy_file_range or
+# sendfile on Linux; other platforms use shutil.copyfile, which already uses fcopyfile on macOS.
+#
+# When given the previous snapshot as `link_dest`, files whose size and mtime are unchanged are
+# hard-linked instead of copied (rsync --link-dest style). Every snapshot is still a complete tree.
+# "Unchanged" is decided from the previous snapshot's manifest, which records the source's own size and
+# exact mtime; the backup volume may store mtimes more coarsely (HFS+: 1 s, FAT/exFAT: 2 s). Only when the
+# previous snapshot has no manifest are its files stat'ed, allowing for that resolution.
+#
+# With a `hash_algorithm` the engine also builds the snapshot's hash manifest. Data then has to pass
+# through user space, so copied files are read once, hashed and written in the same loop instead of
+# using the kernel fast paths; hard-linked files take their hash from the previous snapshot's manifest.
+#
+# With a `journal` (utils.journal.CopyJournal) the copy is resumable: files are copied to a temporary name,
+# fsync'd and renamed into place, each finished file is journalled, and a resumed run skips journalled files whose
+# source is unchanged and removes anything left in the destination that the source no longer has (also
+# when the run died before journalling anything).
+
+# FAT/exFAT volumes store mtimes with 2 second resolution, so a snapshot without a manifest on one may
+# differ from its source by that much
+MTIME_TOLERANCE_NS = 2_000_000_000
+COARSE_MTIME_FILESYSTEMS = {"vfat", "msdos", "fat", "exfat"}
+
+COPY_WORKERS = 8
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+PARTIAL_COPY_SUFFIX = ".partial-copy"
+
+# errno values meaning "this copy method is not available here", as opposed to a real I/O error
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+
+def mtime_tolerance_ns(path):
+    """Returns the mtime drift to allow for files stored under `path`: MTIME_TOLERANCE_NS on FAT/exFAT, else 0.
+
+    The filesystem type is read from /proc/mounts, so outside Linux mtimes are always compared exactly.
+    """
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return 0
+    path = os.path.realpath(path)
+    mount_point, fstype = "", ""
+    for point, kind in mounts:
+        point = point.replace("\\040", " ")  # /proc/mounts escapes spaces
+        if (path == point or path.startswith(point.rstrip("/") + "/")) and len(point) > len(mount_point):
+            mount_point, fstype = point, kind
+    return MTIME_TOLERANCE_NS if fstype in COARSE_MTIME_FILESYSTEMS else 0
+
+
+def _unchanged(src_stat, previous_path, previous_entry=None, tolerance_ns=0):
+    """Returns True if the previous copy of a file has the same size and mtime as `src_stat`.
+
+    With a `previous_entry` (size, mtime, digest) from the previous manifest the source's recorded mtime
+    must match exactly. Otherwise the file at `previous_path` is stat'ed and its mtime may differ by
+    `tolerance_ns`, or by up to a second if it was stored without a sub-second part (HFS+).
+    """
+    if previous_entry is not None:
+        return previous_entry[0] == src_stat.st_size and previous_entry[1] == src_stat.st_mtime
+    try:
+        previous_stat = os.stat(previous_path)
+    except OSError:
+        return False
+    if previous_stat.st_mtime_ns % 1_000_000_000 == 0:
+        tolerance_ns = max(tolerance_ns, 999_999_999)
+    return (
+        stat.S_ISREG(previous_stat.st_mode)
+        and previous_stat.st_size == src_stat.st_size
+        and abs(previous_stat.st_mtime_ns - src_stat.st_mtime_ns) <= tolerance_ns
+    )
+
+
+def _copy_data_linux(fsrc, fdst, size):
+    """Copies file data between open files using the fastest kernel mechanism available."""
+    if fcntl is not None:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_CHUNK_SIZE)
+                if copied == 0:
+                    break
+                offset += copied
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED or offset:
+                raise
+
+    try:
+        while offset < size:
+            sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, COPY_CHUNK_SIZE)
+            if sent == 0:
+                break
+            offset += sent
+        return
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED or offset:
+            raise
+
+    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+
+def copy_file(src_path, dst_path, fsync=False):
+    """Copies one file's data and metadata (mode, mtime), offloading the data copy to the kernel.
+
+    With `fsync` the data is flushed to disk before the metadata is copied.
+    """
+    if sys.platform.startswith("linux"):
+        with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+            _copy_data_linux(fsrc, fdst, os.fstat(fsrc.fileno()).st_size)
+            if fsync:
+                os.fsync(fdst.fileno())
+    else:
+        shutil.copyfile(src_path, dst_path)
+        if fsync:
+            # Still writable: copystat has not applied the source's mode yet
+            fd = os.open(dst_path, os.O_WRONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    shutil.copystat(src_path, dst_path)
+
+
+def copy_and_hash_file(src_path, dst_path, algorithm, fsync=False):
+    """Copies one file's data and metadata, hashing the data on the way through; returns the hex digest.
+
+    With `fsync` the data is flushed to disk before the metadata is copied.
+    """
+    hasher = new_hasher(algorithm)
+    with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+        for chunk in iter(lambda: fsrc.read(COPY_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            fdst.write(chunk)
+        if fsync:
+            fdst.flush()
+            os.fsync(fdst.fileno())
+    shutil.copystat(src_path, dst_path)
+    return hasher.hexdigest()
+
+
+def _backup_file(
+    src_path, dst_path, previous_path, hash_algorithm=None, previous_entry=None, atomic=False, tolerance_ns=0
+):
+    """Hard-links `dst_path` from `previous_path` if the file is unchanged, otherwise copies it.
+
+    With `atomic` the copy is written to a temporary name, fsync'd and renamed over `dst_path`, and an
+    existing `dst_path` (left by an interrupted run) is replaced. `previous_entry` is the file's entry in the previous
+    manifest, if it has one; `tolerance_ns` is the mtime drift still taken as unchanged without it (see
+    mtime_tolerance_ns).
+
+    Returns:
+        tuple: ("linked" or "copied", size in bytes, mtime, hex digest or None).
+    """
+    src_stat = os.stat(src_path)
+    if previous_path and _unchanged(src_stat, previous_path, previous_entry, tolerance_ns):
+        try:
+            try:
+                os.link(previous_path, dst_path)
+            except FileExistsError:
+                if not atomic:
+                    raise
+                os.unlink(dst_path)
+                os.link(previous_path, dst_path)
+            digest = None
+            if hash_algorithm:
+                if previous_entry and previous_entry[2] is not None:
+                    digest = previous_entry[2]
+                else:
+                    digest = hash_file(dst_path, hash_algorithm)  # no manifest, or one with another algorithm
+            return "linked", src_stat.st_size, src_stat.st_mtime, digest
+        except OSError:
+            pass  # the volume may not support hard links (exFAT); fall back to copying
+    target_path = dst_path + PARTIAL_COPY_SUFFIX if atomic else dst_path
+    if hash_algorithm:
+        digest = copy_and_hash_file(src_path, target_path, hash_algorithm, fsync=atomic)
+    else:
+        copy_file(src_path, target_path, fsync=atomic)
+        digest = None
+    if atomic:
+        os.replace(target_path, dst_path)
+    return "copied", src_stat.st_size, src_stat.st_mtime, digest
+
+
+class _CachedEntry:
+    """Stand-in for os.DirEntry when a directory listing comes from the scan cache."""
+
+    __slots__ = ("name", "path", "_is_dir")
+
+    def __init__(self, name, path, is_dir):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return not self._is_dir
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def walk_tree(source, ignore=None, exclude=None, errors=None, scan_cache=None, relative_path=""):
+    """Yields (relative_path, entry, is_dir) for everything under `source`, parents before children.
+
+    Entries are os.DirEntry objects (or equivalents with .name, .path, .is_dir() and .stat()).
+    Symlinks are followed, like shutil.copytree(symlinks=False).
+
+    Parameters:
+        source (str): Directory to walk.
+        ignore (callable, optional): Called as ignore(directory, names); returns the names to skip.
+        exclude (PathMatcher, optional): Exclusion rules (see utils.exclude); excluded directories are
+                                         never descended into.
+        errors (list, optional): If given, unreadable subdirectories are recorded as (path, reason) and
+                                 skipped instead of raising.
+        scan_cache (ScanCache, optional): Reuses the filtered listing of directories whose mtime is unchanged.
+    """
+    directory = os.path.join(source, relative_path) if relative_path else source
+    try:
+        listing = None
+        if scan_cache is not None:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            listing = scan_cache.get(relative_path, mtime_ns)
+
+        if listing is not None:
+            entries = [
+                (_CachedEntry(name, os.path.join(directory, name), is_dir), is_dir) for name, is_dir in listing
+            ]
+        else:
+            with os.scandir(directory) as it:
+                scanned = sorted(it, key=lambda entry: entry.name)
+            skipped = set(ignore(directory, [entry.name for entry in scanned])) if ignore else set()
+
+            entries = []
+            for entry in scanned:
+                if entry.name in skipped:
+                    continue
+                is_dir = entry.is_dir()
+                if not is_dir and not entry.is_file():
+                    continue  # broken symlinks, sockets, fifos
+                child = f"{relative_path}/{entry.name}" if relative_path else entry.name
+                if exclude is not None and exclude.excluded(child, is_dir):
+                    continue
+                entries.append((entry, is_dir))
+
+            if scan_cache is not None:
+                scan_cache.put(relative_path, mtime_ns, [[entry.name, is_dir] for entry, is_dir in entries])
+    except OSError as e:
+        if errors is None or not relative_path:
+            raise
+        errors.append((directory, str(e)))
+        return
+
+    for entry, is_dir in entries:
+        child = f"{relative_path}/{entry.name}" if relative_path else entry.name
+        yield child, entry, is_dir
+        if is_dir:
+            yield from walk_tree(source, ignore, exclude, errors, scan_cache, child)
+
+
+def _remove_unvisited(destination, visited):
+    """Deletes what a leftover destination holds beyond the relative paths in `visited`."""
+    for root, dir_names, file_names in os.walk(destination):
+        relative_root = os.path.relpath(root, destination).replace(os.sep, "/")
+        relative_root = "" if relative_root == "." else relative_root + "/"
+        for name in file_names:
+            if relative_root + name not in visited:
+                os.unlink(os.path.join(root, name))
+        for name in list(dir_names):
+            if relative_root + name not in visited:
+                shutil.rmtree(os.path.join(root, name))
+                dir_names.remove(name)
+
+
+def copy_tree(
+    source,
+    destination,
+    ignore=None,
+    link_dest=None,
+    workers=COPY_WORKERS,
+    hash_algorithm=None,
+    previous_hashes=None,
+    exclude=None,
+    scan_cache=None,
+    journal=None,
+):
+    """Copies `source` to `destination` in parallel, hard-linking unchanged files from `link_dest`.
+
+    Parameters:
+        source (str): Directory to back up.
+        destination (str): New directory to create; it must not exist yet unless a `journal` is resumed.
+        ignore (callable, optional): Called as ignore(directory, names) like shutil.copytree's `ignore`;
+                                     returns the names to skip.
+        link_dest (str, optional): Previous snapshot of the same source. Files whose size and mtime match
+                                   are hard-linked from it; when None every file is copied.
+        workers (int, optional): Number of files copied concurrently.
+        hash_algorithm (str, optional): If set, every file is hashed while it is copied (see utils.manifest).
+        previous_hashes (dict, optional): The manifest entries of `link_dest`, from read_manifest. They decide
+                                          which files are unchanged, and hard-linked files reuse their
+                                          hashes (digests may be None) instead of being read. When None,
+                                          the files in `link_dest` are stat'ed instead.
+        exclude (PathMatcher, optional): Exclusion rules applied during the walk.
+        scan_cache (ScanCache, optional): Persistent directory listing cache for the walk.
+        journal (CopyJournal, optional): Makes the copy resumable (see utils.journal).
+
+    Returns:
+        dict: Counters with "files", "copied", "linked", "resumed", "bytes_copied", "bytes_linked", "dirs", "seconds",
+              "files_per_sec", "mb_per_sec" (bytes copied per second) and "manifest", a list of
+              [relative_path, size, mtime, hex digest] (the digest is None without a hash_algorithm).
+
+    Raises:
+        shutil.Error: After the walk finishes, if any file could not be copied; like shutil.copytree
+                      the error carries a list of (source, destination, reason) tuples.
+    """
+    started = time.perf_counter()
+    stats = {"files": 0, "copied": 0, "linked": 0, "resumed": 0, "bytes_copied": 0, "bytes_linked": 0, "dirs": 0}
+    errors = []
+    walk_errors = []
+    manifest = []
+    has_manifest = previous_hashes is not None
+    previous_hashes = previous_hashes or {}
+
+    resuming = journal is not None and journal.resumed
+    tolerance_ns = mtime_tolerance_ns(link_dest) if link_dest and not has_manifest else 0
+    # An interrupted run may have died before its first journal checkpoint, so whenever the destination
+    # already exists it can hold files the source no longer has and orphaned temporary copies
+    leftover = journal is not None and os.path.isdir(destination)
+    os.makedirs(destination, exist_ok=journal is not None)
+    directories = [(source, destination)]
+    visited = {""}  # relative paths seen in the source, to clean up a leftover destination
+
+    def collect(futures):
+        for future in futures:
+            src_path, dst_path, relative_path = pending.pop(future)
+            try:
+                outcome, size, mtime, digest = future.result()
+            except OSError as e:
+                errors.append((src_path, dst_path, str(e)))
+                continue
+            manifest.append([relative_path, size, mtime, digest])
+            if journal is not None:
+                journal.record(relative_path, size, mtime, digest)
+            stats["files"] += 1
+            stats[outcome] += 1
+            stats[f"bytes_{outcome}"] += size
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for relative_path, entry, is_dir in walk_tree(
+            source, ignore=ignore, exclude=exclude, errors=walk_errors, scan_cache=scan_cache
+        ):
+            dst_path = os.path.join(destination, relative_path)
+            if leftover:
+                visited.add(relative_path)
+            if is_dir:
+                os.makedirs(dst_path, exist_ok=True)
+                directories.append((entry.path, dst_path))
+                continue
+
+            if resuming:
+                entry_stat = entry.stat()
+                committed = journal.committed(relative_path, entry_stat.st_size, entry_stat.st_mtime)
+                if committed is not None:
+                    manifest.append([relative_path, *committed])
+                    stats["files"] += 1
+                    stats["resumed"] += 1
+                    continue
+
+            previous_path = os.path.join(link_dest, relative_path) if link_dest else None
+            if has_manifest and relative_path not in previous_hashes:
+                previous_path = None  # new since the previous snapshot
+            future = executor.submit(
+                _backup_file,
+                entry.path,
+                dst_path,
+                previous_path,
+                hash_algorithm,
+                previous_hashes.get(relative_path),
+                journal is not None,
+                tolerance_ns,
+            )
+            pending[future] = (entry.path, dst_path, relative_path)
+
+            # Keep the queue bounded so huge trees do not pile up millions of futures
+            if len(pending) >= workers * 4:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(pending))
+
+    if leftover:
+        _remove_unvisited(destination, visited)
+
+    # Directory metadata last (deepest first), since creating files inside a directory changes its mtime
+    for src_dir, dst_dir in reversed(directories):
+        try:
+            shutil.copystat(src_dir, dst_dir)
+        except OSError as e:
+            errors.append((src_dir, dst_dir, str(e)))
+    stats["dirs"] = len(directories)
+
+    errors.extend((path, path, reason) for path, reason in walk_errors)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    elapsed = stats["seconds"] or 1e-9
+    stats["files_per_sec"] = round(stats["files"] / elapsed, 1)
+    stats["mb_per_sec"] = round(stats["bytes_copied"] / (1024 * 1024) / elapsed, 1)
+    stats["manifest"] = manifest
+
+    if errors:
+        raise shutil.Error(errors)
+    return stats
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+# Exclusion rules and the persistent scan cache used by copy_engine.walk_tree.
+#
+# Rules follow .gitignore syntax:
+#   *.log          a name anywhere in the tree          build/     directories only
+#   data/raw/**    a path relative to the source root   /notes.md  anchored to the root
+#   !keep.log      re-include something an earlier rule excluded (the last matching rule wins)
+# Excluded directories are never descended into, so nothing below them can be re-included.
+
+
+def _glob_to_regex(pattern):
+    """Translates one gitignore glob (without !, leading / or trailing /) into a regular expression."""
+    i = 0
+    out = []
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end + 1
+        elif c == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+class PathMatcher:
+    """
+    A compiled set of gitignore-style exclude/include rules.
+
+    When there are no `!` rules every pattern is folded into at most four combined regular expressions
+    (name or path, any entry or directories only), so a lookup is a handful of regex matches however
+    many rules there are. With `!` rules the rules are checked newest first and the first match decides.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [p.strip() for p in patterns if p.strip() and not p.strip().startswith("#")]
+        self.rules = []
+        for pattern in self.patterns:
+            negate = pattern.startswith("!")
+            if negate:
+                pattern = pattern[1:]
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            # Patterns without an inner slash match a name at any depth; the rest match the relative path
+            anchored = "/" in pattern
+            pattern = pattern.lstrip("/")
+            regex = _glob_to_regex(pattern)
+            self.rules.append((re.compile(regex + r"\Z"), negate, dir_only, anchored))
+
+        self.has_negations = any(rule[1] for rule in self.rules)
+        if not self.has_negations:
+            self._combined = {}
+            for dir_only in (False, True):
+                for anchored in (False, True):
+                    parts = [r.pattern for r, _, d, a in self.rules if d == dir_only and a == anchored]
+                    self._combined[(dir_only, anchored)] = re.compile("|".join(f"(?:{p})" for p in parts)) if parts else None
+
+    @property
+    def key(self):
+        """A short digest of the rules, used to invalidate caches built under different rules."""
+        return hashlib.sha1("\n".join(self.patterns).encode("utf-8")).hexdigest()[:16]
+
+    def excluded(self, relative_path, is_dir):
+        """Returns True if the entry at `relative_path` (relative to the source root) is excluded."""
+        name = relative_path.rpartition("/")[2]
+        if not self.has_negations:
+            for (dir_only, anchored), regex in self._combined.items():
+                if regex is None or (dir_only and not is_dir):
+                    continue
+                if regex.match(relative_path if anchored else name):
+                    return True
+            return False
+
+        for regex, negate, dir_only, anchored in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path if anchored else name):
+                return not negate
+        return False
+
+
+class ScanCache:
+    """
+    Persistent cache of directory listings, keyed by each directory's mtime.
+
+    A directory's mtime changes whenever an entry is added, removed or renamed in it, so while it is
+    unchanged the walk reuses the cached, already-filtered listing instead of calling os.scandir and
+    re-evaluating the exclusion rules. File contents do not affect directory mtimes, so files are
+    still stat'ed by the copy engine as usual.
+    """
+
+    # Directories modified this recently are not cached: their mtime could still change within the same tick
+    RACY_SECONDS = 2.0
+
+    def __init__(self, path, key=""):
+        self.path = path
+        self.key = key
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.started = time.time()
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("key") == key:
+                    self.entries = data["dirs"]
+            except (OSError, ValueError, KeyError):
+                self.entries = {}
+        self._seen = {}
+
+    def get(self, relative_dir, mtime_ns):
+        """Returns the cached [[name, is_dir], ...] listing for a directory, or None if it changed."""
+        cached = self.entries.get(relative_dir)
+        if cached is not None and cached[0] == mtime_ns:
+            self.hits += 1
+            self._seen[relative_dir] = cached
+            return cached[1]
+        self.misses += 1
+        return None
+
+    def put(self, relative_dir, mtime_ns, listing):
+        """Records the filtered listing of a directory."""
+        if mtime_ns / 1e9 < self.started - self.RACY_SECONDS:
+            self._seen[relative_dir] = [mtime_ns, listing]
+
+    def save(self):
+        """Writes the directories seen during this walk back to disk atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"key": self.key, "dirs": self._seen}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
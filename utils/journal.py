@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import shutil
+import time
+
+# Copy journal for resumable directory backups. While a snapshot is being written, every file the copy
+# engine finishes is recorded as [relative_path, size, mtime, digest]. Records are published in numbered
+# segment files; each segment is written to a temporary name and renamed into place, so a segment is
+# either complete or absent, and a checkpoint only writes what is new since the last one. The copy engine
+# fsyncs every file before renaming it into place, and before a segment is published the directories
+# holding its files are fsync'd too, so a journalled file is really on the disk. No global sync(): on
+# macOS it only schedules the writes.
+#
+# A resumed run replays the segments and skips every file whose source still has the recorded size and
+# mtime; the others are copied again.
+
+CHECKPOINT_SECONDS = 5.0
+CHECKPOINT_FILES = 1000
+
+
+def fsync_directory(path):
+    """Flushes a directory's entries (new and renamed files) to disk; a no-op on Windows."""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CopyJournal:
+    """
+    Per-file progress journal of one in-progress snapshot.
+
+    Methods
+    -------
+    committed(relative_path, size, mtime):
+        Returns the journalled (size, mtime, digest) if the file was already copied from an identical source.
+
+    record(relative_path, size, mtime, digest):
+        Notes a finished file; checkpoints every CHECKPOINT_SECONDS or CHECKPOINT_FILES files.
+
+    checkpoint():
+        Flushes copied data to disk and publishes the pending records as a new segment.
+
+    remove():
+        Deletes the journal once its snapshot is complete.
+    """
+
+    def __init__(self, path, destination=None):
+        """Opens (or starts) the journal stored in directory `path`.
+
+        `destination` is the snapshot directory the journalled paths are relative to; the directories
+        holding them are fsync'd at each checkpoint.
+        """
+        self.path = path
+        self.destination = destination
+        self.entries = {}
+        self.pending = []
+        self.segments = 0
+        self.last_checkpoint = time.monotonic()
+
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if not name.endswith(".json.gz"):
+                    continue  # a segment that was never renamed into place
+                try:
+                    with gzip.open(os.path.join(path, name), "rt", encoding="utf-8") as f:
+                        records = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                for relative_path, size, mtime, digest in records:
+                    self.entries[relative_path] = (size, mtime, digest)
+                self.segments += 1
+        else:
+            os.makedirs(path)
+
+    @property
+    def resumed(self):
+        """True if the journal already held progress from an earlier run."""
+        return bool(self.entries)
+
+    def committed(self, relative_path, size, mtime):
+        """Returns the journalled (size, mtime, digest) of a file copied from an identical source, or None."""
+        entry = self.entries.get(relative_path)
+        if entry is not None and entry[0] == size and entry[1] == mtime:
+            return entry
+        return None
+
+    def record(self, relative_path, size, mtime, digest):
+        """Notes a file that has been copied into place."""
+        self.entries[relative_path] = (size, mtime, digest)
+        self.pending.append([relative_path, size, mtime, digest])
+        if len(self.pending) >= CHECKPOINT_FILES or time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Flushes copied data to disk and publishes the pending records as a new segment."""
+        self.last_checkpoint = time.monotonic()
+        if not self.pending:
+            return
+        # The journal must never get ahead of the data it describes: the files were fsync'd when they were
+        # copied, their directory entries (renames and hard links) are made durable here
+        if self.destination is not None:
+            for directory in {os.path.dirname(os.path.join(self.destination, record[0])) for record in self.pending}:
+                fsync_directory(directory)
+        segment_path = os.path.join(self.path, f"{self.segments:08d}.json.gz")
+        tmp_path = segment_path + ".tmp"
+        with open(tmp_path, "wb") as raw:
+            with gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(self.pending, f, separators=(",", ":"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, segment_path)
+        fsync_directory(self.path)
+        self.segments += 1
+        self.pending = []
+
+    def remove(self):
+        """Deletes the journal once its snapshot is complete."""
+        shutil.rmtree(self.path, ignore_errors=True)
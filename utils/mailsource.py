@@ -0,0 +1,141 @@
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import tracing
+
+# Offline input for the triage pipeline: messages are read from mbox files and Maildir directories
+# instead of IMAP. An mbox file is memory-mapped and split on "From " lines, so only the byte range of
+# each message is recorded and the file is never read into memory as a whole. Maildir messages are the
+# files in cur/ and new/.
+#
+# A message is identified by its location, (path, start, end) for mbox and (path, None, None) for a
+# Maildir file. Parsing runs on a process pool: workers receive batches of locations, read the bytes
+# themselves and send back only the parsed fields, so raw messages never cross the process boundary.
+# Results come back in mailbox order with a bounded number of batches in flight.
+
+BATCH_MESSAGES = 200
+MAILDIR_SUBDIRS = ("cur", "new")
+
+# mboxrd quoting: ">From " at the start of a body line was written for "From ", ">>From " for ">From "
+_QUOTED_FROM = re.compile(rb"^>(>*From )", re.MULTILINE)
+
+
+def mbox_offsets(path):
+    """Yields the (start, end) byte range of every message in an mbox file, without its "From " line."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if m[:5] == b"From ":
+                position = 0
+            else:
+                position = m.find(b"\nFrom ") + 1
+                if position == 0:
+                    return  # not an mbox file
+            while position < size:
+                following = m.find(b"\nFrom ", position)
+                end = size if following == -1 else following + 1
+                header_start = m.find(b"\n", position, end) + 1 or end
+                yield header_start, end
+                position = end
+
+
+def maildir_files(path):
+    """Yields the message files of a Maildir, oldest first (Maildir names start with the delivery time)."""
+    subdirs = [os.path.join(path, name) for name in MAILDIR_SUBDIRS if os.path.isdir(os.path.join(path, name))]
+    if not subdirs:
+        raise ValueError(f"{path} is not a Maildir (no cur/ or new/ directory)")
+    names = []
+    for subdir in subdirs:
+        with os.scandir(subdir) as entries:
+            names.extend((entry.name, entry.path) for entry in entries if entry.is_file() and not entry.name.startswith("."))
+    for _, file_path in sorted(names):
+        yield file_path
+
+
+def message_locations(paths):
+    """Yields the location of every message in the given mbox files and Maildir directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for file_path in maildir_files(path):
+                yield file_path, None, None
+        elif os.path.isfile(path):
+            for start, end in mbox_offsets(path):
+                yield path, start, end
+        else:
+            raise ValueError(f"No such mbox file or Maildir: {path}")
+
+
+def _read(path, start, end, mapped=None):
+    if start is None:
+        with open(path, "rb") as f:
+            return f.read()
+    if mapped is not None:
+        raw = mapped[start:end]
+    else:
+        with open(path, "rb") as f:
+            f.seek(start)
+            raw = f.read(end - start)
+    return _QUOTED_FROM.sub(rb"\1", raw)
+
+
+def read_message(location):
+    """Returns the raw bytes of the message at `location`."""
+    return _read(*location)
+
+
+def _parse_batch(parse, batch):
+    """Worker: reads and parses one batch of locations; returns [(location, size, parsed)]."""
+    results = []
+    maps = {}
+    try:
+        for location in batch:
+            path, start, end = location
+            mapped = None
+            if start is not None:
+                if path not in maps:
+                    with open(path, "rb") as f:
+                        maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                mapped = maps[path]
+            raw = _read(path, start, end, mapped)
+            results.append((location, len(raw), parse(raw)))
+    finally:
+        for mapped in maps.values():
+            mapped.close()
+    return results
+
+
+def parse_messages(paths, parse, workers=None, batch_size=BATCH_MESSAGES):
+    """
+    Parses every message in the given mbox files and Maildir directories on a process pool.
+
+    Parameters:
+        paths (list): mbox files and Maildir directories, read in this order.
+        parse (callable): Module-level function turning raw message bytes into the parsed result.
+        workers (int): Worker processes (default: one per CPU).
+        batch_size (int): Messages sent to a worker at a time.
+
+    Returns:
+        Iterator of (location, size in bytes, parsed result), in mailbox order.
+    """
+    workers = workers or os.cpu_count() or 1
+    locations = message_locations(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = []
+        exhausted = False
+        while True:
+            # Keep every worker busy with a batch queued behind it
+            while not exhausted and len(in_flight) < workers * 2:
+                batch = [location for _, location in zip(range(batch_size), locations)]
+                if not batch:
+                    exhausted = True
+                    break
+                in_flight.append(executor.submit(_parse_batch, parse, batch))
+            if not in_flight:
+                return
+            with tracing.span("parse_wait"):
+                results = in_flight.pop(0).result()
+            yield from results
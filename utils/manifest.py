@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Per-snapshot hash manifests for directory backups. The manifest sits next to the snapshot directory as
+# "<snapshot>.manifest.jsonl.gz": a header line followed by one [path, size, mtime, hash] line per file.
+# Hashes are computed by the copy engine while it copies, so writing a manifest costs no extra read.
+
+MANIFEST_SUFFIX = ".manifest.jsonl.gz"
+HASH_CHUNK_SIZE = 1024 * 1024
+VERIFY_WORKERS = 8
+
+
+def default_algorithm():
+    """Returns "xxh3_128" when the xxhash package is installed, otherwise "blake2b"."""
+    return "xxh3_128" if xxhash is not None else "blake2b"
+
+
+def new_hasher(algorithm):
+    """Returns a fresh hash object for `algorithm`."""
+    if algorithm == "xxh3_128":
+        return xxhash.xxh3_128()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError(f"Unknown hash algorithm: {algorithm}")
+
+
+def hash_file(path, algorithm):
+    """Returns the hex digest of a file, read in bounded chunks."""
+    hasher = new_hasher(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def manifest_path(snapshot_path):
+    """Returns the path of the manifest belonging to a snapshot directory."""
+    return snapshot_path.rstrip("/") + MANIFEST_SUFFIX
+
+
+def write_manifest(snapshot_path, entries, algorithm, source):
+    """Writes the manifest for a snapshot atomically.
+
+    Parameters:
+        snapshot_path (str): The snapshot directory.
+        entries (list): [relative_path, size, mtime, hex digest] for every file in the snapshot.
+        algorithm (str): The hash algorithm used for the digests.
+        source (str): The directory the snapshot was taken from.
+    """
+    path = manifest_path(snapshot_path)
+    tmp_path = path + ".tmp"
+    header = {
+        "version": 1,
+        "algorithm": algorithm,
+        "source": source,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "files": len(entries),
+    }
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for entry in sorted(entries):
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_manifest(snapshot_path):
+    """Returns (header, {relative_path: (size, mtime, digest)}) for a snapshot, or (None, {}) if it has none."""
+    path = manifest_path(snapshot_path)
+    if not os.path.exists(path):
+        return None, {}
+    entries = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        for line in f:
+            relative_path, size, mtime, digest = json.loads(line)
+            entries[relative_path] = (size, mtime, digest)
+    return header, entries
+
+
+def verify_snapshot(snapshot_path, workers=VERIFY_WORKERS, sample=None, seed=None):
+    """Re-hashes a snapshot against its manifest on a thread pool.
+
+    Parameters:
+        snapshot_path (str): The snapshot directory.
+        workers (int, optional): Number of files hashed concurrently.
+        sample (float, optional): Fraction (0-1] of files to check, chosen at random, for spot checks.
+        seed (int, optional): Seed for the sample, to repeat a spot check exactly.
+
+    Returns:
+        dict: "checked", "bytes", "missing" and "mismatched" (lists of (path, reason)), "seconds", "mb_per_sec".
+    """
+    header, entries = read_manifest(snapshot_path)
+    if header is None:
+        raise FileNotFoundError(f"No manifest found for {snapshot_path}")
+    algorithm = header["algorithm"]
+
+    paths = sorted(entries)
+    if sample is not None and sample < 1:
+        paths = random.Random(seed).sample(paths, max(1, round(len(paths) * sample))) if paths else []
+
+    def check(relative_path):
+        size, mtime, digest = entries[relative_path]
+        path = os.path.join(snapshot_path, relative_path)
+        try:
+            actual_size = os.path.getsize(path)
+            if actual_size != size:
+                return relative_path, "mismatched", f"size {actual_size} != {size}", actual_size
+            actual = hash_file(path, algorithm)
+        except FileNotFoundError:
+            return relative_path, "missing", "file not found", 0
+        except OSError as e:
+            return relative_path, "missing", str(e), 0
+        if actual != digest:
+            return relative_path, "mismatched", f"{algorithm} {actual} != {digest}", size
+        return relative_path, "ok", None, size
+
+    started = time.perf_counter()
+    report = {"checked": 0, "bytes": 0, "missing": [], "mismatched": []}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for relative_path, status, reason, size in executor.map(check, paths):
+            report["checked"] += 1
+            report["bytes"] += size
+            if status != "ok":
+                report[status].append((relative_path, reason))
+
+    seconds = time.perf_counter() - started
+    report["seconds"] = round(seconds, 3)
+    report["mb_per_sec"] = round(report["bytes"] / (1024 * 1024) / seconds, 1) if seconds else 0.0
+    return report
@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+# NotionMirror keeps a local copy of a Notion database so repeated loads do not re-download every page.
+# Pages are stored as raw JSON in SQLite (cheap upserts by page id) and the flattened DataFrame is
+# materialised to Parquet when pyarrow/fastparquet is installed.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "notion_mirror")
+
+
+class NotionMirror:
+    """
+    A local mirror of a single Notion database.
+
+    The first sync downloads every page. Later syncs only query pages whose `last_edited_time` is on or
+    after the stored high-water mark and merge them into the local cache. Notion rounds `last_edited_time`
+    to the minute, so the boundary minute is always re-read; the upsert makes that harmless.
+
+    Pages deleted in Notion no longer appear in database queries, so an incremental sync cannot see them.
+    Pages that come back archived or in the trash are dropped; call `resync()` to remove everything else
+    that was deleted upstream.
+
+    Methods
+    -------
+    sync(full=False):
+        Brings the local cache up to date and returns the number of pages that changed.
+
+    resync():
+        Discards the local cache and performs a full sync.
+
+    get_all_pages_as_json(sync=True):
+        Returns the page properties of every mirrored page, like NotionHelper.get_all_pages_as_json.
+
+    get_all_pages_as_dataframe(sync=True, include_page_ids=True):
+        Returns the mirrored pages as a DataFrame, like NotionHelper.get_all_pages_as_dataframe.
+    """
+
+    def __init__(self, notion_helper, database_id, cache_dir=None):
+        """Opens (or creates) the local cache for `database_id` under `cache_dir`."""
+        self.notion_helper = notion_helper
+        self.database_id = database_id
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.db_path = os.path.join(self.cache_dir, f"{database_id}.sqlite")
+        self.parquet_path = os.path.join(self.cache_dir, f"{database_id}.parquet")
+
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "page_id TEXT PRIMARY KEY, created_time TEXT, last_edited_time TEXT, page TEXT)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _invalidate_parquet(self):
+        if os.path.exists(self.parquet_path):
+            os.remove(self.parquet_path)
+
+    def sync(self, full=False):
+        """Brings the local cache up to date with Notion.
+
+        Parameters:
+            full (bool, optional): If True, ignores the high-water mark and re-downloads every page,
+                                   replacing the local cache. Defaults to False.
+
+        Returns:
+            int: The number of pages inserted, updated or removed by this sync.
+        """
+        high_water_mark = None if full else self._get_meta("high_water_mark")
+
+        query_filter = None
+        if high_water_mark:
+            query_filter = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": high_water_mark},
+            }
+
+        synced_at = datetime.now(timezone.utc).isoformat()
+        changed = 0
+        newest = high_water_mark
+
+        with self.conn:
+            if high_water_mark is None:
+                self.conn.execute("DELETE FROM pages")
+
+            for page in self.notion_helper.iter_pages(self.database_id, filter=query_filter):
+                edited = page.get("last_edited_time", "")
+                if newest is None or edited > newest:
+                    newest = edited
+
+                if page.get("archived") or page.get("in_trash"):
+                    cursor = self.conn.execute("DELETE FROM pages WHERE page_id = ?", (page["id"],))
+                    changed += cursor.rowcount
+                    continue
+
+                cursor = self.conn.execute(
+                    "INSERT INTO pages (page_id, created_time, last_edited_time, page) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(page_id) DO UPDATE SET last_edited_time = excluded.last_edited_time, "
+                    "page = excluded.page WHERE pages.page <> excluded.page",
+                    (page["id"], page.get("created_time", ""), edited, json.dumps(page["properties"])),
+                )
+                changed += cursor.rowcount
+
+            if newest:
+                self._set_meta("high_water_mark", newest)
+            self._set_meta("last_synced_at", synced_at)
+
+        if changed or high_water_mark is None:
+            self._invalidate_parquet()
+        return changed
+
+    def resync(self):
+        """Discards the local cache and re-downloads the whole database."""
+        return self.sync(full=True)
+
+    def _load_pages(self, include_page_ids):
+        pages_json = []
+        for page_id, page in self.conn.execute("SELECT page_id, page FROM pages ORDER BY created_time DESC"):
+            props = json.loads(page)
+            if include_page_ids:
+                props["notion_page_id"] = page_id
+            pages_json.append(props)
+        return pages_json
+
+    def get_all_pages_as_json(self, sync=True):
+        """Returns a list of page property dictionaries for every mirrored page.
+
+        Parameters:
+            sync (bool, optional): If True, performs an incremental sync first. Defaults to True.
+        """
+        if sync:
+            self.sync()
+        return self._load_pages(include_page_ids=False)
+
+    def get_all_pages_as_dataframe(self, sync=True, include_page_ids=True):
+        """Returns the mirrored pages as a Pandas DataFrame.
+
+        When nothing changed since the last call the DataFrame is read straight from the local Parquet file.
+
+        Parameters:
+            sync (bool, optional): If True, performs an incremental sync first. Defaults to True.
+            include_page_ids (bool, optional): If True, includes the 'notion_page_id' column. Defaults to True.
+
+        Returns:
+            pandas.DataFrame: The same shape as NotionHelper.get_all_pages_as_dataframe returns.
+        """
+        import pandas as pd
+
+        if sync:
+            self.sync()
+
+        if os.path.exists(self.parquet_path):
+            try:
+                df = pd.read_parquet(self.parquet_path)
+            except (ImportError, ValueError, OSError):
+                self._invalidate_parquet()
+            else:
+                if not include_page_ids and "notion_page_id" in df.columns:
+                    df = df.drop(columns=["notion_page_id"])
+                return df
+
+        df = self.notion_helper.pages_to_dataframe(self._load_pages(include_page_ids=True))
+        try:
+            df.to_parquet(self.parquet_path, index=False)
+        except Exception:
+            # No Parquet engine installed or a column pyarrow cannot type (e.g. mixed dicts); SQLite still
+            # holds the pages, so the next call simply flattens them again.
+            self._invalidate_parquet()
+
+        if not include_page_ids and "notion_page_id" in df.columns:
+            df = df.drop(columns=["notion_page_id"])
+        return df
+
+    def close(self):
+        """Closes the underlying SQLite connection."""
+        self.conn.close()
@@ -1,12 +1,273 @@
-import notion_client
-from notion_client import Client
 import pprint
-import pandas as pd
 import os
-import requests
+import re
+import json
+import time
+import difflib
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from email.utils import parseaddr
 
 # NotionHelper can be used in conjunction with the Streamlit APP: (Notion API JSON)[https://notioinapiassistant.streamlit.app]
+#
+# notion_client, requests and pandas are imported where they are first needed, so importing this module
+# (and the triage scripts that use it) stays cheap when no Notion call is made.
+
+# Notion API limits for rich text values
+RICH_TEXT_LIMIT = 2000  # characters per rich text object
+RICH_TEXT_MAX_SEGMENTS = 100  # rich text objects per property or block
+
+# Notion API limits for appending block children
+BLOCKS_PER_REQUEST = 100
+REQUEST_PAYLOAD_LIMIT = 450_000  # bytes; Notion rejects payloads over 500KB, keep headroom for the envelope
+
+# Raw REST access for endpoints notion_client does not cover (file uploads). NOTION_BASE_URL can point
+# every request at another server, e.g. the local stand-in used by the benchmarks.
+NOTION_BASE_URL = "https://api.notion.com"
+NOTION_VERSION = "2022-06-28"
+SINGLE_PART_LIMIT = 20 * 1024 * 1024  # larger files must use multi-part uploads
+MIN_UPLOAD_PART_SIZE = 5 * 1024 * 1024
+UPLOAD_PART_SIZE = 10 * 1024 * 1024
+UPLOAD_CONCURRENCY = 4
+
+# Requests answered with 429 rate_limited (Notion allows an average of 3 requests per second) are retried
+# after the Retry-After delay the API sends, or with exponential backoff from RATE_LIMIT_BACKOFF seconds
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_BACKOFF = 1.0
+RATE_LIMIT_MAX_WAIT = 60.0
+
+# How long a cached database schema is trusted before it is fetched from Notion again
+SCHEMA_CACHE_TTL = 300
+
+EMAIL_PATTERN = re.compile(r"^[^@\s<>]+@[^@\s<>]+\.[^@\s<>]+$")
+
+# Property types computed by Notion that cannot be written through the API
+READ_ONLY_PROPERTY_TYPES = {
+    "formula",
+    "rollup",
+    "created_time",
+    "created_by",
+    "last_edited_time",
+    "last_edited_by",
+    "unique_id",
+    "button",
+    "verification",
+}
+
+
+class NotionValidationError(ValueError):
+    """Raised when page properties do not match the cached database schema."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Invalid page properties:\n  " + "\n  ".join(errors))
+
+
+def split_rich_text(rich_text):
+    """Splits rich text objects whose content exceeds RICH_TEXT_LIMIT into several objects.
+
+    Plain strings are wrapped into text objects. Annotations and links are copied onto every piece.
+    """
+    if isinstance(rich_text, str):
+        rich_text = [{"type": "text", "text": {"content": rich_text}}]
+
+    segments = []
+    for item in rich_text:
+        text = item.get("text") if item.get("type", "text") == "text" else None
+        content = text.get("content", "") if text else ""
+        if len(content) <= RICH_TEXT_LIMIT:
+            segments.append(item)
+            continue
+        for start in range(0, len(content), RICH_TEXT_LIMIT):
+            piece = dict(item)
+            piece["text"] = dict(text, content=content[start:start + RICH_TEXT_LIMIT])
+            piece.pop("plain_text", None)
+            segments.append(piece)
+    return segments
+
+
+def split_text(text, limit=RICH_TEXT_LIMIT):
+    """Splits text into pieces of at most `limit` characters, preferring to break at whitespace."""
+    pieces = []
+    start = 0
+    while len(text) - start > limit:
+        end = start + limit
+        # Break after the last whitespace in the second half of the window, if there is one
+        cut = max(text.rfind(" ", start + limit // 2, end), text.rfind("\n", start + limit // 2, end))
+        if cut != -1:
+            end = cut + 1
+        pieces.append(text[start:end])
+        start = end
+    if start < len(text) or not pieces:
+        pieces.append(text[start:])
+    return pieces
+
+
+def encoded_size(value):
+    """Returns the size in bytes of `value` as JSON on the wire (compact UTF-8, as httpx sends it)."""
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _paragraph_block(segments):
+    return {"object": "block", "type": "paragraph", "paragraph": {"rich_text": segments}}
+
+
+def text_to_blocks(text, max_bytes=REQUEST_PAYLOAD_LIMIT):
+    """Converts arbitrarily long text into paragraph blocks that respect Notion's rich text limits.
+
+    Blank lines separate paragraphs. A paragraph longer than 2000 characters is spread across several
+    rich text segments, and it continues in the next block once a block holds 100 segments or its
+    encoded size would exceed `max_bytes` (2000 CJK characters take 6000 bytes).
+    """
+    blocks = []
+    empty_block_bytes = encoded_size(_paragraph_block([]))
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        if not paragraph:
+            continue
+        segments = []
+        block_bytes = empty_block_bytes
+        for piece in split_text(paragraph):
+            segment = {"type": "text", "text": {"content": piece}}
+            segment_bytes = encoded_size(segment) + 1  # and a comma
+            if segments and (
+                len(segments) == RICH_TEXT_MAX_SEGMENTS or block_bytes + segment_bytes > max_bytes
+            ):
+                blocks.append(_paragraph_block(segments))
+                segments = []
+                block_bytes = empty_block_bytes
+            segments.append(segment)
+            block_bytes += segment_bytes
+        blocks.append(_paragraph_block(segments))
+    return blocks
+
+
+def batch_blocks(blocks, max_blocks=BLOCKS_PER_REQUEST, max_bytes=REQUEST_PAYLOAD_LIMIT):
+    """Groups blocks into the fewest consecutive batches that fit Notion's per-request limits."""
+    batch = []
+    batch_bytes = 0
+    for block in blocks:
+        block_bytes = encoded_size(block) + 1  # and a comma
+        if batch and (len(batch) == max_blocks or batch_bytes + block_bytes > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(block)
+        batch_bytes += block_bytes
+    if batch:
+        yield batch
+
+
+def _coerce_property(name, property_type, value, errors):
+    """Returns the Notion payload for one property, appending a message to `errors` if it is invalid."""
+    # Accept both fully formed payloads ({"email": "..."}) and bare values ("...")
+    if isinstance(value, dict) and property_type in value and len(value) <= 2:
+        value = value[property_type]
+
+    if property_type in ("title", "rich_text"):
+        if value is None:
+            value = []
+        if not isinstance(value, (str, list)):
+            errors.append(f"'{name}' expects text, got {type(value).__name__}")
+            return None
+        segments = split_rich_text(value)
+        if len(segments) > RICH_TEXT_MAX_SEGMENTS:
+            errors.append(
+                f"'{name}' needs {len(segments)} rich text segments; Notion allows {RICH_TEXT_MAX_SEGMENTS}"
+            )
+            return None
+        return {property_type: segments}
+
+    if property_type == "email":
+        if value in (None, ""):
+            return {"email": None}
+        address = parseaddr(value)[1] if isinstance(value, str) else ""
+        if not EMAIL_PATTERN.match(address):
+            errors.append(f"'{name}' expects an email address, got {value!r}")
+            return None
+        return {"email": address}
+
+    if property_type == "date":
+        if isinstance(value, (datetime, date)):
+            value = {"start": value.isoformat()}
+        elif isinstance(value, str):
+            value = {"start": value}
+        if value is None or (isinstance(value, dict) and value.get("start") is None):
+            return {"date": None}
+        if not isinstance(value, dict):
+            errors.append(f"'{name}' expects a date, got {type(value).__name__}")
+            return None
+        start = value["start"]
+        value = dict(value, start=start.isoformat() if isinstance(start, (datetime, date)) else start)
+        return {"date": value}
+
+    if property_type == "number":
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            errors.append(f"'{name}' expects a number, got {value!r}")
+            return None
+        return {"number": value}
+
+    if property_type == "checkbox":
+        if not isinstance(value, bool):
+            errors.append(f"'{name}' expects True or False, got {value!r}")
+            return None
+        return {"checkbox": value}
+
+    if property_type in ("url", "phone_number"):
+        if value is not None and not isinstance(value, str):
+            errors.append(f"'{name}' expects a string, got {type(value).__name__}")
+            return None
+        return {property_type: value or None}
+
+    if property_type in ("select", "status"):
+        if isinstance(value, str):
+            value = {"name": value}
+        if value is not None and not isinstance(value, dict):
+            errors.append(f"'{name}' expects an option name, got {value!r}")
+            return None
+        return {property_type: value}
+
+    if property_type == "multi_select":
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            errors.append(f"'{name}' expects a list of option names, got {value!r}")
+            return None
+        return {"multi_select": [{"name": item} if isinstance(item, str) else item for item in value]}
+
+    if property_type in ("people", "relation", "files"):
+        if not isinstance(value, list):
+            errors.append(f"'{name}' expects a list, got {type(value).__name__}")
+            return None
+        return {property_type: value}
+
+    return {property_type: value}
+
+
+def _retry_delay(headers, attempt):
+    """Seconds to wait before retrying a rate-limited request, from its Retry-After header if it has one."""
+    try:
+        delay = float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        delay = RATE_LIMIT_BACKOFF * 2 ** attempt
+    return min(max(delay, 0.0), RATE_LIMIT_MAX_WAIT)
+
+
+def _rate_limited_transport():
+    """Returns an httpx transport for notion_client that retries 429 responses (see RATE_LIMIT_RETRIES)."""
+    import httpx
+
+    class RateLimitedTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            for attempt in range(RATE_LIMIT_RETRIES):
+                response = super().handle_request(request)
+                if response.status_code != 429:
+                    return response
+                response.close()
+                time.sleep(_retry_delay(response.headers, attempt))
+            return super().handle_request(request)
+
+    return RateLimitedTransport()
 
 
 class NotionHelper:
@@ -21,8 +282,14 @@ class NotionHelper:
     authenticate():
         Authenticates with the Notion API using a token from environment variables.
 
-    get_database(database_id):
-        Fetches the schema of a Notion database given its database_id.
+    get_database(database_id, use_cache=True):
+        Fetches the schema of a Notion database given its database_id, served from a TTL cache.
+
+    invalidate_schema(database_id=None):
+        Drops cached database schemas.
+
+    validate_page_properties(database_id, page_properties):
+        Validates and coerces page properties locally against the cached database schema.
 
     notion_search_db(database_id, query=""):
         Searches for pages in a Notion database that contain the specified query in their title.
@@ -33,12 +300,18 @@ class NotionHelper:
     create_database(parent_page_id, database_title, properties):
         Creates a new database in Notion under the specified parent page with the given title and properties.
 
-    new_page_to_db(database_id, page_properties):
+    new_page_to_db(database_id, page_properties, validate=False, children=None):
         Adds a new page to a Notion database with the specified properties.
 
     append_page_body(page_id, blocks):
         Appends blocks of text to the body of a Notion page.
 
+    append_page_text(page_id, text):
+        Appends arbitrarily long text to a page body, split into the fewest compliant requests.
+
+    new_page_with_body(database_id, page_properties, text, validate=False):
+        Creates a database page with `text` stored as its body.
+
     get_all_page_ids(database_id):
         Returns the IDs of all pages in a given Notion database.
 
@@ -48,8 +321,17 @@ class NotionHelper:
     get_all_pages_as_dataframe(database_id, limit=None):
         Returns a Pandas DataFrame representing all pages in the given database, with selected properties.
 
-    upload_file(file_path):
-        Uploads a file to Notion and returns the file upload object.
+    iter_pages(database_id, filter=None, sorts=None):
+        Yields every page object in the given database, following pagination.
+
+    pages_to_dataframe(pages_json, include_page_ids=True):
+        Flattens a list of page property dictionaries into a Pandas DataFrame.
+
+    get_database_mirror(database_id, cache_dir=None):
+        Returns a NotionMirror that keeps an incrementally synced local copy of the database.
+
+    upload_file(file_path, part_size=UPLOAD_PART_SIZE, max_workers=UPLOAD_CONCURRENCY):
+        Uploads a file to Notion and returns the file upload object, in parallel parts for files over 20MB.
 
     attach_file_to_page(page_id, file_upload_id):
         Attaches an uploaded file to a specific page.
@@ -61,28 +343,122 @@ class NotionHelper:
         Attaches a file to a Files & Media property on a specific page.
     """
 
-    def __init__(self, notion_token):
+    def __init__(self, notion_token, schema_ttl=SCHEMA_CACHE_TTL, base_url=None):
         """Initializes the NotionHelper instance and authenticates with the Notion API
-        using the provided token."""
+        using the provided token. Database schemas are cached for `schema_ttl` seconds.
+        `base_url` (default: $NOTION_BASE_URL or https://api.notion.com) selects the API server. Requests
+        Notion answers with 429 rate_limited are retried after its Retry-After delay."""
+        import httpx
+        import requests
+        from notion_client import Client
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
         self.notion_token = notion_token
-        self.notion = Client(auth=self.notion_token)
+        self.base_url = (base_url or os.getenv("NOTION_BASE_URL") or NOTION_BASE_URL).rstrip("/")
+        self.api_url = f"{self.base_url}/v1"
+        self.notion = Client(
+            auth=self.notion_token, base_url=self.base_url, client=httpx.Client(transport=_rate_limited_transport())
+        )
+        self.schema_ttl = schema_ttl
+        self._schema_cache = {}
+
+        # One pooled HTTP session for all raw REST calls (uploads and attachments)
+        self.session = requests.Session()
+        rate_limit_retry = Retry(
+            total=RATE_LIMIT_RETRIES,
+            connect=0,
+            read=0,
+            status_forcelist=[429],
+            allowed_methods=None,  # uploads are POSTs; a 429 means nothing was done, so any method can be retried
+            backoff_factor=RATE_LIMIT_BACKOFF,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=UPLOAD_CONCURRENCY * 2, max_retries=rate_limit_retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {"Authorization": f"Bearer {self.notion_token}", "Notion-Version": NOTION_VERSION}
+        )
 
-    def get_database(self, database_id):
+    def get_database(self, database_id, use_cache=True):
         """Retrieves the schema of a Notion database given its database_id.
 
+        Schemas are cached for `schema_ttl` seconds; once the TTL expires, or with `use_cache=False`, the
+        schema is fetched again and the fresh response replaces the cached one.
+
         Parameters
         ----------
         database_id : str
             The unique identifier of the Notion database.
+        use_cache : bool, optional
+            If False, always fetches the schema from Notion (the cache is still refreshed).
 
         Returns
         -------
         dict
             A dictionary representing the database schema.
         """
+        entry = self._schema_cache.get(database_id)
+        now = time.monotonic()
+        if use_cache and entry and now - entry["fetched_at"] < self.schema_ttl:
+            return entry["schema"]
+
         response = self.notion.databases.retrieve(database_id=database_id)
+        self._schema_cache[database_id] = {"schema": response, "fetched_at": now}
         return response
 
+    def invalidate_schema(self, database_id=None):
+        """Drops the cached schema for `database_id`, or every cached schema if no id is given."""
+        if database_id is None:
+            self._schema_cache.clear()
+        else:
+            self._schema_cache.pop(database_id, None)
+
+    def validate_page_properties(self, database_id, page_properties):
+        """Validates and coerces page properties against the cached database schema.
+
+        Property values may be full Notion payloads ({"email": "a@b.com"}) or bare Python values
+        ("a@b.com", datetime objects, option names). Text longer than 2000 characters is split into
+        several rich text segments, sender strings such as "Name <a@b.com>" are reduced to the address,
+        and dates with no start are sent as empty dates.
+
+        Parameters:
+            database_id (str): The identifier of the Notion database.
+            page_properties (dict): Property name (or id) to value.
+
+        Returns:
+            dict: The coerced properties, ready to send to Notion.
+
+        Raises:
+            NotionValidationError: If any property is unknown, read-only or has an invalid value.
+        """
+        schema_properties = self.get_database(database_id).get("properties", {})
+        by_id = {prop.get("id"): name for name, prop in schema_properties.items()}
+
+        errors = []
+        coerced = {}
+        for name, value in page_properties.items():
+            schema_name = name if name in schema_properties else by_id.get(name)
+            if schema_name is None:
+                suggestion = difflib.get_close_matches(name, schema_properties.keys(), n=1)
+                hint = f" (did you mean '{suggestion[0]}'?)" if suggestion else ""
+                errors.append(f"'{name}' is not a property of this database{hint}")
+                continue
+
+            property_type = schema_properties[schema_name]["type"]
+            if property_type in READ_ONLY_PROPERTY_TYPES:
+                errors.append(f"'{name}' is a read-only {property_type} property")
+                continue
+
+            payload = _coerce_property(name, property_type, value, errors)
+            if payload is not None:
+                coerced[name] = payload
+
+        if errors:
+            raise NotionValidationError(errors)
+        return coerced
+
     def notion_search_db(
         self, database_id="e18e2d110f9e401eb1adf3190e51a21b", query=""
     ):
@@ -156,15 +532,32 @@ class NotionHelper:
         response = self.notion.databases.create(**new_database)
         return response
 
-    def new_page_to_db(self, database_id, page_properties):
-        """Adds a new page to a Notion database."""
+    def new_page_to_db(self, database_id, page_properties, validate=False, children=None):
+        """Adds a new page to a Notion database.
+
+        If `validate` is True the properties are first checked and coerced against the cached schema
+        (see validate_page_properties), so invalid writes fail before any request is sent.
+        Up to 100 `children` blocks can be created together with the page.
+        """
+        if validate:
+            page_properties = self.validate_page_properties(database_id, page_properties)
 
         new_page = {
             "parent": {"database_id": database_id},
             "properties": page_properties,
         }
+        if children:
+            new_page["children"] = children
+
+        import notion_client
 
-        response = self.notion.pages.create(**new_page)
+        try:
+            response = self.notion.pages.create(**new_page)
+        except notion_client.APIResponseError as e:
+            # The schema probably changed under us; make the next validation fetch a fresh copy
+            if e.code == notion_client.APIErrorCode.ValidationError:
+                self.invalidate_schema(database_id)
+            raise
         return response
 
     def append_page_body(self, page_id, blocks):
@@ -175,6 +568,36 @@ class NotionHelper:
         response = self.notion.blocks.children.append(block_id=page_id, **new_blocks)
         return response
 
+    def append_page_text(self, page_id, text):
+        """Appends arbitrarily long text to the body of a Notion page using as few requests as possible.
+
+        The text is split into compliant paragraph blocks (see text_to_blocks) and sent in maximal
+        batches. Batches for one page are sent in order, since Notion appends children in arrival order.
+
+        Parameters:
+            page_id (str): The page (or block) to append to.
+            text (str): The text to store.
+
+        Returns:
+            list: The API response of every append request.
+        """
+        return [self.append_page_body(page_id, batch) for batch in batch_blocks(text_to_blocks(text))]
+
+    def new_page_with_body(self, database_id, page_properties, text, validate=False):
+        """Creates a database page and stores `text` as its body.
+
+        The first batch of blocks is sent with the page creation request itself, so a typical email body
+        costs a single API call. Any remaining batches are appended afterwards.
+
+        Returns:
+            dict: The API response for the created page.
+        """
+        batches = batch_blocks(text_to_blocks(text or ""))
+        page = self.new_page_to_db(database_id, page_properties, validate=validate, children=next(batches, None))
+        for batch in batches:
+            self.append_page_body(page["id"], batch)
+        return page
+
     def get_all_page_ids(self, database_id):
         """Returns the IDs of all pages in a given database."""
 
@@ -182,6 +605,30 @@ class NotionHelper:
         page_ids = [page["id"] for page in my_pages["results"]]
         return page_ids
 
+    def iter_pages(self, database_id, filter=None, sorts=None):
+        """Yields every page object in the given database, following pagination.
+
+        Parameters:
+            database_id (str): The identifier of the Notion database.
+            filter (dict, optional): A Notion query filter object.
+            sorts (list, optional): A list of Notion sort objects.
+        """
+        query = {"database_id": database_id, "page_size": 100}
+        if filter is not None:
+            query["filter"] = filter
+        if sorts is not None:
+            query["sorts"] = sorts
+
+        has_more = True
+        start_cursor = None
+        while has_more:
+            if start_cursor:
+                query["start_cursor"] = start_cursor
+            my_pages = self.notion.databases.query(**query)
+            yield from my_pages["results"]
+            has_more = my_pages.get("has_more", False)
+            start_cursor = my_pages.get("next_cursor", None)
+
     def get_all_pages_as_json(self, database_id, limit=None):
         """Returns a list of JSON objects representing all pages in the given database, with all properties.
         You can specify the number of entries to be loaded using the `limit` parameter.
@@ -253,6 +700,19 @@ class NotionHelper:
         else:
             pages_json = self.get_all_pages_as_json(database_id, limit=limit)
 
+        return self.pages_to_dataframe(pages_json, include_page_ids=include_page_ids)
+
+    def pages_to_dataframe(self, pages_json, include_page_ids=True):
+        """Flattens a list of page property dictionaries into a Pandas DataFrame.
+
+        Parameters:
+            pages_json (list): Page property dictionaries as returned by the Notion API. When
+                               include_page_ids is True each dictionary may carry a 'notion_page_id' key.
+            include_page_ids (bool, optional): If True, keeps the 'notion_page_id' column. Defaults to True.
+
+        Returns:
+            pandas.DataFrame: A DataFrame with one row per page and one column per supported property.
+        """
         data = []
         # Define the list of allowed property types that we want to extract
         allowed_properties = [
@@ -344,43 +804,108 @@ class NotionHelper:
                         row[key] = [file.get("name", "") for file in files]
             data.append(row)
 
+        import pandas as pd
+
         df = pd.DataFrame(data)
         pd.options.display.float_format = "{:.3f}".format
         return df
 
-    def upload_file(self, file_path):
-        """Uploads a file to Notion and returns the file upload object."""
+    def get_database_mirror(self, database_id, cache_dir=None):
+        """Returns a NotionMirror for the given database.
+
+        The mirror performs a full download on its first sync and afterwards only fetches pages edited since
+        the last sync, so repeated DataFrame loads are served from the local cache.
+
+        Parameters:
+            database_id (str): The identifier of the Notion database.
+            cache_dir (str, optional): Where to keep the local cache. Defaults to ~/.cache/notion_mirror.
+
+        Returns:
+            NotionMirror: The mirror object; call `get_all_pages_as_dataframe()` or `resync()` on it.
+        """
+        from utils.notion_mirror import NotionMirror
+
+        return NotionMirror(self, database_id, cache_dir=cache_dir)
+
+    def _request(self, method, path, **kwargs):
+        """Sends a raw request to the Notion REST API through the shared session and returns the JSON.
+
+        Raises requests.HTTPError for an error status (e.g. 400 or 429), so failed calls are not mistaken
+        for results."""
+        url = path if path.startswith("http") else f"{self.api_url}/{path}"
+        response = self.session.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def upload_file(self, file_path, part_size=UPLOAD_PART_SIZE, max_workers=UPLOAD_CONCURRENCY):
+        """Uploads a file to Notion and returns the file upload object.
+
+        Files up to 20MB are sent in a single request. Larger files use Notion's multi-part upload: the file
+        is read from disk one part at a time and up to `max_workers` parts are sent concurrently, so at most
+        `part_size * max_workers` bytes are held in memory.
+
+        Parameters:
+            file_path (str): Path of the file to upload.
+            part_size (int, optional): Bytes per part for multi-part uploads, between 5MB and 20MB.
+            max_workers (int, optional): Number of parts uploaded in parallel.
+
+        Returns:
+            dict: The file upload object; its "id" can be attached to pages and properties.
+        """
+        if os.path.getsize(file_path) > SINGLE_PART_LIMIT:
+            return self._upload_file_multi_part(file_path, part_size, max_workers)
+
         # Step 1: Create a File Upload object
-        create_upload_url = "https://api.notion.com/v1/file_uploads"
-        headers = {
-            "Authorization": f"Bearer {self.notion_token}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28",
-        }
-        response = requests.post(create_upload_url, headers=headers, json={})
-        upload_data = response.json()
-        print(upload_data)
+        upload_data = self._request("POST", "file_uploads", json={})
         upload_url = upload_data["upload_url"]
 
         # Step 2: Upload file contents
         with open(file_path, "rb") as f:
-            upload_headers = {
-                "Authorization": f"Bearer {self.notion_token}",
-                "Notion-Version": "2022-06-28",
-            }
             files = {'file': (os.path.basename(file_path), f, mimetypes.guess_type(file_path)[0] or 'application/octet-stream')}
-            upload_response = requests.post(upload_url, headers=upload_headers, files=files)
+            return self._request("POST", upload_url, files=files)
+
+    def _upload_file_multi_part(self, file_path, part_size, max_workers):
+        """Uploads a large file in parts streamed from disk and completes the upload."""
+        if not MIN_UPLOAD_PART_SIZE <= part_size <= SINGLE_PART_LIMIT:
+            raise ValueError(f"part_size must be between {MIN_UPLOAD_PART_SIZE} and {SINGLE_PART_LIMIT} bytes")
+
+        file_name = os.path.basename(file_path)
+        content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        number_of_parts = -(-os.path.getsize(file_path) // part_size)
+
+        # Step 1: Create a multi-part File Upload object
+        upload_data = self._request(
+            "POST",
+            "file_uploads",
+            json={
+                "mode": "multi_part",
+                "number_of_parts": number_of_parts,
+                "filename": file_name,
+                "content_type": content_type,
+            },
+        )
+        send_path = f"file_uploads/{upload_data['id']}/send"
+
+        # Step 2: Send each part; every worker reads only its own slice of the file
+        def send_part(part_number):
+            with open(file_path, "rb") as f:
+                f.seek((part_number - 1) * part_size)
+                chunk = f.read(part_size)
+            response = self.session.post(
+                f"{self.api_url}/{send_path}",
+                files={'file': (file_name, chunk, content_type)},
+                data={"part_number": str(part_number)},
+            )
+            response.raise_for_status()
 
-        return upload_response.json()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(send_part, range(1, number_of_parts + 1)))
+
+        # Step 3: Complete the upload
+        return self._request("POST", f"file_uploads/{upload_data['id']}/complete", json={})
 
     def attach_file_to_page(self, page_id, file_upload_id):
         """Attaches an uploaded file to a specific page."""
-        attach_url = f"https://api.notion.com/v1/blocks/{page_id}/children"
-        headers = {
-            "Authorization": f"Bearer {self.notion_token}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28",
-        }
         data = {
             "children": [
                 {
@@ -394,17 +919,10 @@ class NotionHelper:
                 }
             ]
         }
-        response = requests.patch(attach_url, headers=headers, json=data)
-        return response.json()
+        return self._request("PATCH", f"blocks/{page_id}/children", json=data)
 
     def embed_image_to_page(self, page_id, file_upload_id):
         """Embeds an uploaded image to a specific page."""
-        attach_url = f"https://api.notion.com/v1/blocks/{page_id}/children"
-        headers = {
-            "Authorization": f"Bearer {self.notion_token}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28",
-        }
         data = {
             "children": [
                 {
@@ -418,19 +936,12 @@ class NotionHelper:
                 }
             ]
         }
-        response = requests.patch(attach_url, headers=headers, json=data)
-        return response.json()
+        return self._request("PATCH", f"blocks/{page_id}/children", json=data)
 
     def attach_file_to_page_property(
         self, page_id, property_name, file_upload_id, file_name
     ):
         """Attaches a file to a Files & Media property on a specific page."""
-        update_url = f"https://api.notion.com/v1/pages/{page_id}"
-        headers = {
-            "Authorization": f"Bearer {self.notion_token}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28",
-        }
         data = {
             "properties": {
                 property_name: {
@@ -444,8 +955,7 @@ class NotionHelper:
                 }
             }
         }
-        response = requests.patch(update_url, headers=headers, json=data)
-        return response.json()
+        return self._request("PATCH", f"pages/{page_id}", json=data)
 
     def one_step_image_embed(self, page_id, file_path):
         """Uploads an image and embeds it in a Notion page in one step."""
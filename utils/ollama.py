@@ -1,6 +1,6 @@
-import requests
 import json
 import os
+from utils import tracing
 
 # %%
 import typing # Import typing module
@@ -51,6 +51,8 @@ def ask_ollama(
     if max_tokens is not None:
         payload["options"]["num_predict"] = max_tokens # Ollama uses num_predict for max_tokens
 
+    import requests  # imported on first use to keep module import cheap
+
     # Make the POST request
     response = None # Initialize response to None
     try:
@@ -58,9 +60,12 @@ def ask_ollama(
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
 
         result = response.json()
+        tracing.count("llm_prompt_tokens", result.get("prompt_eval_count", 0))
+        tracing.count("llm_completion_tokens", result.get("eval_count", 0))
         return result.get("response", "") # Use .get for safer access
 
     except requests.exceptions.RequestException as e:
+        tracing.count("llm_errors")
         print(f"Error calling Ollama API: {e}")
         return False
     except json.JSONDecodeError:
@@ -0,0 +1,108 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Grandfather-father-son retention for backup.py. A policy keeps the newest snapshot in each of the last
+# N hours, days, ISO weeks and months that have one (like restic's --keep-hourly/daily/weekly/monthly);
+# the newest snapshot is always kept. Everything else is expired and removed by the pruner.
+#
+# Incremental snapshots share unchanged files through hard links, so deleting a snapshot only unlinks its
+# names: data still linked from a live snapshot stays on disk and only inodes whose last link goes away
+# count towards the space reclaimed.
+
+DELETE_WORKERS = 8
+
+# Suffix given to a snapshot directory while it is being deleted, so a half-deleted tree is never
+# mistaken for a snapshot if pruning is interrupted
+DELETING_SUFFIX = ".deleting"
+
+_BUCKETS = (
+    ("hourly", lambda when: when.strftime("%Y-%m-%d %H")),
+    ("daily", lambda when: when.strftime("%Y-%m-%d")),
+    ("weekly", lambda when: "%d-W%02d" % when.isocalendar()[:2]),
+    ("monthly", lambda when: when.strftime("%Y-%m")),
+)
+
+
+def select_expired(snapshot_times, policy):
+    """Splits snapshots into the ones a retention policy keeps and the ones it expires.
+
+    Parameters:
+        snapshot_times (dict): {snapshot: datetime it was taken}.
+        policy (dict): How many "hourly", "daily", "weekly" and "monthly" snapshots to keep (missing means 0).
+
+    Returns:
+        tuple: (kept, expired), each a list of snapshots, oldest first.
+    """
+    newest_first = sorted(snapshot_times, key=snapshot_times.get, reverse=True)
+    kept = set(newest_first[:1])
+    for period, bucket in _BUCKETS:
+        count = policy.get(period, 0)
+        seen = set()
+        for snapshot in newest_first:
+            if len(seen) >= count:
+                break
+            key = bucket(snapshot_times[snapshot])
+            if key not in seen:
+                seen.add(key)
+                kept.add(snapshot)
+    oldest_first = newest_first[::-1]
+    return [s for s in oldest_first if s in kept], [s for s in oldest_first if s not in kept]
+
+
+def _unlink(path):
+    """Removes one file and returns the bytes freed: its allocated size if this was its last hard link."""
+    try:
+        file_stat = os.lstat(path)
+        os.unlink(path)
+    except FileNotFoundError:
+        return 0
+    if file_stat.st_nlink > 1:
+        return 0
+    return getattr(file_stat, "st_blocks", 0) * 512 or file_stat.st_size
+
+
+def remove_snapshot_tree(path, workers=DELETE_WORKERS):
+    """Deletes a snapshot directory, unlinking its files on a thread pool.
+
+    The directory is first renamed to "<path>.deleting"; leftovers of an interrupted run can be passed in
+    again by that name.
+
+    Returns:
+        dict: "files", "bytes_freed" (space whose last link was removed) and "seconds".
+    """
+    started = time.perf_counter()
+    if not path.endswith(DELETING_SUFFIX):
+        deleting = path + DELETING_SUFFIX
+        os.rename(path, deleting)
+        path = deleting
+
+    files = []
+    directories = []
+    for root, dir_names, file_names in os.walk(path):
+        directories.append(root)
+        files.extend(os.path.join(root, name) for name in file_names)
+        # Symlinked directories are removed as links, never followed
+        for name in dir_names:
+            if os.path.islink(os.path.join(root, name)):
+                files.append(os.path.join(root, name))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        freed = sum(executor.map(_unlink, files))
+    for directory in reversed(directories):
+        os.rmdir(directory)
+
+    return {"files": len(files), "bytes_freed": freed, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def leftover_deletions(backup_folder, prefix):
+    """Returns directories in `backup_folder` left behind by interrupted snapshot deletions."""
+    try:
+        names = os.listdir(backup_folder)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(backup_folder, name)
+        for name in sorted(names)
+        if name.startswith(prefix) and name.endswith(DELETING_SUFFIX)
+    ]
@@ -0,0 +1,67 @@
+import os
+from datetime import datetime
+
+# Snapshots are directories named "<source name>_backup_<timestamp>" inside a backup destination.
+# The timestamp format sorts lexically in chronological order. A snapshot that is still being written
+# carries PARTIAL_SUFFIX (with its copy journal next to it) and is only renamed to its final name once
+# complete, so the functions below never return an incomplete snapshot.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+SNAPSHOT_SEPARATOR = "_backup_"
+PARTIAL_SUFFIX = ".partial"
+JOURNAL_SUFFIX = ".journal"
+
+
+def snapshot_name(source_name, timestamp):
+    """Returns the directory name of the snapshot of `source_name` taken at `timestamp` (a string)."""
+    return f"{source_name}{SNAPSHOT_SEPARATOR}{timestamp}"
+
+
+def parse_snapshot_time(name):
+    """Returns the datetime encoded in a snapshot name, or None if the name is not a snapshot."""
+    _, separator, timestamp = name.rpartition(SNAPSHOT_SEPARATOR)
+    if not separator:
+        return None
+    try:
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def list_snapshots(backup_folder, source_name):
+    """Returns the paths of all snapshots of `source_name` in `backup_folder`, oldest first."""
+    prefix = f"{source_name}{SNAPSHOT_SEPARATOR}"
+    try:
+        entries = list(os.scandir(backup_folder))
+    except FileNotFoundError:
+        return []
+    names = [
+        entry.name
+        for entry in entries
+        if entry.name.startswith(prefix) and entry.is_dir() and parse_snapshot_time(entry.name)
+    ]
+    return [os.path.join(backup_folder, name) for name in sorted(names)]
+
+
+def latest_snapshot(backup_folder, source_name, exclude=None):
+    """Returns the path of the newest snapshot of `source_name`, ignoring `exclude`, or None."""
+    snapshots = [path for path in list_snapshots(backup_folder, source_name) if path != exclude]
+    return snapshots[-1] if snapshots else None
+
+
+def partial_snapshots(backup_folder, source_name):
+    """Returns the paths of unfinished snapshots of `source_name` in `backup_folder`, oldest first."""
+    prefix = f"{source_name}{SNAPSHOT_SEPARATOR}"
+    try:
+        entries = list(os.scandir(backup_folder))
+    except FileNotFoundError:
+        return []
+    names = [
+        entry.name
+        for entry in entries
+        if entry.name.startswith(prefix)
+        and entry.name.endswith(PARTIAL_SUFFIX)
+        and entry.is_dir()
+        and parse_snapshot_time(entry.name[: -len(PARTIAL_SUFFIX)])
+    ]
+    return [os.path.join(backup_folder, name) for name in sorted(names)]
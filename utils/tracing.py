@@ -0,0 +1,243 @@
+import cProfile
+import json
+import math
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Lightweight per-stage timing and counters for the triage scripts. A run is started once per process;
+# code anywhere in the pipeline then records into it through the module-level span() and count(), which
+# do nothing when no run is active, so the helpers stay usable from tests and other scripts.
+#
+# At the end of a run the metrics can be written as a JSON report and as a Prometheus text file for the
+# node_exporter textfile collector. The text file is replaced atomically, as the collector requires, and
+# holds gauges describing the last run.
+
+PERCENTILES = (50, 99)
+
+_current = None
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RunMetrics:
+    """
+    Timings and counters for one run of a pipeline.
+
+    Methods
+    -------
+    span(stage):
+        Context manager timing one pass through a stage.
+
+    count(name, value=1, **labels):
+        Adds `value` to a counter, optionally split by labels.
+
+    report():
+        Returns the run's metrics as a dictionary.
+
+    write_json(path):
+        Writes report() as JSON.
+
+    write_prometheus(path):
+        Writes the metrics in the Prometheus text format, atomically.
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.durations = {}  # stage -> [seconds]
+        self.counters = {}  # (name, ((label, value), ...)) -> number
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.durations.setdefault(stage, []).append(elapsed)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    def report(self):
+        end = self.finished or time.perf_counter()
+        stages = {}
+        for stage, durations in self.durations.items():
+            ordered = sorted(durations)
+            stages[stage] = {
+                "count": len(ordered),
+                "total_s": round(sum(ordered), 6),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+                **{f"p{p}_ms": round(_percentile(ordered, p) * 1000, 3) for p in PERCENTILES},
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        counters = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            if labels:
+                counters.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = value
+            else:
+                counters[name] = value
+        return {
+            "run": self.name,
+            "labels": self.labels,
+            "started": self.started_at.isoformat(timespec="seconds"),
+            "duration_s": round(end - self.started, 3),
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def write_json(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _prometheus_lines(self):
+        def labels(extra=()):
+            items = list(self.labels.items()) + list(extra)
+            if not items:
+                return ""
+            escaped = (
+                (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items
+            )
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        report = self.report()
+        prefix = self.name
+        lines = [
+            f"# HELP {prefix}_last_run_timestamp_seconds When the last run started.",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds{labels()} {self.started_at.timestamp():.3f}",
+            f"# HELP {prefix}_last_run_duration_seconds How long the last run took.",
+            f"# TYPE {prefix}_last_run_duration_seconds gauge",
+            f"{prefix}_last_run_duration_seconds{labels()} {report['duration_s']}",
+        ]
+        if report["stages"]:
+            for metric, field, help_text in (
+                ("stage_seconds", "total_s", "Time spent in each stage during the last run."),
+                ("stage_calls", "count", "Passes through each stage during the last run."),
+            ):
+                lines.append(f"# HELP {prefix}_{metric} {help_text}")
+                lines.append(f"# TYPE {prefix}_{metric} gauge")
+                for stage, values in report["stages"].items():
+                    lines.append(f"{prefix}_{metric}{labels([('stage', stage)])} {values[field]}")
+            lines.append(f"# HELP {prefix}_stage_latency_seconds Per-pass stage latency quantiles in the last run.")
+            lines.append(f"# TYPE {prefix}_stage_latency_seconds gauge")
+            for stage, values in report["stages"].items():
+                for p in PERCENTILES:
+                    quantile = [("stage", stage), ("quantile", str(p / 100))]
+                    lines.append(f"{prefix}_stage_latency_seconds{labels(quantile)} {values[f'p{p}_ms'] / 1000}")
+
+        names = sorted({name for name, _ in self.counters})
+        for name in names:
+            lines.append(f"# HELP {prefix}_{name} Number of {name.replace('_', ' ')} in the last run.")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for (counter, counter_labels), value in sorted(self.counters.items()):
+                if counter == name:
+                    lines.append(f"{prefix}_{name}{labels(counter_labels)} {value}")
+        return lines
+
+    def write_prometheus(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self._prometheus_lines()) + "\n")
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        """Returns a short human-readable summary of the stages and counters."""
+        report = self.report()
+        lines = [f"Run took {report['duration_s']}s"]
+        for stage, values in sorted(report["stages"].items(), key=lambda item: -item[1]["total_s"]):
+            lines.append(
+                f"  {stage:<12} {values['total_s']:>9.3f}s  {values['count']:>6}x  "
+                f"p50 {values['p50_ms']:.1f}ms  p99 {values['p99_ms']:.1f}ms"
+            )
+        for name, value in report["counters"].items():
+            lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+
+class _NoRun:
+    """Stand-in used when no run is active; records nothing."""
+
+    @contextmanager
+    def span(self, stage):
+        yield
+
+    def count(self, name, value=1, **labels):
+        pass
+
+
+_NO_RUN = _NoRun()
+
+
+def current():
+    """Returns the active RunMetrics, or a stand-in that records nothing."""
+    return _current or _NO_RUN
+
+
+def span(stage):
+    """Times one pass through `stage` in the active run."""
+    return current().span(stage)
+
+
+def count(name, value=1, **labels):
+    """Adds to a counter of the active run."""
+    current().count(name, value, **labels)
+
+
+def add_arguments(parser):
+    """Adds the --report, --prometheus and --profile options used by traced_run to an argparse parser."""
+    parser.add_argument("--report", help="Write a JSON report of stage timings and counters to this file")
+    parser.add_argument("--prometheus", help="Write the metrics as a Prometheus text file (textfile collector)")
+    parser.add_argument(
+        "--profile", nargs="?", const="profile.prof", help="Profile the whole run with cProfile (default: profile.prof)"
+    )
+
+
+@contextmanager
+def traced_run(name, report_path=None, prometheus_path=None, profile_path=None, **labels):
+    """Makes a RunMetrics active for the duration of the block, then writes the requested outputs."""
+    global _current
+    run = RunMetrics(name, **labels)
+    _current = run
+    profiler = cProfile.Profile() if profile_path else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield run
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        run.finish()
+        _current = None
+        print(run.summary())
+        if report_path:
+            run.write_json(report_path)
+        if prometheus_path:
+            run.write_prometheus(prometheus_path)
+        if profiler is not None:
+            profiler.dump_stats(profile_path)
+            print(f"cProfile output written to {profile_path}; top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
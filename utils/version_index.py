@@ -0,0 +1,295 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.copy_engine import COPY_WORKERS, copy_file
+from utils.snapshots import TIMESTAMP_FORMAT
+
+# Local index of every file version held in the directory snapshots ("full" and "incremental" modes), so a
+# file can be found as of a date, or all of its versions listed, without walking the backup disk.
+#
+# Versions are stored as ranges: a row (path, first snapshot, last snapshot, size, mtime, hash) covers
+# every snapshot of the source from `first` to `last` in which the file was unchanged. Each backup extends
+# the open ranges of unchanged files, so the index grows with the number of changes, not with
+# files x snapshots. Snapshot ids increase with time, and ranges only ever span snapshots of one source.
+
+# Seconds a write waits for another connection's transaction, e.g. a background prune removing snapshots
+# while a backup indexes its new one, before failing with "database is locked"
+LOCK_TIMEOUT = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY, source TEXT NOT NULL, name TEXT NOT NULL UNIQUE, path TEXT NOT NULL, taken TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_source ON snapshots (source, taken);
+CREATE TABLE IF NOT EXISTS paths (id INTEGER PRIMARY KEY, source TEXT NOT NULL, path TEXT NOT NULL, UNIQUE (source, path));
+CREATE TABLE IF NOT EXISTS versions (
+    path_id INTEGER NOT NULL, first_snapshot INTEGER NOT NULL, last_snapshot INTEGER NOT NULL,
+    size INTEGER, mtime REAL, hash TEXT, PRIMARY KEY (path_id, first_snapshot)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS versions_by_last ON versions (last_snapshot);
+"""
+
+
+def parse_as_of(value):
+    """Parses a --as-of value ("2024-05-01", "2024-05-01 18:00" or a snapshot timestamp) into a timestamp string.
+
+    A date without a time means the end of that day.
+    """
+    try:
+        when = datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        when = datetime.fromisoformat(value)
+        if len(value) <= 10:
+            when = when.replace(hour=23, minute=59, second=59)
+    return when.strftime(TIMESTAMP_FORMAT)
+
+
+class VersionIndex:
+    """
+    SQLite index of file versions across directory snapshots.
+
+    Methods
+    -------
+    add_snapshot(source, name, path, taken, entries):
+        Records a new snapshot of `source` from its [relative_path, size, mtime, digest] entries.
+
+    remove_snapshot(name):
+        Forgets a snapshot, dropping versions no remaining snapshot holds.
+
+    resolve(path):
+        Splits an original file path into (source, relative path).
+
+    versions(path):
+        Returns every recorded version of a file, oldest first.
+
+    restore(path, target, as_of=None, workers=COPY_WORKERS):
+        Restores a file or directory subtree as it was at `as_of` (default: the latest snapshot).
+
+    close():
+        Closes the index.
+    """
+
+    def __init__(self, path):
+        """Opens the index at `path`, creating it if it does not exist."""
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+
+    # -- writing -------------------------------------------------------------------------------------
+
+    def _latest_snapshot(self, source):
+        return self.db.execute(
+            "SELECT id, taken FROM snapshots WHERE source = ? ORDER BY taken DESC LIMIT 1", (source,)
+        ).fetchone()
+
+    def _path_id(self, source, relative_path):
+        self.db.execute("INSERT OR IGNORE INTO paths (source, path) VALUES (?, ?)", (source, relative_path))
+        return self.db.execute(
+            "SELECT id FROM paths WHERE source = ? AND path = ?", (source, relative_path)
+        ).fetchone()[0]
+
+    def add_snapshot(self, source, name, path, taken, entries):
+        """Records a snapshot of `source`.
+
+        Parameters:
+            source (str): The directory that was backed up.
+            name (str): The snapshot name.
+            path (str): Where the snapshot directory lives.
+            taken (str): The snapshot timestamp (TIMESTAMP_FORMAT); it must be newer than any indexed snapshot
+                         of the same source.
+            entries (list): [relative_path, size, mtime, hex digest or None] for every file in the snapshot.
+        """
+        source = source.rstrip("/")
+        previous = self._latest_snapshot(source)
+        if previous is not None and previous[1] >= taken:
+            raise ValueError(f"{name} is not newer than the latest indexed snapshot of {source}")
+
+        with self.db:
+            snapshot_id = self.db.execute(
+                "INSERT INTO snapshots (source, name, path, taken) VALUES (?, ?, ?, ?)", (source, name, path, taken)
+            ).lastrowid
+
+            open_versions = {}
+            if previous is not None:
+                for relative_path, path_id, first, size, mtime, digest in self.db.execute(
+                    "SELECT p.path, v.path_id, v.first_snapshot, v.size, v.mtime, v.hash "
+                    "FROM versions v JOIN paths p ON p.id = v.path_id WHERE v.last_snapshot = ?",
+                    (previous[0],),
+                ):
+                    open_versions[relative_path] = (path_id, first, size, mtime, digest)
+
+            extended = []
+            for relative_path, size, mtime, digest in entries:
+                current = open_versions.get(relative_path)
+                if current is not None:
+                    path_id, first, old_size, old_mtime, old_digest = current
+                    # Compare by content when both sides were hashed, otherwise by size and mtime
+                    if digest and old_digest:
+                        unchanged = size == old_size and digest == old_digest
+                    else:
+                        unchanged = size == old_size and mtime == old_mtime
+                    if unchanged:
+                        extended.append((snapshot_id, path_id, first))
+                        continue
+                path_id = current[0] if current is not None else self._path_id(source, relative_path)
+                self.db.execute(
+                    "INSERT INTO versions (path_id, first_snapshot, last_snapshot, size, mtime, hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (path_id, snapshot_id, snapshot_id, size, mtime, digest),
+                )
+            self.db.executemany(
+                "UPDATE versions SET last_snapshot = ? WHERE path_id = ? AND first_snapshot = ?", extended
+            )
+
+    def remove_snapshot(self, name):
+        """Forgets snapshot `name`, trimming version ranges to the snapshots that still exist."""
+        row = self.db.execute("SELECT id, source FROM snapshots WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        snapshot_id, source = row
+        with self.db:
+            self.db.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id,))
+            affected = self.db.execute(
+                "SELECT v.path_id, v.first_snapshot, v.last_snapshot FROM versions v JOIN paths p ON p.id = v.path_id "
+                "WHERE p.source = ? AND v.first_snapshot <= ? AND v.last_snapshot >= ?",
+                (source, snapshot_id, snapshot_id),
+            ).fetchall()
+            for path_id, first, last in affected:
+                first_live, last_live = self.db.execute(
+                    "SELECT MIN(id), MAX(id) FROM snapshots WHERE source = ? AND id BETWEEN ? AND ?",
+                    (source, first, last),
+                ).fetchone()
+                if first_live is None:
+                    self.db.execute("DELETE FROM versions WHERE path_id = ? AND first_snapshot = ?", (path_id, first))
+                else:
+                    # Ranges of one path never overlap, so the trimmed range cannot collide with another
+                    self.db.execute(
+                        "UPDATE versions SET first_snapshot = ?, last_snapshot = ? "
+                        "WHERE path_id = ? AND first_snapshot = ?",
+                        (first_live, last_live, path_id, first),
+                    )
+
+    # -- reading -------------------------------------------------------------------------------------
+
+    def sources(self):
+        """Returns the indexed source directories."""
+        return [row[0] for row in self.db.execute("SELECT DISTINCT source FROM snapshots ORDER BY source")]
+
+    def resolve(self, path):
+        """Returns (source, relative path) for an original path inside an indexed source.
+
+        Raises:
+            KeyError: If the path is not inside any indexed source.
+        """
+        path = os.path.abspath(os.path.expanduser(path)).rstrip("/")
+        for source in sorted(self.sources(), key=len, reverse=True):
+            if path == source:
+                return source, ""
+            if path.startswith(source + "/"):
+                return source, path[len(source) + 1:]
+        raise KeyError(f"{path} is not inside any indexed backup source")
+
+    def snapshot_as_of(self, source, as_of=None):
+        """Returns (id, name, path, taken) of the newest snapshot of `source` taken at or before `as_of`, or None."""
+        if as_of is None:
+            as_of = "9999"
+        return self.db.execute(
+            "SELECT id, name, path, taken FROM snapshots WHERE source = ? AND taken <= ? ORDER BY taken DESC LIMIT 1",
+            (source, as_of),
+        ).fetchone()
+
+    def versions(self, path):
+        """Returns every recorded version of the file at original path `path`, oldest first.
+
+        Returns:
+            list: Dicts with "size", "mtime", "hash", "first" and "last" (snapshot timestamps), "snapshots"
+                  (how many live snapshots hold it) and "path" (a copy to restore from).
+        """
+        source, relative_path = self.resolve(path)
+        rows = self.db.execute(
+            "SELECT v.size, v.mtime, v.hash, f.taken, l.taken, l.path, "
+            "(SELECT COUNT(*) FROM snapshots s WHERE s.source = ? AND s.id BETWEEN v.first_snapshot AND v.last_snapshot) "
+            "FROM versions v JOIN paths p ON p.id = v.path_id "
+            "JOIN snapshots f ON f.id = v.first_snapshot JOIN snapshots l ON l.id = v.last_snapshot "
+            "WHERE p.source = ? AND p.path = ? ORDER BY v.first_snapshot",
+            (source, source, relative_path),
+        ).fetchall()
+        return [
+            {
+                "size": size,
+                "mtime": mtime,
+                "hash": digest,
+                "first": first,
+                "last": last,
+                "snapshots": count,
+                "path": os.path.join(snapshot_path, relative_path),
+            }
+            for size, mtime, digest, first, last, snapshot_path, count in rows
+        ]
+
+    def files_in_snapshot(self, source, relative_path, snapshot_id):
+        """Returns [(relative_path, size)] for the file or subtree `relative_path` as held by a snapshot."""
+        query = (
+            "SELECT p.path, v.size FROM versions v JOIN paths p ON p.id = v.path_id "
+            "WHERE p.source = ? AND v.first_snapshot <= ? AND v.last_snapshot >= ?"
+        )
+        params = [source, snapshot_id, snapshot_id]
+        if relative_path:
+            # Paths under "a/b" sort between "a/b/" and "a/b0" ("0" follows "/")
+            query += " AND (p.path = ? OR (p.path >= ? AND p.path < ?))"
+            params += [relative_path, relative_path + "/", relative_path + "0"]
+        return self.db.execute(query + " ORDER BY p.path", params).fetchall()
+
+    def restore(self, path, target, as_of=None, workers=COPY_WORKERS):
+        """Restores a file or directory subtree as it was in the newest snapshot taken at or before `as_of`.
+
+        Parameters:
+            path (str): Original path of the file or directory.
+            target (str): Directory to restore into; the item is restored as target/<its name>.
+            as_of (str, optional): Timestamp (TIMESTAMP_FORMAT, see parse_as_of); the latest snapshot if None.
+            workers (int, optional): Number of files copied concurrently.
+
+        Returns:
+            dict: "snapshot", "files", "bytes", "seconds" and "mb_per_sec".
+        """
+        source, relative_path = self.resolve(path)
+        snapshot = self.snapshot_as_of(source, as_of)
+        if snapshot is None:
+            raise FileNotFoundError(f"No snapshot of {source} was taken by {as_of}")
+        snapshot_id, name, snapshot_path, taken = snapshot
+        files = self.files_in_snapshot(source, relative_path, snapshot_id)
+        if not files:
+            raise FileNotFoundError(f"{path} is not in {name}")
+
+        root = os.path.join(target, os.path.basename(relative_path or source))
+        if os.path.exists(root):
+            raise FileExistsError(f"{root} already exists")
+
+        def restore_file(item):
+            file_path, size = item
+            suffix = file_path[len(relative_path):].lstrip("/")
+            destination = os.path.join(root, suffix) if suffix else root
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            copy_file(os.path.join(snapshot_path, file_path), destination)
+            return size
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            restored = list(executor.map(restore_file, files))
+        seconds = time.perf_counter() - started
+        return {
+            "snapshot": name,
+            "files": len(restored),
+            "bytes": sum(restored),
+            "seconds": round(seconds, 3),
+            "mb_per_sec": round(sum(restored) / (1024 * 1024) / seconds, 1) if seconds else 0.0,
+        }
+
+    def close(self):
+        """Closes the index."""
+        self.db.close()